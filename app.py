@@ -4,7 +4,6 @@ import threading
 
 from dotenv import load_dotenv
 load_dotenv() 
-from cloudconvert_service import html_para_pdf
 
 from flask import render_template_string
 from functools import wraps
@@ -18,9 +17,13 @@ from flask import (
     flash,
     session,
     jsonify,
+    g,
+    Response,
+    send_file,
 )
 from werkzeug.utils import secure_filename
 from sqlalchemy import func, desc, or_
+from sqlalchemy.orm import joinedload
 
 from config import Config
 
@@ -37,6 +40,9 @@ from models import (
     imagem_exposicao,
     Notification,
     PreferenciaNotificacao,
+    RecommendationSnapshot,
+    EmailOutbox,
+    PdfJob,
 )
 
 from authlib.integrations.flask_client import OAuth
@@ -46,6 +52,7 @@ from sqlalchemy import inspect
 import traceback
 from flask import make_response
 
+import base64
 import calendar
 from datetime import date
 
@@ -54,8 +61,51 @@ import uuid
 import mimetypes
 
 from moderacao import avaliar_comentario, gerar_sugestao_obra
-from services.recommendation_service import build_recommendations, serialize_image
+from services.recommendation_service import (
+    invalidate_author_features,
+    invalidate_interaction_profile,
+    serialize_image,
+)
+from services.counter_service import (
+    adjust_comments,
+    adjust_likes,
+    adjust_unread_notifications,
+    recount_unread_notifications,
+    reconcile_counters,
+    reconcile_unread_notifications,
+    RECONCILE_INTERVAL,
+)
+from services.recommendation_snapshot_service import (
+    SNAPSHOT_REFRESH_INTERVAL,
+    get_recommendations,
+    mark_snapshot_stale,
+    refresh_stale_snapshots,
+)
+from services.notification_service import (
+    NOTIFICATION_COMPACTION_INTERVAL,
+    compact_notifications,
+    deduplicate_unread_notifications,
+    enqueue_notification,
+    notification_buffer,
+)
+from services.email_outbox_service import email_outbox
+from services.event_hub import SSE_STREAM_TIMEOUT, event_hub
+from services.pdf_cache_service import cached_pdf_path, content_digest, evict_stale_variants
+from services.pdf_job_service import (
+    PDF_CLEANUP_INTERVAL,
+    cleanup_pdf_files,
+    enqueue_pdf_batch_job,
+    enqueue_pdf_job,
+    pdf_jobs,
+    serialize_job,
+)
+from services.pdf_render_service import html_para_pdf
+from services.query_counter import init_query_counter
+from services.scheduler_service import scheduler
+from services.stats_service import GLOBAL_STATS_REFRESH_INTERVAL, global_stats, refresh_global_stats
+from services.similarity_service import similar_images, similarity_index
 from services.email_service import (
+    deliver_email,
     send_welcome_email,
     send_recommendation_email,
     get_or_create_preferences,
@@ -87,6 +137,7 @@ app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "8")) * 1024 *
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 db.init_app(app)
+init_query_counter(app, threshold=int(os.getenv("SQL_QUERY_WARN_THRESHOLD", "30")))
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
@@ -218,6 +269,37 @@ def ensure_google_columns():
 with app.app_context():
     ensure_google_columns()
 
+scheduler.add_job("reconcile_counters", reconcile_counters, RECONCILE_INTERVAL)
+scheduler.add_job("reconcile_unread_notifications", reconcile_unread_notifications, RECONCILE_INTERVAL)
+scheduler.add_job("recommendation_snapshots", refresh_stale_snapshots, SNAPSHOT_REFRESH_INTERVAL)
+scheduler.add_job("global_stats", refresh_global_stats, GLOBAL_STATS_REFRESH_INTERVAL)
+scheduler.add_job("notification_compaction", compact_notifications, NOTIFICATION_COMPACTION_INTERVAL)
+scheduler.add_job("pdf_cleanup", lambda: cleanup_pdf_files(PDF_FOLDER), PDF_CLEANUP_INTERVAL)
+# As threads de fundo só arrancam depois de ensure_tables criar as tabelas que
+# consultam. BACKGROUND_WORKERS=0 desativa-as nos scripts que importam a app
+# (seed, benchmarks, campanha de digests, índice colaborativo). Os processos de
+# conversão de PDF (spawn) reimportam o script principal mas não servem
+# pedidos, por isso também não as arrancam
+BACKGROUND_WORKERS = os.getenv("BACKGROUND_WORKERS", "1") != "0"
+_workers_lock = threading.Lock()
+_workers_started = False
+
+
+def start_background_workers():
+    """Arranca as threads de fundo uma única vez por processo."""
+    global _workers_started
+    if not BACKGROUND_WORKERS or _workers_started:
+        return
+    with _workers_lock:
+        if _workers_started:
+            return
+        _workers_started = True
+        scheduler.start(app)
+        notification_buffer.start(app)
+        email_outbox.start(app, deliver_email)
+        pdf_jobs.start(app, html_para_pdf)
+        similarity_index.start(app)
+
 oauth = OAuth(app)
 
 google = oauth.register(
@@ -245,17 +327,38 @@ def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def current_user():
-    uid = session.get("user_id")
-    if uid:
-        return db.session.get(Utilizador, uid)
-    return None
+    # Memoizado em flask.g: é chamado pelos decoradores, pelo context processor,
+    # por adicionar_notificacao e por is_admin no mesmo pedido
+    if "current_user" not in g:
+        uid = session.get("user_id")
+        g.current_user = db.session.get(Utilizador, uid) if uid else None
+    return g.current_user
+
+def forget_current_user():
+    # Chamar sempre que session["user_id"] muda a meio do pedido (login/logout)
+    g.pop("current_user", None)
+    g.pop("is_admin", None)
 
 def is_admin(user=None) -> bool:
-    user = user or current_user()
-    if not user or not ADMIN_EMAILS:
+    if user is None:
+        if "is_admin" not in g:
+            g.is_admin = is_admin(current_user()) if current_user() else False
+        return g.is_admin
+    if not ADMIN_EMAILS:
         return False
     return (user.email or "").strip().lower() in ADMIN_EMAILS
 
+def notifications_paused_until(user):
+    """Fim da pausa de notificações ativa do utilizador (ou None), memoizado por pedido."""
+    paused = g.setdefault("notifications_paused_until", {})
+    if user.id not in paused:
+        until = user.notifications_paused_until
+        paused[user.id] = until if until and datetime.utcnow() < until else None
+    return paused[user.id]
+
+def forget_notifications_pause(user):
+    g.get("notifications_paused_until", {}).pop(user.id, None)
+
 def admin_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -303,65 +406,25 @@ def api_login_required(f):
 
 
 def adicionar_notificacao(id_utilizador_destino, tipo, id_imagem, titulo_imagem):
+    """
+    Cria ou agrega a notificação de interação. Não faz commit: deve ser chamada
+    antes do commit da reação/comentário, na mesma transação (com o buffer de
+    notificações ativo, a escrita só acontece depois desse commit).
+    """
     # Não notifica se o utilizador estiver a interagir com o seu próprio post
     usuario_atual = current_user()
     if usuario_atual and usuario_atual.id == id_utilizador_destino:
         return
 
-    # 1. Obter o utilizador destinatário da notificação
-    destinatario = db.session.get(Utilizador, id_utilizador_destino)
-    if not destinatario:
-        return
-    
-    # 2. Verificar se o utilizador pausou as notificações e se a pausa ainda está ativa
-    if destinatario.notifications_paused_until:
-        if datetime.utcnow() < destinatario.notifications_paused_until:
-            app.logger.info("Notificação ignorada devido a pausa ativa.")
-            return
-
-    # 3. Verificar se já existe uma notificação não lida deste tipo para este post
-    notif_existente = Notification.query.filter_by(
-        id_utilizador=id_utilizador_destino,
-        type=tipo,
-        id_imagem=id_imagem,
-        is_read=False
-    ).first()
+    # Destinatário inexistente ou com pausa ativa é filtrado na própria instrução
+    enqueue_notification(id_utilizador_destino, tipo, id_imagem, titulo_imagem)
 
-    if notif_existente:
-        # Incrementa a contagem e atualiza a mensagem
-        notif_existente.count += 1
-        if tipo == "like":
-            notif_existente.message = f"A sua imagem '{titulo_imagem}' recebeu {notif_existente.count} novos likes."
-        elif tipo == "comentario":
-            notif_existente.message = f"A sua imagem '{titulo_imagem}' recebeu {notif_existente.count} novos comentários."
-        
-        notif_existente.created_at = datetime.utcnow()  # Atualiza a data para subir na lista
-        db.session.add(notif_existente)
-    else:
-        # Cria uma nova notificação
-        if tipo == "like":
-            msg = f"A sua imagem '{titulo_imagem}' recebeu um novo like."
-        elif tipo == "comentario":
-            msg = f"A sua imagem '{titulo_imagem}' recebeu um novo comentário."
-        else:
-            msg = f"Nova interação na sua imagem '{titulo_imagem}'."
-
-        nova_notif = Notification(
-            id_utilizador=id_utilizador_destino,
-            type=tipo,
-            id_imagem=id_imagem,
-            message=msg,
-            count=1,
-            is_read=False,
-            created_at=datetime.utcnow()
-        )
-        db.session.add(nova_notif)
 
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        app.logger.exception("Erro ao adicionar notificação: %s", e)
+def publicar_likes(imagem_id):
+    """Lê a contagem de likes já com o commit feito e envia-a a quem está a ver a imagem."""
+    likes = db.session.query(Imagem.likes_count).filter(Imagem.id == imagem_id).scalar() or 0
+    event_hub.publish(f"imagem:{imagem_id}", "likes", {"imagem_id": imagem_id, "likes": likes})
+    return likes
 
 _tables_lock = threading.Lock()
 
@@ -369,28 +432,39 @@ raw_admins = os.getenv("ADMIN_EMAIL", "")
 ADMIN_EMAILS = [e.strip().lower() for e in raw_admins.split(",") if e.strip()]
 ADMIN_EMAIL = ADMIN_EMAILS[0] if ADMIN_EMAILS else None
 
+NOTIFICATION_DROPDOWN_LIMIT = int(os.getenv("NOTIFICATION_DROPDOWN_LIMIT", "15"))
+NOTIFICATION_PAGE_SIZE = 20
+NOTIFICATION_BULK_LIMIT = 500
+
 @app.context_processor
 def inject_user():
     user = current_user()
-    unread_notifs = []
-    all_notifs = []
+    unread_count = 0
+    recent_notifs = []
     is_paused = False
     paused_until_str = ""
     
     if user:
-        all_notifs = Notification.query.filter_by(id_utilizador=user.id).order_by(Notification.created_at.desc()).all()
-        unread_notifs = [n for n in all_notifs if not n.is_read]
+        # Só as N mais recentes (índice UserID, CreatedAt); o total por ler vem do contador
+        recent_notifs = (
+            Notification.query.filter_by(id_utilizador=user.id)
+            .order_by(Notification.created_at.desc())
+            .limit(NOTIFICATION_DROPDOWN_LIMIT)
+            .all()
+        )
+        unread_count = max(user.unread_notifications or 0, 0)
         
-        if user.notifications_paused_until and datetime.utcnow() < user.notifications_paused_until:
+        paused_until = notifications_paused_until(user)
+        if paused_until:
             is_paused = True
-            paused_until_str = user.notifications_paused_until.strftime("%H:%M")
+            paused_until_str = paused_until.strftime("%H:%M")
 
     return {
         "current_user": user,
         "ADMIN_EMAILS": ADMIN_EMAILS,
         "ADMIN_EMAIL": ADMIN_EMAIL,
-        "notifications": all_notifs,
-        "unread_notifications": unread_notifs,
+        "notifications": recent_notifs,
+        "unread_notifications_count": unread_count,
         "notifications_paused": is_paused,
         "notifications_paused_until_str": paused_until_str
     }
@@ -433,6 +507,39 @@ def ensure_tables():
                             conn.execute(text("ALTER TABLE utilizador ADD COLUMN notificationspauseduntil TIMESTAMP NULL"))
                     except Exception as e:
                         app.logger.error("Erro ao adicionar coluna notificationspauseduntil: %s", e)
+                if not any(c.lower() == "unread_notifications" for c in columns):
+                    app.logger.info("Adicionando coluna 'Unread_Notifications' à tabela 'utilizador'...")
+                    try:
+                        with db.engine.begin() as conn:
+                            conn.execute(text('ALTER TABLE utilizador ADD COLUMN "Unread_Notifications" INTEGER NOT NULL DEFAULT 0'))
+                        reconcile_unread_notifications()
+                    except Exception as e:
+                        db.session.rollback()
+                        app.logger.error("Erro ao adicionar coluna Unread_Notifications: %s", e)
+
+            # Garantir que a tabela 'recommendation_snapshot' existe
+            if not inspector.has_table("recommendation_snapshot"):
+                app.logger.info("Criando tabela 'recommendation_snapshot'...")
+                try:
+                    RecommendationSnapshot.__table__.create(db.engine)
+                except Exception as e:
+                    app.logger.error("Erro ao criar tabela recommendation_snapshot: %s", e)
+
+            # Garantir que a tabela 'email_outbox' existe
+            if not inspector.has_table("email_outbox"):
+                app.logger.info("Criando tabela 'email_outbox'...")
+                try:
+                    EmailOutbox.__table__.create(db.engine)
+                except Exception as e:
+                    app.logger.error("Erro ao criar tabela email_outbox: %s", e)
+
+            # Garantir que a tabela 'pdf_job' existe
+            if not inspector.has_table("pdf_job"):
+                app.logger.info("Criando tabela 'pdf_job'...")
+                try:
+                    PdfJob.__table__.create(db.engine)
+                except Exception as e:
+                    app.logger.error("Erro ao criar tabela pdf_job: %s", e)
 
             # Garantir que a tabela 'localizacao' existe
             if not inspector.has_table("localizacao"):
@@ -456,12 +563,170 @@ def ensure_tables():
                     except Exception as e:
                         app.logger.error("Erro ao adicionar coluna ID_Location: %s", e)
 
+            # Garantir que os contadores desnormalizados existem na tabela 'imagem'
+            if inspector.has_table("imagem"):
+                columns = [col["name"].lower() for col in inspector.get_columns("imagem")]
+                missing = [c for c in ("Likes_Count", "Comments_Count") if c.lower() not in columns]
+                if missing:
+                    app.logger.info("Adicionando contadores %s à tabela 'imagem'...", ", ".join(missing))
+                    try:
+                        with db.engine.begin() as conn:
+                            for coluna in missing:
+                                conn.execute(text(f'ALTER TABLE imagem ADD COLUMN "{coluna}" INTEGER NOT NULL DEFAULT 0'))
+                        reconcile_counters()
+                    except Exception as e:
+                        db.session.rollback()
+                        app.logger.error("Erro ao adicionar contadores à tabela imagem: %s", e)
+
+            # O índice único parcial das notificações por ler exige que não haja duplicados
+            if inspector.has_table("notification") and "ux_notification_unread" not in {
+                index["name"] for index in inspector.get_indexes("notification")
+            }:
+                try:
+                    merged = deduplicate_unread_notifications()
+                    db.session.commit()
+                    if merged:
+                        app.logger.info("Notificações por ler duplicadas marcadas como lidas: %d", merged)
+                        reconcile_unread_notifications()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error("Erro ao agregar notificações duplicadas: %s", e)
+
+            # Garantir que os índices declarados nos modelos existem
+            for table in (Imagem.__table__, Notification.__table__):
+                for index in table.indexes:
+                    try:
+                        index.create(db.engine, checkfirst=True)
+                    except Exception as e:
+                        app.logger.error("Erro ao criar índice %s: %s", index.name, e)
+
             default = ["Todos", "Fotos", "Desenhos", "Outro"]
             for nome in default:
                 if not Categoria.query.filter_by(nome=nome).first():
                     db.session.add(Categoria(nome=nome))
             db.session.commit()
         app.config["TABLES_INITIALIZED"] = True
+    start_background_workers()
+
+
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", "24"))
+
+
+# ordenar -> (atributo da chave, ascendente, conversor do valor do cursor)
+FEED_ORDERINGS = {
+    "mais_recentes": ("data_upload", False, datetime.fromisoformat),
+    "mais_antigas": ("data_upload", True, datetime.fromisoformat),
+    "mais_curtidas": ("likes_count", False, int),
+    "menos_curtidas": ("likes_count", True, int),
+}
+
+
+def _encode_feed_cursor(img, ordenar):
+    # O cursor identifica a última obra devolvida: (chave de ordenação, id)
+    attr = FEED_ORDERINGS[ordenar][0]
+    value = getattr(img, attr)
+    if value is None:
+        value = ""
+    raw = f"{value.isoformat() if isinstance(value, datetime) else value}|{img.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_feed_cursor(value, ordenar):
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        key_str, id_str = raw.split("|", 1)
+        # Chave vazia: a última obra devolvida já era do bloco sem chave (NULL)
+        return (FEED_ORDERINGS[ordenar][2](key_str) if key_str else None), int(id_str)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _feed_base_query(q, categoria_id, exposicao_obj):
+    base_q = Imagem.query.filter(Imagem.publica == True)
+
+    if exposicao_obj:
+        if exposicao_obj.start_date:
+            base_q = base_q.filter(Imagem.data_upload >= datetime.combine(exposicao_obj.start_date, datetime.min.time()))
+        if exposicao_obj.end_date:
+            base_q = base_q.filter(Imagem.data_upload <= datetime.combine(exposicao_obj.end_date, datetime.max.time()))
+        if getattr(exposicao_obj, "categoria_id", None):
+            base_q = base_q.filter(Imagem.id_categoria == exposicao_obj.categoria_id)
+        if getattr(exposicao_obj, "usar_tags", False) and getattr(exposicao_obj, "tags_filtro", None):
+            tags = [t.strip() for t in (exposicao_obj.tags_filtro or "").split(",") if t.strip()]
+            if tags:
+                base_q = base_q.filter(or_(*[Imagem.tags.ilike(f"%{t}%") for t in tags]))
+
+    if categoria_id and not exposicao_obj:
+        base_q = base_q.filter_by(id_categoria=categoria_id)
+
+    if q:
+        like = f"%{q}%"
+        base_q = base_q.filter(
+            (Imagem.titulo.ilike(like)) |
+            (Imagem.categoria_texto.ilike(like)) |
+            (Imagem.tags.ilike(like))
+        )
+    return base_q
+
+
+def _feed_page(base_q, ordenar, cursor=None, limit=FEED_PAGE_SIZE):
+    """
+    Devolve uma página do feed ordenada por (chave, id) e o cursor da página
+    seguinte. A chave é data_upload ou likes_count conforme `ordenar`. O custo
+    é o mesmo em qualquer ponto do catálogo, ao contrário de OFFSET, porque os
+    índices ix_imagem_feed / ix_imagem_likes são percorridos a partir do cursor.
+    Obras com a chave a NULL (p. ex. sem data_upload) aparecem no fim, por id, em
+    qualquer ordenação.
+    """
+    attr, ascending, _ = FEED_ORDERINGS[ordenar]
+    key = getattr(Imagem, attr)
+    key_cursor, id_cursor = cursor or (None, None)
+    options = (joinedload(Imagem.autor), joinedload(Imagem.localizacao))
+
+    rows = []
+    if cursor is None or key_cursor is not None:
+        query = base_q.filter(key.isnot(None))
+        if cursor:
+            if ascending:
+                query = query.filter(or_(key > key_cursor, (key == key_cursor) & (Imagem.id > id_cursor)))
+            else:
+                query = query.filter(or_(key < key_cursor, (key == key_cursor) & (Imagem.id < id_cursor)))
+        if ascending:
+            query = query.order_by(key.asc(), Imagem.id.asc())
+        else:
+            query = query.order_by(key.desc(), Imagem.id.desc())
+        rows = query.options(*options).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        null_query = base_q.filter(key.is_(None))
+        if cursor and key_cursor is None:
+            null_query = null_query.filter(Imagem.id > id_cursor if ascending else Imagem.id < id_cursor)
+        null_query = null_query.order_by(Imagem.id.asc() if ascending else Imagem.id.desc())
+        rows += null_query.options(*options).limit(limit + 1 - len(rows)).all()
+
+    next_cursor = _encode_feed_cursor(rows[limit - 1], ordenar) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _serialize_feed_image(image):
+    return {
+        "id": image.id,
+        "titulo": image.titulo,
+        "url": image.caminho_armazenamento,
+        "categoria": image.categoria_texto,
+        "autor": {
+            "id": image.id_utilizador,
+            "nome": image.autor.nome if image.autor else None,
+            "foto_url": image.autor.foto_url if image.autor else None,
+        },
+        "cidade": (
+            image.localizacao.city or image.localizacao.address.split(",")[0]
+            if image.localizacao else None
+        ),
+        "data_upload": image.data_upload.isoformat() if image.data_upload else None,
+    }
 
 
 @app.route("/")
@@ -471,6 +736,7 @@ def index():
     categoria_id = request.args.get("categoria", type=int)
     exposicao_id = request.args.get("exposicao", type=int)
     ordenar = request.args.get("ordenar", "mais_recentes", type=str)
+    cursor = request.args.get("cursor", "", type=str).strip()
 
     categorias = Categoria.query.order_by(Categoria.nome).all()
     user = current_user()
@@ -481,66 +747,18 @@ def index():
 
     recomendacoes = []
     recommendation_reasons = {}
-    if not q and not categoria_id and not exposicao_id:
-        recommendation_payload = build_recommendations(user, limit=12)
+    if not q and not categoria_id and not exposicao_id and not cursor:
+        recommendation_payload = get_recommendations(user, limit=12)
         recomendacoes = recommendation_payload["images"]
         recommendation_reasons = recommendation_payload["reasons"]
 
-    
-    base_q = Imagem.query.filter(Imagem.publica == True)
-
-    exposicao_obj = None
-    if exposicao_id:
-        exposicao_obj = db.session.get(Exposicao, exposicao_id)
-        if exposicao_obj:
-            if exposicao_obj.start_date:
-                base_q = base_q.filter(Imagem.data_upload >= datetime.combine(exposicao_obj.start_date, datetime.min.time()))
-            if exposicao_obj.end_date:
-                base_q = base_q.filter(Imagem.data_upload <= datetime.combine(exposicao_obj.end_date, datetime.max.time()))
-            if getattr(exposicao_obj, "categoria_id", None):
-                base_q = base_q.filter(Imagem.id_categoria == exposicao_obj.categoria_id)
-            if getattr(exposicao_obj, "usar_tags", False) and getattr(exposicao_obj, "tags_filtro", None):
-                tags = [t.strip() for t in (exposicao_obj.tags_filtro or "").split(",") if t.strip()]
-                if tags:
-                    base_q = base_q.filter(or_(*[Imagem.tags.ilike(f"%{t}%") for t in tags]))
-
-    
-    if categoria_id and not exposicao_id:
-        base_q = base_q.filter_by(id_categoria=categoria_id)
+    exposicao_obj = db.session.get(Exposicao, exposicao_id) if exposicao_id else None
+    base_q = _feed_base_query(q, categoria_id, exposicao_obj)
 
     
-    if q:
-        like = f"%{q}%"
-        base_q = base_q.filter(
-            (Imagem.titulo.ilike(like)) |
-            (Imagem.categoria_texto.ilike(like)) |
-            (Imagem.tags.ilike(like))
-        )
-
-    
-    imagens = []
-    ordenar = ordenar or "mais_recentes"
-    if ordenar in ("mais_curtidas", "menos_curtidas"):
-        ids = [r.id for r in base_q.with_entities(Imagem.id).all()]
-        if ids:
-            likes_count = func.count(Reacao.id)
-            rows = (
-                db.session.query(Imagem, func.count(Reacao.id).label("likes"))
-                .outerjoin(Reacao, (Reacao.id_imagem == Imagem.id) & (Reacao.tipo == "like"))
-                .filter(Imagem.id.in_(ids))
-                .group_by(Imagem.id)
-                .order_by(likes_count.desc() if ordenar == "mais_curtidas" else likes_count.asc())
-                .all()
-            )
-            
-            imagens = [r[0] for r in rows]
-        else:
-            imagens = []
-    else:
-        if ordenar == "mais_antigas":
-            imagens = base_q.order_by(Imagem.data_upload.asc()).all()
-        else:  
-            imagens = base_q.order_by(Imagem.data_upload.desc()).all()
+    if ordenar not in FEED_ORDERINGS:
+        ordenar = "mais_recentes"
+    imagens, next_cursor = _feed_page(base_q, ordenar, _decode_feed_cursor(cursor, ordenar))
 
     is_search = bool(q)
     is_categoria = bool(categoria_id and not exposicao_id)
@@ -561,9 +779,36 @@ def index():
         recommendation_reasons=recommendation_reasons,
         exposicao_ativa=exposicao_ativa,
         countdown_days=countdown_days,
+        cursor=cursor,
+        next_cursor=next_cursor,
     )
 
 
+@app.route("/api/feed")
+def api_feed():
+    q = request.args.get("q", "", type=str).strip()
+    categoria_id = request.args.get("categoria", type=int)
+    exposicao_id = request.args.get("exposicao", type=int)
+    ordenar = request.args.get("ordenar", "mais_recentes", type=str)
+    per = min(max(request.args.get("per", FEED_PAGE_SIZE, type=int), 1), 100)
+    cursor_raw = request.args.get("cursor", "", type=str).strip()
+
+    if ordenar not in FEED_ORDERINGS:
+        return jsonify({"error": "Ordenação inválida."}), 400
+    cursor = _decode_feed_cursor(cursor_raw, ordenar)
+    if cursor_raw and not cursor:
+        return jsonify({"error": "Cursor inválido."}), 400
+
+    exposicao_obj = db.session.get(Exposicao, exposicao_id) if exposicao_id else None
+    base_q = _feed_base_query(q, categoria_id, exposicao_obj)
+    imagens, next_cursor = _feed_page(base_q, ordenar, cursor, limit=per)
+
+    return jsonify({
+        "imagens": [_serialize_feed_image(image) for image in imagens],
+        "next_cursor": next_cursor,
+    })
+
+
 
 
 
@@ -581,7 +826,7 @@ def imagem_detalhe(imagem_id: int):
         .all()
     )
 
-    likes = Reacao.query.filter_by(id_imagem=imagem_id, tipo="like").count()
+    likes = img.likes_count
 
     user = current_user()
     user_liked = False
@@ -593,6 +838,8 @@ def imagem_detalhe(imagem_id: int):
 
     pending_text = session.pop("pending_comment_text", "") if session.get("pending_comment_text") else ""
 
+    obras_semelhantes = [obra for obra, _ in similar_images(img)]
+
     return render_template(
         "imagem.html",
         imagem=img,
@@ -600,7 +847,8 @@ def imagem_detalhe(imagem_id: int):
         comentarios=comentarios_tuplas,
         likes=likes,
         user_liked=user_liked,
-        pending_text=pending_text
+        pending_text=pending_text,
+        obras_semelhantes=obras_semelhantes
     )
 
 
@@ -702,6 +950,8 @@ def publicar():
 
             db.session.add(img)
             db.session.commit()
+            similarity_index.add_image(img)
+            invalidate_author_features()
 
         except Exception as e:
             db.session.rollback()
@@ -744,6 +994,16 @@ def publicar():
         selected_categoria=None,
     )
 
+def _unread_notification_owners(imagem_id):
+    # Destinatários com notificações por ler da imagem (o contador tem de ser recalculado)
+    return [
+        row.id_utilizador
+        for row in Notification.query.with_entities(Notification.id_utilizador)
+        .filter_by(id_imagem=imagem_id, is_read=False)
+        .distinct()
+        .all()
+    ]
+
 @app.route("/apagar_imagem/<int:imagem_id>", methods=["POST"])
 @login_required
 def apagar_imagem(imagem_id: int):
@@ -767,7 +1027,9 @@ def apagar_imagem(imagem_id: int):
         ).delete(synchronize_session=False)
     Comentario.query.filter_by(id_imagem=imagem_id).delete()
     Reacao.query.filter_by(id_imagem=imagem_id).delete()
+    unread_owners = _unread_notification_owners(imagem_id)
     Notification.query.filter_by(id_imagem=imagem_id).delete()
+    recount_unread_notifications(unread_owners)
     
 
     img.exposicoes = []
@@ -786,6 +1048,8 @@ def apagar_imagem(imagem_id: int):
 
     db.session.delete(img)
     db.session.commit()
+    similarity_index.remove_image(imagem_id)
+    invalidate_author_features()
 
 
     try:
@@ -838,7 +1102,14 @@ def comentario():
             motivo=moderation.get("motivo"),
         )
     )
+    if moderation["decision"] == "aprovado":
+        adjust_comments(imagem_id, 1)
+        img = db.session.get(Imagem, imagem_id)
+        if img:
+            adicionar_notificacao(img.id_utilizador, "comentario", imagem_id, img.titulo)
     db.session.commit()
+    invalidate_interaction_profile(c.id_utilizador)
+    mark_snapshot_stale(c.id_utilizador)
 
     if moderation["decision"] == "bloqueado":
         flash("Comentário bloqueado automaticamente por conter conteúdo inadequado.", "error")
@@ -848,12 +1119,6 @@ def comentario():
         flash("Comentário enviado para revisão automática de segurança.", "success")
         return redirect(url_for("imagem_detalhe", imagem_id=imagem_id))
 
-
-    if moderation["decision"] == "aprovado":
-        img = db.session.get(Imagem, imagem_id)
-        if img:
-            adicionar_notificacao(img.id_utilizador, "comentario", imagem_id, img.titulo)
-
     return redirect(url_for("imagem_detalhe", imagem_id=imagem_id))
 
 
@@ -876,8 +1141,12 @@ def apagar_comentario():
         return redirect(url_for("imagem_detalhe", imagem_id=imagem_id or c.id_imagem))
 
     ResultadoModeracao.query.filter_by(id_comentario=c.id).delete()
+    if c.estado_moderacao == "aprovado":
+        adjust_comments(c.id_imagem, -1)
     db.session.delete(c)
     db.session.commit()
+    invalidate_interaction_profile(c.id_utilizador)
+    mark_snapshot_stale(c.id_utilizador)
     flash("Comentário apagado.", "success")
     return redirect(url_for("imagem_detalhe", imagem_id=imagem_id or c.id_imagem))
 
@@ -902,16 +1171,26 @@ def reacao():
 
     if existente:
         db.session.delete(existente)
+        if tipo == "like":
+            adjust_likes(imagem_id, -1)
         db.session.commit()
+        invalidate_interaction_profile(user.id)
+        mark_snapshot_stale(user.id)
     else:
         nova = Reacao(tipo=tipo, id_imagem=imagem_id, id_utilizador=user.id)
         db.session.add(nova)
+        if tipo == "like":
+            adjust_likes(imagem_id, 1)
+            # Notificação de like na mesma transação da reação
+            img = db.session.get(Imagem, imagem_id)
+            if img:
+                adicionar_notificacao(img.id_utilizador, "like", imagem_id, img.titulo)
         db.session.commit()
-        # Disparar notificação de like
-        img = db.session.get(Imagem, imagem_id)
-        if img and tipo == "like":
-            adicionar_notificacao(img.id_utilizador, "like", imagem_id, img.titulo)
+        invalidate_interaction_profile(user.id)
+        mark_snapshot_stale(user.id)
 
+    if tipo == "like":
+        publicar_likes(imagem_id)
     return redirect(url_for("imagem_detalhe", imagem_id=imagem_id))
 
 
@@ -941,23 +1220,34 @@ def reacao_toggle():
 
     if existente:
         db.session.delete(existente)
+        if tipo == "like":
+            adjust_likes(imagem_id, -1)
         db.session.commit()
+        invalidate_interaction_profile(user.id)
+        mark_snapshot_stale(user.id)
         status = "unliked"
     else:
         nova = Reacao(tipo=tipo, id_imagem=imagem_id, id_utilizador=user.id)
         db.session.add(nova)
         try:
+            if tipo == "like":
+                adjust_likes(imagem_id, 1)
+                # Notificação de like na mesma transação da reação
+                img = db.session.get(Imagem, imagem_id)
+                if img:
+                    adicionar_notificacao(img.id_utilizador, "like", imagem_id, img.titulo)
             db.session.commit()
+            invalidate_interaction_profile(user.id)
+            mark_snapshot_stale(user.id)
             status = "liked"
-            # Disparar notificação de like
-            img = db.session.get(Imagem, imagem_id)
-            if img and tipo == "like":
-                adicionar_notificacao(img.id_utilizador, "like", imagem_id, img.titulo)
         except Exception:
             db.session.rollback()
             return jsonify({"error": "db error"}), 500
 
-    likes = Reacao.query.filter_by(id_imagem=imagem_id, tipo="like").count()
+    if tipo == "like":
+        likes = publicar_likes(imagem_id)
+    else:
+        likes = db.session.query(Imagem.likes_count).filter(Imagem.id == imagem_id).scalar() or 0
 
     return jsonify({"status": status, "likes": likes})
 
@@ -989,18 +1279,12 @@ def exposicao():
         else:
             q = q.filter((manual_cond) | cond_intervalo)
 
-        ids = [row.id for row in q.with_entities(Imagem.id).all()]
-        top = []
-        if ids:
-            top = (
-                db.session.query(Imagem, func.count(Reacao.id).label("likes"))
-                .outerjoin(Reacao, (Reacao.id_imagem == Imagem.id) & (Reacao.tipo == "like"))
-                .filter(Imagem.id.in_(ids))
-                .group_by(Imagem.id)
-                .order_by(desc("likes"))
-                .limit(10)
-                .all()
-            )
+        top = (
+            q.add_columns(Imagem.likes_count)
+            .order_by(Imagem.likes_count.desc(), Imagem.id.desc())
+            .limit(10)
+            .all()
+        )
 
         return render_template("exposição.html", exposicao=e, top=top)
     else:
@@ -1043,6 +1327,7 @@ def admin():
                     Imagem.query.filter_by(id_categoria=c.id).update({"id_categoria": None, "categoria_texto": None})
                     db.session.delete(c)
                     db.session.commit()
+                    invalidate_author_features()
                     flash("Categoria apagada.", "success")
                 else:
                     flash("Categoria não encontrada.", "error")
@@ -1137,7 +1422,7 @@ def admin():
 @login_required
 def recommendations_page():
     user = current_user()
-    payload = build_recommendations(user, limit=24)
+    payload = get_recommendations(user, limit=24)
     categorias = Categoria.query.order_by(Categoria.nome).all()
     return render_template(
         "recommendations.html",
@@ -1151,7 +1436,7 @@ def recommendations_page():
 @app.route("/api/recommendations")
 def api_recommendations():
     user = current_user()
-    payload = build_recommendations(user, limit=request.args.get("limit", 12, type=int))
+    payload = get_recommendations(user, limit=request.args.get("limit", 12, type=int))
     return jsonify({
         "images": [
             serialize_image(image, payload["reasons"].get(image.id))
@@ -1183,6 +1468,11 @@ def admin_moderation():
             flash("Pedido de moderação inválido.", "error")
             return redirect(url_for("admin_moderation"))
 
+        if comentario_obj.estado_moderacao != action:
+            if action == "aprovado":
+                adjust_comments(comentario_obj.id_imagem, 1)
+            elif comentario_obj.estado_moderacao == "aprovado":
+                adjust_comments(comentario_obj.id_imagem, -1)
         comentario_obj.estado_moderacao = action
         resultado = ResultadoModeracao.query.filter_by(id_comentario=comentario_obj.id).first()
         if resultado:
@@ -1197,12 +1487,11 @@ def admin_moderation():
                     model_name="admin-review",
                 )
             )
-        db.session.commit()
-
         if action == "aprovado":
             img = db.session.get(Imagem, comentario_obj.id_imagem)
             if img:
                 adicionar_notificacao(img.id_utilizador, "comentario", img.id, img.titulo)
+        db.session.commit()
 
         flash("Comentário atualizado.", "success")
         return redirect(url_for("admin_moderation", estado=request.args.get("estado", "pendente")))
@@ -1331,21 +1620,11 @@ def api_search():
 
     total = query.count()
     if ordenar in {"mais_curtidas", "menos_curtidas"}:
-        ids = [row.id for row in query.with_entities(Imagem.id).all()]
-        if ids:
-            likes_count = func.count(Reacao.id)
-            rows = (
-                db.session.query(Imagem)
-                .outerjoin(Reacao, (Reacao.id_imagem == Imagem.id) & (Reacao.tipo == "like"))
-                .filter(Imagem.id.in_(ids))
-                .group_by(Imagem.id)
-                .order_by(likes_count.desc() if ordenar == "mais_curtidas" else likes_count.asc())
-                .offset((page - 1) * per)
-                .limit(per)
-                .all()
-            )
-        else:
-            rows = []
+        query = query.order_by(
+            Imagem.likes_count.desc() if ordenar == "mais_curtidas" else Imagem.likes_count.asc(),
+            Imagem.id.desc() if ordenar == "mais_curtidas" else Imagem.id.asc(),
+        )
+        rows = query.offset((page - 1) * per).limit(per).all()
     else:
         query = query.order_by(Imagem.data_upload.asc() if ordenar == "mais_antigas" else Imagem.data_upload.desc())
         rows = query.offset((page - 1) * per).limit(per).all()
@@ -1431,6 +1710,30 @@ def api_status():
 
 
 
+def _exposicao_imagens_query(exposicao):
+    """Obras de uma exposição: as associadas manualmente e as que cumprem os filtros no intervalo de datas."""
+    q = Imagem.query
+
+    manual_cond = Imagem.exposicoes.any(Exposicao.id == exposicao.id)
+
+    cond_intervalo = True
+    if exposicao.start_date and exposicao.end_date:
+        cond_intervalo = (Imagem.data_upload >= datetime.combine(exposicao.start_date, datetime.min.time())) & (Imagem.data_upload <= datetime.combine(exposicao.end_date, datetime.max.time()))
+
+    if getattr(exposicao, "usar_categorias", False) and getattr(exposicao, "categoria_id", None):
+        q = q.filter((manual_cond) | ((Imagem.id_categoria == exposicao.categoria_id) & cond_intervalo))
+    elif getattr(exposicao, "usar_tags", False) and getattr(exposicao, "tags_filtro", None):
+        tags = [t.strip() for t in (exposicao.tags_filtro or "").split(",") if t.strip()]
+        if tags:
+            tag_cond = or_(*[Imagem.tags.ilike(f"%{t}%") for t in tags])
+            q = q.filter((manual_cond) | (tag_cond & cond_intervalo))
+        else:
+            q = q.filter((manual_cond) | cond_intervalo)
+    else:
+        q = q.filter((manual_cond) | cond_intervalo)
+    return q
+
+
 @app.route("/exportar_exposicao", methods=["GET", "POST"])
 def exportar_exposicao():
     exposicoes = Exposicao.query.order_by(Exposicao.id.desc()).all()
@@ -1445,66 +1748,68 @@ def exportar_exposicao():
             exposicao_selecionada = db.session.get(Exposicao, exposicao_id)
             if exposicao_selecionada:
                 
-                q = Imagem.query
-                
-                manual_cond = Imagem.exposicoes.any(Exposicao.id == exposicao_selecionada.id)
-
-                cond_intervalo = True
-                if exposicao_selecionada.start_date and exposicao_selecionada.end_date:
-                    cond_intervalo = (Imagem.data_upload >= datetime.combine(exposicao_selecionada.start_date, datetime.min.time())) & (Imagem.data_upload <= datetime.combine(exposicao_selecionada.end_date, datetime.max.time()))
-
-                if getattr(exposicao_selecionada, "usar_categorias", False) and getattr(exposicao_selecionada, "categoria_id", None):
-                    q = q.filter((manual_cond) | ((Imagem.id_categoria == exposicao_selecionada.categoria_id) & cond_intervalo))
-                elif getattr(exposicao_selecionada, "usar_tags", False) and getattr(exposicao_selecionada, "tags_filtro", None):
-                    tags = [t.strip() for t in (exposicao_selecionada.tags_filtro or "").split(",") if t.strip()]
-                    if tags:
-                        tag_cond = or_(*[Imagem.tags.ilike(f"%{t}%") for t in tags])
-                        q = q.filter((manual_cond) | (tag_cond & cond_intervalo))
-                    else:
-                        q = q.filter((manual_cond) | cond_intervalo)
-                else:
-                    q = q.filter((manual_cond) | cond_intervalo)
-
-                ids = [r.id for r in q.with_entities(Imagem.id).all()]
-                if ids:
-                    top = (
-                        db.session.query(Imagem, func.count(Reacao.id).label("likes"))
-                        .outerjoin(Reacao, (Reacao.id_imagem == Imagem.id) & (Reacao.tipo == "like"))
-                        .filter(Imagem.id.in_(ids))
-                        .group_by(Imagem.id)
-                        .order_by(desc("likes"))
-                        .limit(10)
-                        .all()
-                    )
+                q = _exposicao_imagens_query(exposicao_selecionada)
+
+                top = (
+                    q.add_columns(Imagem.likes_count)
+                    .order_by(Imagem.likes_count.desc(), Imagem.id.desc())
+                    .limit(10)
+                    .all()
+                )
 
                 html_content = render_template("catalogo_exposicao.html", exposicao=exposicao_selecionada, top=top, now=lambda: datetime.utcnow().strftime("%d/%m/%Y %H:%M:%S"))
-                html_path = os.path.join(TEMP_FOLDER, f"catalogo_exposicao_{exposicao_selecionada.id}.html")
                 pdf_path = os.path.join(PDF_FOLDER, f"catalogo_exposicao_{exposicao_selecionada.id}.pdf")
-                with open(html_path, "w", encoding="utf-8") as f:
-                    f.write(html_content)
-                try:
-                    from cloudconvert_service import html_para_pdf
-                    html_para_pdf(html_path, pdf_path)
-                    pdf_url = f"/static/pdf/catalogo_exposicao_{exposicao_selecionada.id}.pdf"
-                    flash("PDF gerado com sucesso.", "success")
-                    return redirect(pdf_url)
-                except Exception as ex:
-                    app.logger.exception("Erro ao gerar PDF: %s", ex)
-                    flash("Falha ao gerar PDF. Vê os logs.", "error")
+                job = enqueue_pdf_job("exposicao", f"exposicao:{exposicao_selecionada.id}", html_content, pdf_path)
+                return _pdf_job_response(job)
                     
-    return render_template("exportar_exposicao.html", exposicoes=exposicoes, pdf_url=pdf_url, exposicao=exposicao_selecionada, top=top, categorias=categorias, query_text="", selected_categoria=None)
+    return render_template("exportar_exposicao.html", exposicoes=exposicoes, pdf_url=pdf_url, exposicao=exposicao_selecionada, top=top, categorias=categorias, query_text="", selected_categoria=None, admin=is_admin())
+
+
+@app.route("/exportar_exposicao/certificados", methods=["POST"])
+@admin_required
+def gerar_certificados_exposicao():
+    exposicao = Exposicao.query.get_or_404(request.form.get("exposicao_id", type=int))
+    autores = (
+        db.session.query(Utilizador, func.count(Imagem.id))
+        .join(Imagem, Imagem.id_utilizador == Utilizador.id)
+        .filter(Imagem.id.in_(_exposicao_imagens_query(exposicao).with_entities(Imagem.id)))
+        .group_by(Utilizador.id)
+        .order_by(Utilizador.id)
+        .all()
+    )
+    if not autores:
+        flash("Esta exposição ainda não tem autores com obras.", "error")
+        return redirect(url_for("exportar_exposicao"))
+
+    # Um template compilado para todos; cada HTML é gerado à medida que é gravado
+    template = app.jinja_env.get_template("certificado.html")
+    hoje = date.today()
+    documentos = (
+        (f"certificado_{user.id}_{secure_filename(user.nome) or 'autor'}",
+         template.render(user=user, exposicao=exposicao, obras=obras, data_emissao=hoje))
+        for user, obras in autores
+    )
+    zip_path = os.path.join(PDF_FOLDER, f"certificados_exposicao_{exposicao.id}.zip")
+    job = enqueue_pdf_batch_job("certificados", f"certificados:exposicao:{exposicao.id}", documentos, zip_path,
+                                id_utilizador=current_user().id)
+    return _pdf_job_response(job)
 
 @app.route("/catalogo")
 def gerar_catalogo():
     imagens = Imagem.query.order_by(Imagem.data_upload.desc()).limit(20).all()
-    from cloudconvert_service import html_para_pdf
     html_content = render_template("catalogo.html", imagens=imagens, exposicao=None)
-    html_path = os.path.join(TEMP_FOLDER, "catalogo.html")
-    pdf_path = os.path.join(PDF_FOLDER, "catalogo.pdf")
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(html_content)
-    html_para_pdf(html_path, pdf_path)
-    return redirect("/static/pdf/catalogo.pdf")
+    # O mesmo HTML dá sempre o mesmo PDF: só se converte quando as obras mudam
+    digest = content_digest(html_content)
+    pdf_path = cached_pdf_path(PDF_FOLDER, "catalogo", digest)
+    if os.path.exists(pdf_path):
+        if request.accept_mimetypes.best == "application/json" or request.args.get("formato") == "json":
+            return jsonify({"status": "concluido", "download_url": url_for("static", filename=f"pdf/{os.path.basename(pdf_path)}")})
+        return send_file(os.path.abspath(pdf_path), mimetype="application/pdf", etag=digest,
+                         download_name="catalogo.pdf", conditional=True)
+
+    job = enqueue_pdf_job("catalogo", f"catalogo:{digest[:16]}", html_content, pdf_path)
+    evict_stale_variants(PDF_FOLDER, "catalogo")
+    return _pdf_job_response(job)
 
 @app.route("/certificado/<int:user_id>")
 @login_required
@@ -1516,17 +1821,58 @@ def gerar_certificado(user_id):
         flash("Não tens permissão para gerar este certificado.", "error")
         return redirect(url_for("index"))
     user = Utilizador.query.get_or_404(user_id)
-    html_content = render_template("certificado.html", user=user)
-    html_path = os.path.join(TEMP_FOLDER, f"certificado_{user.id}.html")
+    html_content = render_template("certificado.html", user=user, data_emissao=date.today())
     pdf_path = os.path.join(PDF_FOLDER, f"certificado_{user.id}.pdf")
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(html_content)
-    try:
-        from cloudconvert_service import html_para_pdf
-        html_para_pdf(html_path, pdf_path)
-    except Exception:
-        flash("Geração de PDF falhou (CloudConvert). HTML guardado temporariamente.", "error")
-    return redirect("/" + pdf_path)
+    # O trabalho é reutilizado por chave: pertence ao titular do certificado (os admins veem todos)
+    job = enqueue_pdf_job("certificado", f"certificado:{user.id}", html_content, pdf_path, id_utilizador=user.id)
+    return _pdf_job_response(job)
+
+
+def _pdf_job_response(job):
+    """Clientes JSON recebem 202 com o id do trabalho; o browser vai para a página de progresso."""
+    if request.accept_mimetypes.best == "application/json" or request.args.get("formato") == "json":
+        return jsonify({
+            **serialize_job(job),
+            "status_url": url_for("api_pdf_job_status", job_id=job.id),
+            "download_url": url_for("pdf_job_download", job_id=job.id),
+        }), 202
+    return redirect(url_for("pdf_job_page", job_id=job.id))
+
+
+def _get_visible_pdf_job(job_id):
+    job = db.session.get(PdfJob, job_id)
+    if job is None:
+        abort(404)
+    if job.id_utilizador is not None:
+        requester = current_user()
+        if not requester or (requester.id != job.id_utilizador and not is_admin(requester)):
+            abort(403)
+    return job
+
+
+@app.route("/pdf/trabalhos/<job_id>")
+def pdf_job_page(job_id):
+    job = _get_visible_pdf_job(job_id)
+    return render_template("pdf_job.html", job=job)
+
+
+@app.route("/api/v1/pdf/trabalhos/<job_id>")
+def api_pdf_job_status(job_id):
+    job = _get_visible_pdf_job(job_id)
+    data = serialize_job(job)
+    if job.status == "concluido":
+        data["download_url"] = url_for("pdf_job_download", job_id=job.id)
+    return jsonify(data)
+
+
+@app.route("/pdf/trabalhos/<job_id>/download")
+def pdf_job_download(job_id):
+    job = _get_visible_pdf_job(job_id)
+    if job.status != "concluido" or not os.path.exists(job.pdf_path):
+        return redirect(url_for("pdf_job_page", job_id=job.id))
+    mimetype = "application/zip" if job.pdf_path.endswith(".zip") else "application/pdf"
+    return send_file(os.path.abspath(job.pdf_path), mimetype=mimetype,
+                     download_name=os.path.basename(job.pdf_path))
 
 
 @app.route("/api/imagens", methods=["GET"])
@@ -1588,8 +1934,8 @@ def api_imagens():
 @app.route("/api/imagens/<int:imagem_id>", methods=["GET"])
 def api_imagem_detalhe(imagem_id):
     img = Imagem.query.get_or_404(imagem_id)
-    likes = Reacao.query.filter_by(id_imagem=imagem_id, tipo="like").count()
-    comentarios = Comentario.query.filter_by(id_imagem=imagem_id, estado_moderacao="aprovado").count()
+    likes = img.likes_count
+    comentarios = img.comments_count
     return jsonify({
         "id": img.id,
         "titulo": img.titulo,
@@ -1612,6 +1958,27 @@ def api_imagem_detalhe(imagem_id):
 
 
 
+@app.route("/api/imagens/<int:imagem_id>/semelhantes", methods=["GET"])
+def api_imagens_semelhantes(imagem_id):
+    img = Imagem.query.get_or_404(imagem_id)
+    limit = max(1, min(request.args.get("limit", 6, type=int), 24))
+    return jsonify({
+        "id": img.id,
+        "semelhantes": [
+            {
+                "id": obra.id,
+                "titulo": obra.titulo,
+                "url": obra.caminho_armazenamento,
+                "categoria": obra.categoria_texto,
+                "tags": obra.tags,
+                "id_utilizador": obra.id_utilizador,
+                "semelhanca": score,
+            }
+            for obra, score in similar_images(img, limit)
+        ],
+    })
+
+
 @app.route("/api/categorias", methods=["GET"])
 def api_categorias():
     categorias = Categoria.query.order_by(Categoria.nome).all()
@@ -1622,26 +1989,14 @@ def api_categorias():
 def api_exposicao_top(exposicao_id):
     exposicao = Exposicao.query.get_or_404(exposicao_id)
     
-    # Obter apenas imagens associadas a esta exposição
-    q_imgs = Imagem.query.filter(Imagem.exposicoes.any(Exposicao.id == exposicao_id))
-    img_ids = [i.id for i in q_imgs.with_entities(Imagem.id).all()]
-
-    if not img_ids:
-        return jsonify({
-            "exposicao_id": exposicao.id,
-            "exposicao_nome": getattr(exposicao, "nome", None),
-            "top": []
-        })
-
-    # Consulta atualizada para contar Likes (Reacao)
-    rows = db.session.query(
-        Imagem,
-        func.count(Reacao.id).label("total_likes")
-    ).outerjoin(Reacao, (Reacao.id_imagem == Imagem.id) & (Reacao.tipo == 'like')) \
-     .filter(Imagem.id.in_(img_ids)) \
-     .group_by(Imagem.id) \
-     .order_by(desc("total_likes")) \
-     .limit(10).all()
+    # Obter apenas imagens associadas a esta exposição, ordenadas pelo contador de likes
+    rows = (
+        Imagem.query.filter(Imagem.exposicoes.any(Exposicao.id == exposicao_id))
+        .add_columns(Imagem.likes_count)
+        .order_by(Imagem.likes_count.desc(), Imagem.id.desc())
+        .limit(10)
+        .all()
+    )
      
     def to_min(img, likes):
         return {
@@ -1744,6 +2099,8 @@ def api_publicar_imagem():
 
         db.session.add(img)
         db.session.commit()
+        similarity_index.add_image(img)
+        invalidate_author_features()
 
         # Resposta JSON estruturada
         return jsonify({
@@ -1799,7 +2156,9 @@ def api_apagar_imagem(imagem_id):
             ).delete(synchronize_session=False)
         Comentario.query.filter_by(id_imagem=imagem_id).delete()
         Reacao.query.filter_by(id_imagem=imagem_id).delete()
+        unread_owners = _unread_notification_owners(imagem_id)
         Notification.query.filter_by(id_imagem=imagem_id).delete()
+        recount_unread_notifications(unread_owners)
         
         # Limpar associações Many-to-Many
         img.exposicoes = []
@@ -1815,6 +2174,8 @@ def api_apagar_imagem(imagem_id):
 
         db.session.delete(img)
         db.session.commit()
+        similarity_index.remove_image(imagem_id)
+        invalidate_author_features()
 
         # Apagar do Supabase
         try:
@@ -1881,11 +2242,13 @@ def api_criar_comentario():
             motivo=moderation.get("motivo"),
         )
         db.session.add(res_mod)
-        db.session.commit()
-
-        # Disparar notificação apenas se aprovado
         if moderation["decision"] == "aprovado":
+            adjust_comments(imagem_id, 1)
+            # Notificação apenas se aprovado, na mesma transação do comentário
             adicionar_notificacao(img.id_utilizador, "comentario", imagem_id, img.titulo)
+        db.session.commit()
+        invalidate_interaction_profile(user.id)
+        mark_snapshot_stale(user.id)
 
         msg = "Comentário adicionado com sucesso!"
         if moderation["decision"] == "pendente":
@@ -1930,8 +2293,12 @@ def api_apagar_comentario(comentario_id):
 
     try:
         ResultadoModeracao.query.filter_by(id_comentario=c.id).delete()
+        if c.estado_moderacao == "aprovado":
+            adjust_comments(c.id_imagem, -1)
         db.session.delete(c)
         db.session.commit()
+        invalidate_interaction_profile(c.id_utilizador)
+        mark_snapshot_stale(c.id_utilizador)
         return jsonify({
             "success": True,
             "message": "Comentário apagado com sucesso."
@@ -1963,20 +2330,30 @@ def api_reacao_toggle():
     try:
         if existente:
             db.session.delete(existente)
+            if tipo == "like":
+                adjust_likes(imagem_id, -1)
             db.session.commit()
+            invalidate_interaction_profile(user.id)
+            mark_snapshot_stale(user.id)
             status = "unliked"
         else:
             nova = Reacao(tipo=tipo, id_imagem=imagem_id, id_utilizador=user.id)
             db.session.add(nova)
+            if tipo == "like":
+                adjust_likes(imagem_id, 1)
+                # Notificação de like na mesma transação da reação
+                img = db.session.get(Imagem, imagem_id)
+                if img:
+                    adicionar_notificacao(img.id_utilizador, "like", imagem_id, img.titulo)
             db.session.commit()
+            invalidate_interaction_profile(user.id)
+            mark_snapshot_stale(user.id)
             status = "liked"
-            
-            # Disparar notificação de like
-            img = db.session.get(Imagem, imagem_id)
-            if img and tipo == "like":
-                adicionar_notificacao(img.id_utilizador, "like", imagem_id, img.titulo)
 
-        likes = Reacao.query.filter_by(id_imagem=imagem_id, tipo="like").count()
+        if tipo == "like":
+            likes = publicar_likes(imagem_id)
+        else:
+            likes = db.session.query(Imagem.likes_count).filter(Imagem.id == imagem_id).scalar() or 0
         return jsonify({
             "success": True,
             "status": status,
@@ -2068,20 +2445,16 @@ def api_v1_reverse_geocode():
 @app.route("/api/v1/public/estatisticas", methods=["GET"])
 def api_public_estatisticas():
     try:
-        total_utilizadores = Utilizador.query.count()
-        total_imagens = Imagem.query.filter_by(publica=True).count()
-        total_comentarios = Comentario.query.count()
-        total_categorias = Categoria.query.count()
-        total_exposicoes = Exposicao.query.filter_by(ativo=True).count()
+        stats = global_stats.get()
         
         return jsonify({
             "status": "success",
             "dados": {
-                "total_utilizadores": total_utilizadores,
-                "total_imagens": total_imagens,
-                "total_comentarios": total_comentarios,
-                "total_categorias": total_categorias,
-                "total_exposicoes_ativas": total_exposicoes
+                "total_utilizadores": stats["utilizadores"],
+                "total_imagens": stats["imagens_publicas"],
+                "total_comentarios": stats["comentarios"],
+                "total_categorias": stats["categorias"],
+                "total_exposicoes_ativas": stats["exposicoes_ativas"]
             }
         }), 200
     except Exception as e:
@@ -2121,10 +2494,7 @@ def api_public_estatisticas_utilizador(user_id):
         total_imagens = len(user_imgs)
         
         # Calcular likes e comentários totais nas imagens públicas dele
-        total_likes = db.session.query(func.count(Reacao.id))\
-            .join(Imagem, Reacao.id_imagem == Imagem.id)\
-            .filter(Imagem.id_utilizador == user.id, Imagem.publica == True, Reacao.tipo == 'like')\
-            .scalar() or 0
+        total_likes = sum(img.likes_count for img in user_imgs)
             
         total_comentarios = db.session.query(func.count(Comentario.id))\
             .join(Imagem, Comentario.id_imagem == Imagem.id)\
@@ -2137,7 +2507,7 @@ def api_public_estatisticas_utilizador(user_id):
         most_popular = None
         max_likes = -1
         for img in user_imgs:
-            l_count = Reacao.query.filter_by(id_imagem=img.id, tipo='like').count()
+            l_count = img.likes_count
             if l_count > max_likes:
                 max_likes = l_count
                 most_popular = {
@@ -2171,12 +2541,91 @@ def api_public_estatisticas_utilizador(user_id):
         app.logger.exception("Erro ao obter estatísticas do utilizador %d: %s", user_id, e)
         return jsonify({"status": "error", "message": "Erro ao processar as estatísticas"}), 500
 
+@app.route("/api/v1/eventos", methods=["GET"])
+@api_login_required
+def api_eventos():
+    """
+    Stream SSE do utilizador: novas notificações e, com ?imagem_id=, a contagem
+    de likes da imagem aberta. A resposta não usa stream_with_context, por isso a
+    sessão da base de dados é libertada antes de o stream começar.
+    """
+    user = current_user()
+    channels = [f"user:{user.id}"]
+    imagem_id = request.args.get("imagem_id", type=int)
+    if imagem_id:
+        img = db.session.get(Imagem, imagem_id)
+        if img and (img.publica or img.id_utilizador == user.id):
+            channels.append(f"imagem:{imagem_id}")
+    subscription = event_hub.subscribe(channels, request.headers.get("Last-Event-ID", type=int))
+    if subscription is None:
+        # Sem threads livres para mais streams: o cliente volta a consultar a contagem
+        response = jsonify({"error": "Demasiadas ligações em tempo real; tenta mais tarde."})
+        response.headers["Retry-After"] = str(SSE_STREAM_TIMEOUT)
+        return response, 503
+    response = Response(
+        event_hub.stream(subscription),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Liberta o lugar mesmo que o cliente desligue antes de o stream começar
+    response.call_on_close(lambda: event_hub.unsubscribe(subscription))
+    return response
+
+
+def _encode_notification_cursor(notif):
+    raw = f"{notif.created_at.isoformat()}|{notif.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_notification_cursor(value):
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        created_str, id_str = raw.split("|", 1)
+        return datetime.fromisoformat(created_str), int(id_str)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
 @app.route("/api/v1/notificacoes", methods=["GET"])
 @api_login_required
 def api_listar_notificacoes():
+    """
+    Notificações do utilizador, das mais recentes para as mais antigas. O corpo
+    continua a ser a lista de sempre; com `per` ou `cursor` a resposta é uma
+    página com cursor sobre (created_at, id) e o cursor seguinte vem no
+    cabeçalho X-Next-Cursor. X-Unread-Count traz o contador de não lidas. Com
+    unread_only=1 usa o índice parcial ix_notification_unread_created.
+    """
     user = current_user()
-    notifs = Notification.query.filter_by(id_utilizador=user.id).order_by(Notification.created_at.desc()).all()
-    
+    paginated = "per" in request.args or "cursor" in request.args
+    per = min(max(request.args.get("per", NOTIFICATION_PAGE_SIZE, type=int), 1), 100)
+    unread_only = request.args.get("unread_only", "", type=str).lower() in ("1", "true", "sim")
+    cursor_raw = request.args.get("cursor", "", type=str).strip()
+    cursor = _decode_notification_cursor(cursor_raw)
+    if cursor_raw and not cursor:
+        return jsonify({"error": "Cursor inválido."}), 400
+
+    query = Notification.query.filter(Notification.id_utilizador == user.id)
+    if unread_only:
+        query = query.filter(Notification.is_read == False)
+    if cursor:
+        created_cursor, id_cursor = cursor
+        query = query.filter(or_(
+            Notification.created_at < created_cursor,
+            (Notification.created_at == created_cursor) & (Notification.id < id_cursor),
+        ))
+    query = query.order_by(Notification.created_at.desc(), Notification.id.desc())
+    next_cursor = None
+    if paginated:
+        notifs = query.limit(per + 1).all()
+        if len(notifs) > per:
+            next_cursor = _encode_notification_cursor(notifs[per - 1])
+            notifs = notifs[:per]
+    else:
+        notifs = query.all()
+
     data = []
     for n in notifs:
         data.append({
@@ -2188,7 +2637,45 @@ def api_listar_notificacoes():
             "id_imagem": n.id_imagem,
             "created_at": n.created_at.isoformat() if n.created_at else None
         })
-    return jsonify(data), 200
+    response = jsonify(data)
+    response.headers["X-Unread-Count"] = str(max(user.unread_notifications or 0, 0))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
+
+@app.route("/api/v1/notificacoes/ler", methods=["PUT"])
+@api_login_required
+def api_ler_notificacoes():
+    """
+    Marca como lidas várias notificações num só UPDATE: {"ids": [...]} para as
+    indicadas ou {"todas": true} para todas as do utilizador.
+    """
+    user = current_user()
+    data = request.get_json() or {}
+    todas = data.get("todas") is True
+    ids = data.get("ids")
+    if not todas:
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return jsonify({"error": "Indique 'ids' (lista de inteiros) ou 'todas': true."}), 400
+        if len(ids) > NOTIFICATION_BULK_LIMIT:
+            return jsonify({"error": f"Máximo de {NOTIFICATION_BULK_LIMIT} ids por pedido."}), 400
+
+    try:
+        query = Notification.query.filter(Notification.id_utilizador == user.id, Notification.is_read == False)
+        if not todas:
+            query = query.filter(Notification.id.in_(set(ids)))
+        marcadas = query.update({Notification.is_read: True}, synchronize_session=False)
+        if todas:
+            user.unread_notifications = 0
+        elif marcadas:
+            adjust_unread_notifications(user.id, -marcadas)
+        db.session.commit()
+        return jsonify({"success": True, "marcadas": marcadas}), 200
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception("Erro ao marcar notificações como lidas via API: %s", e)
+        return jsonify({"error": "Erro no banco de dados"}), 500
 
 @app.route("/api/v1/notificacoes/<int:notif_id>/ler", methods=["PUT"])
 @api_login_required
@@ -2198,7 +2685,9 @@ def api_ler_notificacao(notif_id):
     if notif.id_utilizador != user.id:
         return jsonify({"error": "Não tens permissão para aceder a esta notificação."}), 403
     
-    notif.is_read = True
+    if not notif.is_read:
+        notif.is_read = True
+        adjust_unread_notifications(user.id, -1)
     db.session.commit()
     return jsonify({
         "success": True,
@@ -2211,6 +2700,7 @@ def api_limpar_notificacoes():
     user = current_user()
     try:
         Notification.query.filter_by(id_utilizador=user.id).delete()
+        user.unread_notifications = 0
         db.session.commit()
         return jsonify({
             "success": True,
@@ -2242,6 +2732,7 @@ def api_pausar_notificacoes():
             message = f"Notificações pausadas por {duracao} minutos."
 
         db.session.commit()
+        forget_notifications_pause(user)
         return jsonify({
             "success": True,
             "message": message,
@@ -2261,7 +2752,9 @@ def ler_notificacao(notif_id):
     if notif.id_utilizador != user.id:
         return jsonify({"error": "Unauthorized"}), 403
     
-    notif.is_read = True
+    if not notif.is_read:
+        notif.is_read = True
+        adjust_unread_notifications(user.id, -1)
     db.session.commit()
     return jsonify({"status": "success"})
 
@@ -2270,6 +2763,7 @@ def ler_notificacao(notif_id):
 def limpar_notificacoes():
     user = current_user()
     Notification.query.filter_by(id_utilizador=user.id).delete()
+    user.unread_notifications = 0
     db.session.commit()
     flash("Lista de notificações limpa.", "success")
     return redirect(request.referrer or url_for("index"))
@@ -2303,6 +2797,7 @@ def pausar_notificacoes():
         flash(f"Notificações pausadas por {tempo_str}.", "success")
         
     db.session.commit()
+    forget_notifications_pause(user)
     return redirect(request.referrer or url_for("index"))
 
 @app.route("/login")
@@ -2365,11 +2860,13 @@ def google_callback():
 
     session["user_id"] = user.id
     session["user_email"] = user.email
+    forget_current_user()
     return redirect(url_for("index"))
 
 @app.route("/logout")
 def logout():
     session.clear()
+    forget_current_user()
     return redirect(url_for("index"))
 
 @app.route("/perfil")
@@ -2408,12 +2905,7 @@ def perfil(imagem_id: int):
     user = Utilizador.query.get_or_404(imagem_id)
     imagens = Imagem.query.filter_by(id_utilizador=user.id).order_by(Imagem.data_upload.desc()).all()
     
-    total_likes = (
-        db.session.query(func.count(Reacao.id))
-        .join(Imagem, Reacao.id_imagem == Imagem.id)
-        .filter(Imagem.id_utilizador == user.id, Reacao.tipo == "like")
-        .scalar() or 0
-    )
+    total_likes = sum(img.likes_count for img in imagens)
     
     return render_template(
         "perfil.html", 
@@ -0,0 +1,84 @@
+"""
+Mede a vazão e a contrapressão do envio de e-mails (caixa de saída + workers)
+sem chave do Resend, contra o fornecedor simulado ou o transporte em ficheiro.
+
+Uso:
+  python -m benchmarks.bench_email --database-url sqlite:///bench.db [--emails 500]
+      [--workers 4] [--transporte simulado|ficheiro] [--latencia-ms 150] [--taxa 10] [--falhas 0.02]
+
+Com o fornecedor simulado, --taxa é o limite de pedidos por segundo (acima dele
+responde 429) e --falhas a fração de pedidos que falham com erro 500.
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///bench.db"))
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--transporte", choices=["simulado", "ficheiro"], default="simulado")
+    parser.add_argument("--latencia-ms", type=float, default=150)
+    parser.add_argument("--taxa", type=float, default=10, help="pedidos por segundo aceites (0 = sem limite)")
+    parser.add_argument("--falhas", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    # As threads da app não arrancam; o benchmark usa o seu próprio pool, com o transporte escolhido
+    os.environ["BACKGROUND_WORKERS"] = "0"
+    import logging
+    logging.disable(logging.WARNING)
+    from app import app
+    from models import EmailOutbox, db
+    from services import email_outbox_service
+    from services.email_outbox_service import EmailWorkerPool, enqueue_email
+    from services.email_service import FakeProviderTransport, FileTransport, deliver_email, set_transport
+
+    # Os erros transitórios voltam logo à fila, para medir o pipeline e não o backoff
+    email_outbox_service.EMAIL_BACKOFF_BASE = 0
+    if args.transporte == "simulado":
+        transport = FakeProviderTransport(latency_ms=args.latencia_ms, rate=args.taxa, failure_rate=args.falhas)
+    else:
+        transport = FileTransport()
+    set_transport(transport)
+
+    run = uuid.uuid4().hex[:8]
+    with app.app_context():
+        EmailOutbox.__table__.create(db.engine, checkfirst=True)
+        for i in range(args.emails):
+            enqueue_email(f"bench{i}@artenuvem.test", "Benchmark", "<p>ArteNuvem</p>", idempotency_key=f"bench:{run}:{i}")
+        db.session.commit()
+
+    pool = EmailWorkerPool(size=args.workers, max_attempts=1000)
+    started = time.perf_counter()
+    pool.start(app, deliver_email)
+    pending = args.emails
+    with app.app_context():
+        while pending and time.perf_counter() - started < args.timeout:
+            time.sleep(0.5)
+            pending = EmailOutbox.query.filter(
+                EmailOutbox.idempotency_key.like(f"bench:{run}:%"), EmailOutbox.status != "enviado"
+            ).count()
+            db.session.rollback()
+            print(f"\r{args.emails - pending}/{args.emails} enviados", end="", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    pool.stop()
+    print(file=sys.stderr)
+
+    sent = args.emails - pending
+    print(f"transporte: {args.transporte} | workers: {args.workers}")
+    print(f"enviados: {sent}/{args.emails} em {elapsed:.1f}s ({sent / elapsed:.1f} e-mails/s)")
+    if isinstance(transport, FakeProviderTransport):
+        stats = transport.stats
+        print(f"pedidos: {stats['pedidos']} | 429: {stats['limitados']} | falhas: {stats['falhas']} "
+              f"| duplicados: {stats['duplicados']}")
+    sys.exit(0 if not pending else 1)
+
+
+if __name__ == "__main__":
+    main()
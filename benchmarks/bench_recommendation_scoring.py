@@ -0,0 +1,133 @@
+"""
+Compara a pontuação vetorizada de candidatos (services.recommendation_service)
+com o ciclo Python original, sobre candidatos sintéticos, e confirma que o
+ranking final é idêntico.
+
+Uso: python -m benchmarks.bench_recommendation_scoring [--candidatos 1000] [--repeticoes 50]
+"""
+import argparse
+import hashlib
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from services.recommendation_service import (
+    _reason_for,
+    _score_candidates,
+    _top_k,
+    split_tags,
+)
+
+TAGS = ["azul", "mar", "retrato", "cidade", "noite", "abstrato", "natureza", "luz", "sombra", "urbano",
+        "aguarela", "digital", "oleo", "minimal", "cor", "preto", "branco", "rosto", "animal", "rio"]
+
+
+def reference_ranking(rows, category_weights, tag_weights, author_weights, media_curtidas, now, limit):
+    """Ciclo Python por imagem, tal como existia antes da vetorização."""
+    today_str = now.strftime("%Y-%m-%d")
+    fav_tags = [t[0] for t in tag_weights.most_common(3)]
+    scored = []
+    for image_id, id_categoria, id_utilizador, tags, likes_count, comments_count, data_upload in rows:
+        score = 0.0
+        reasons = []
+        category_score = category_weights.get(id_categoria, 0)
+        if category_score:
+            score += category_score * 5.0
+            reasons.append("categoria favorita")
+        matched_tags = [tag for tag in split_tags(tags) if tag in tag_weights]
+        if matched_tags:
+            score += sum(tag_weights[tag] for tag in matched_tags) * 4.0
+            reasons.append("temas relacionados")
+            if any(t in fav_tags for t in matched_tags):
+                score += 8.0
+        author_score = author_weights.get(id_utilizador, 0)
+        if author_score:
+            score += author_score * 3.0
+            reasons.append("artista que gostas")
+        likes_score = likes_count or 0
+        comments_score = comments_count or 0
+        if likes_score > media_curtidas:
+            score += (likes_score - media_curtidas) * 5.0
+            reasons.append("acima da média de curtidas")
+        elif likes_score > 0:
+            score += (likes_score / max(0.1, media_curtidas)) * 2.0
+            reasons.append("obra recomendada")
+        score += likes_score * 2.5 + comments_score * 1.5
+        if likes_score >= 3:
+            reasons.append("popular na comunidade")
+        age_days = (now - data_upload).days if data_upload else 30
+        score = score * (1.0 / (1.0 + 0.03 * max(0, age_days)))
+        if age_days <= 5:
+            reasons.append("novidade recente")
+        hash_val = hashlib.sha256(f"{image_id}-{today_str}".encode()).hexdigest()
+        score = score * (0.8 + (int(hash_val[:6], 16) % 401) / 1000.0)
+        if not reasons:
+            reasons.append("sugestão ArteNuvem")
+        scored.append((score, image_id, data_upload, " · ".join(reasons[:2])))
+    scored.sort(key=lambda item: (item[0], item[2] or datetime.min), reverse=True)
+    return [(item[1], item[3]) for item in scored[:limit]]
+
+
+def vectorized_ranking(rows, category_weights, tag_weights, author_weights, media_curtidas, now, limit):
+    score, components = _score_candidates(rows, category_weights, tag_weights, author_weights, media_curtidas, now)
+    top = _top_k(score, components["upload_us"], limit)
+    return [(components["ids"][idx], _reason_for(idx, components, media_curtidas)) for idx in top]
+
+
+def synthetic_candidates(n, rnd, now):
+    rows = []
+    for image_id in range(1, n + 1):
+        rows.append((
+            image_id,
+            rnd.choice([None, 1, 2, 3, 4, 5]),
+            rnd.randint(1, max(2, n // 10)),
+            ",".join(rnd.sample(TAGS, rnd.randint(0, 4))),
+            rnd.choice([0, 0, 1, 2, 3, 5, 8, 13, 40]),
+            rnd.randint(0, 6),
+            None if rnd.random() < 0.01 else now - timedelta(hours=rnd.randint(0, 24 * 120)),
+        ))
+    return rows
+
+
+def synthetic_profile(rnd):
+    category_weights = Counter({c: rnd.randint(3, 40) for c in rnd.sample([1, 2, 3, 4, 5], 2)})
+    tag_weights = Counter({t: rnd.randint(1, 20) for t in rnd.sample(TAGS, 8)})
+    author_weights = Counter({a: rnd.randint(1, 10) for a in rnd.sample(range(1, 100), 10)})
+    return category_weights, tag_weights, author_weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidatos", type=int, default=1000)
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--limite", type=int, default=12)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    rows = synthetic_candidates(args.candidatos, rnd, now)
+    profiles = [synthetic_profile(rnd) for _ in range(args.repeticoes)]
+    media_curtidas = 4.2
+
+    for profile in profiles:
+        expected = reference_ranking(rows, *profile, media_curtidas, now, args.limite)
+        obtained = vectorized_ranking(rows, *profile, media_curtidas, now, args.limite)
+        if expected != obtained:
+            raise SystemExit(f"Ranking diferente!\nesperado={expected}\nobtido={obtained}")
+
+    timings = {}
+    for name, fn in (("python", reference_ranking), ("numpy", vectorized_ranking)):
+        start = time.perf_counter()
+        for profile in profiles:
+            fn(rows, *profile, media_curtidas, now, args.limite)
+        timings[name] = (time.perf_counter() - start) / len(profiles) * 1000
+
+    print(f"{args.candidatos} candidatos, {args.repeticoes} perfis, ranking idêntico")
+    print(f"  ciclo Python : {timings['python']:.2f} ms/chamada")
+    print(f"  vetorizado   : {timings['numpy']:.2f} ms/chamada")
+    print(f"  speedup      : {timings['python'] / timings['numpy']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Mede as rotas mais usadas através do test client do Flask: latência p50/p95 e
+número de consultas SQL por pedido.
+
+Uso:
+  python -m benchmarks.seed --escala 10k --database-url sqlite:///bench.db
+  python -m benchmarks.bench_routes --database-url sqlite:///bench.db [--repeticoes 50]
+      [--rotas index,api_search] [--guardar base.json] [--comparar base.json --tolerancia 0.25]
+
+Com --comparar, termina com código 1 se alguma rota piorar o p95 acima da
+tolerância ou fizer mais consultas SQL do que na execução de referência.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100.0
+    low, high = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def _scenarios(user_id, image_ids, author_id):
+    """nome -> função(client, rnd) que faz um pedido; cada uma corresponde a uma rota da app."""
+    def reacao_toggle(client, rnd):
+        # Pares de toggles deixam o estado final igual ao inicial
+        return client.post("/reacao/toggle", json={"imagem_id": image_ids[0], "tipo": "like"})
+
+    return {
+        "index": lambda client, rnd: client.get("/"),
+        "api_search": lambda client, rnd: client.get(
+            "/api/search", query_string={"q": rnd.choice(["mar", "luz", "retrato", "cidade"]), "per": 20}
+        ),
+        "api_recommendations": lambda client, rnd: client.get("/api/recommendations"),
+        "api_imagens": lambda client, rnd: client.get(
+            "/api/imagens", query_string={"page": rnd.randint(1, 5), "per": 20}
+        ),
+        "api_public_estatisticas_utilizador": lambda client, rnd: client.get(
+            f"/api/v1/public/estatisticas/utilizador/{author_id}"
+        ),
+        "reacao_toggle": reacao_toggle,
+    }
+
+
+def run(app, db, names, repeticoes, aquecimento, seed=42):
+    from sqlalchemy import event, func
+
+    from models import Imagem, Utilizador
+
+    with app.app_context():
+        user_id = db.session.query(func.min(Utilizador.id)).scalar()
+        if user_id is None:
+            raise SystemExit("Base de dados vazia: corre primeiro python -m benchmarks.seed")
+        image_ids = [row.id for row in Imagem.query.with_entities(Imagem.id)
+                     .filter(Imagem.publica == True, Imagem.id_utilizador != user_id).limit(50)]
+        author_id = (
+            db.session.query(Imagem.id_utilizador, func.count(Imagem.id).label("total"))
+            .group_by(Imagem.id_utilizador).order_by(func.count(Imagem.id).desc()).limit(1).scalar()
+        )
+        engine = db.engine
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["user_id"] = user_id
+
+    queries = [0]
+
+    def _count_query(*_args):
+        queries[0] += 1
+
+    event.listen(engine, "before_cursor_execute", _count_query)
+    rnd = random.Random(seed)
+    scenarios = _scenarios(user_id, image_ids, author_id)
+    results = {}
+    try:
+        for name in names:
+            request_fn = scenarios[name]
+            for _ in range(aquecimento):
+                request_fn(client, rnd)
+            latencies, counts = [], []
+            for _ in range(repeticoes):
+                queries[0] = 0
+                started = time.perf_counter()
+                response = request_fn(client, rnd)
+                latencies.append((time.perf_counter() - started) * 1000)
+                counts.append(queries[0])
+                if response.status_code >= 400:
+                    raise SystemExit(f"{name}: HTTP {response.status_code}")
+            results[name] = {
+                "p50_ms": round(_percentile(latencies, 50), 2),
+                "p95_ms": round(_percentile(latencies, 95), 2),
+                "queries": round(statistics.mean(counts), 1),
+                "queries_max": max(counts),
+            }
+    finally:
+        event.remove(engine, "before_cursor_execute", _count_query)
+    return results
+
+
+def compare(results, baseline, tolerancia):
+    regressions = []
+    for name, current in results.items():
+        ref = baseline.get(name)
+        if not ref:
+            continue
+        if current["p95_ms"] > ref["p95_ms"] * (1 + tolerancia):
+            regressions.append(f"{name}: p95 {ref['p95_ms']} -> {current['p95_ms']} ms")
+        if current["queries_max"] > ref["queries_max"]:
+            regressions.append(f"{name}: consultas {ref['queries_max']} -> {current['queries_max']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///bench.db"))
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--aquecimento", type=int, default=3)
+    parser.add_argument("--rotas", default="", help="lista separada por vírgulas (por omissão, todas)")
+    parser.add_argument("--guardar", help="grava os resultados em JSON")
+    parser.add_argument("--comparar", help="JSON de referência para detetar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("BACKGROUND_WORKERS", "0")
+    import logging
+    logging.disable(logging.WARNING)
+    from app import app
+    from models import db
+
+    available = list(_scenarios(None, [0], None))
+    names = [n.strip() for n in args.rotas.split(",") if n.strip()] or available
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        raise SystemExit(f"Rotas desconhecidas: {', '.join(unknown)} (disponíveis: {', '.join(available)})")
+
+    results = run(app, db, names, args.repeticoes, args.aquecimento)
+
+    print(f"{'rota':<38} {'p50 ms':>9} {'p95 ms':>9} {'SQL/pedido':>11}")
+    for name, row in results.items():
+        print(f"{name:<38} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['queries']:>11}")
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerancia)
+        if regressions:
+            print("\nRegressões:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print("\nSem regressões face à referência.")
+
+
+if __name__ == "__main__":
+    main()
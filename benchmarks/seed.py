@@ -0,0 +1,280 @@
+"""
+Gera um conjunto de dados sintético para medir desempenho (SQLite local ou Postgres).
+
+A escala é o número de imagens; os restantes volumes derivam dela:
+  utilizadores = imagens/10, likes = imagens*5, comentários = imagens*2,
+  notificações = imagens, localizações = imagens/4, exposições = max(5, imagens/2000)
+
+Uso: python -m benchmarks.seed --escala 1k|100k|1m [--database-url sqlite:///bench.db] [--seed 42]
+
+Os dados são inseridos com INSERT em lote (Core), por isso 1M de imagens demora
+minutos e não horas. As linhas são geradas e inseridas bloco a bloco (CHUNK);
+em memória só ficam os contadores por imagem que preenchem as colunas
+desnormalizadas.
+Não usar contra a base de dados de produção.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import islice
+
+ESCALAS = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+CHUNK = 5_000
+
+PALAVRAS = ["luz", "mar", "cidade", "retrato", "noite", "azul", "silêncio", "jardim", "rio", "sombra",
+            "manhã", "vento", "janela", "ponte", "rosto", "floresta", "neblina", "praia", "estrada", "céu"]
+TAGS = ["azul", "mar", "retrato", "cidade", "noite", "abstrato", "natureza", "luz", "sombra", "urbano",
+        "aguarela", "digital", "oleo", "minimal", "cor", "preto", "branco", "rosto", "animal", "rio"]
+CIDADES = [("Lisboa", "Portugal", 38.72, -9.14), ("Porto", "Portugal", 41.15, -8.61),
+           ("Coimbra", "Portugal", 40.20, -8.41), ("Madrid", "Espanha", 40.42, -3.70),
+           ("Paris", "França", 48.86, 2.35)]
+
+
+def _chunks(rows, size=CHUNK):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _insert(db, table, rows):
+    """Insere `rows` (lista ou gerador) bloco a bloco; devolve o número de linhas."""
+    total = 0
+    for chunk in _chunks(rows):
+        db.session.execute(table.insert(), chunk)
+        total += len(chunk)
+    db.session.commit()
+    return total
+
+
+def _max_id(db, column):
+    from sqlalchemy import func
+    return db.session.query(func.coalesce(func.max(column), 0)).scalar()
+
+
+def _sync_sequences(db, tables):
+    """
+    No Postgres as chaves inseridas com ID explícito não avançam a sequência
+    (SERIAL/identity); sem isto o próximo INSERT do ORM repetiria um ID.
+    """
+    if db.engine.dialect.name != "postgresql":
+        return
+    from sqlalchemy import text
+    for table in tables:
+        column = table.primary_key.columns.values()[0].name
+        db.session.execute(
+            text(f'SELECT setval(pg_get_serial_sequence(:table, :column), (SELECT max("{column}") FROM "{table.name}"))'),
+            {"table": f'"{table.name}"', "column": column},
+        )
+    db.session.commit()
+
+
+def seed(n_imagens, rnd, log=print):
+    from sqlalchemy import bindparam
+    from models import (
+        Categoria, Comentario, Exposicao, Imagem, Localizacao, Notification, Reacao, Utilizador,
+        db, imagem_exposicao,
+    )
+
+    n_users = max(10, n_imagens // 10)
+    n_likes = n_imagens * 5
+    n_comments = n_imagens * 2
+    n_notifs = n_imagens
+    n_locations = max(1, n_imagens // 4)
+    n_exposicoes = max(5, n_imagens // 2000)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    categorias = [c.id for c in Categoria.query.all()]
+    if not categorias:
+        for nome in ("Todos", "Fotos", "Desenhos", "Outro"):
+            db.session.add(Categoria(nome=nome))
+        db.session.commit()
+        categorias = [c.id for c in Categoria.query.all()]
+    nomes_categoria = {c.id: c.nome for c in Categoria.query.all()}
+
+    # ---------------- UTILIZADORES ----------------
+    first_user = _max_id(db, Utilizador.id) + 1
+    user_ids = range(first_user, first_user + n_users)
+    _insert(db, Utilizador.__table__, (
+        {"ID_Utilizador": user_id, "Nome": f"Artista {user_id}", "Email": f"bench{user_id}@artenuvem.test"}
+        for user_id in user_ids
+    ))
+    log(f"utilizadores: {n_users}")
+
+    # ---------------- LOCALIZAÇÕES ----------------
+    first_location = _max_id(db, Localizacao.id) + 1
+    location_ids = range(first_location, first_location + n_locations)
+
+    def localizacoes():
+        for i, location_id in enumerate(location_ids):
+            cidade, pais, lat, lng = rnd.choice(CIDADES)
+            yield {
+                "ID_Location": location_id, "Address": f"Rua {i}, {cidade}", "City": cidade, "Country": pais,
+                "Latitude": lat + rnd.uniform(-0.05, 0.05), "Longitude": lng + rnd.uniform(-0.05, 0.05),
+                "CreatedAt": now,
+            }
+
+    _insert(db, Localizacao.__table__, localizacoes())
+    log(f"localizações: {n_locations}")
+
+    # ---------------- CONTADORES ----------------
+    # Em memória só ficam os contadores por imagem (indexados pela posição na
+    # range de IDs); as linhas são geradas e inseridas bloco a bloco mais abaixo
+    first_image = _max_id(db, Imagem.id) + 1
+    image_ids = range(first_image, first_image + n_imagens)
+    autores = array("i", (rnd.choice(user_ids) for _ in image_ids))
+
+    # Likes com popularidade enviesada; cada imagem recebe no máximo um por
+    # utilizador, para os pares (imagem, utilizador) serem únicos
+    likes_por_imagem = array("i", [0]) * n_imagens
+    total_likes = 0
+    while total_likes < n_likes:
+        pos = min(int(rnd.paretovariate(1.2)) - 1, n_imagens - 1) if rnd.random() < 0.3 \
+            else rnd.randrange(n_imagens)
+        if likes_por_imagem[pos] >= n_users:
+            continue
+        likes_por_imagem[pos] += 1
+        total_likes += 1
+
+    comentarios_por_imagem = array("i", [0]) * n_imagens
+    aprovados_por_imagem = array("i", [0]) * n_imagens
+    for _ in range(n_comments):
+        pos = rnd.randrange(n_imagens)
+        comentarios_por_imagem[pos] += 1
+        if rnd.random() < 0.9:
+            aprovados_por_imagem[pos] += 1
+
+    # ---------------- IMAGENS ----------------
+    def imagens():
+        for pos, image_id in enumerate(image_ids):
+            categoria = rnd.choice(categorias)
+            yield {
+                "ID_Imagem": image_id,
+                "Titulo": " ".join(rnd.sample(PALAVRAS, 2)).capitalize(),
+                "Categoria": nomes_categoria[categoria],
+                "Caminho_Armazenamento": f"https://picsum.photos/seed/{image_id}/600/400",
+                "Data_Upload": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365)),
+                "ID_Utilizador": autores[pos],
+                "ID_Categoria": categoria,
+                "Tags": ",".join(rnd.sample(TAGS, rnd.randint(0, 4))),
+                "Descricao": " ".join(rnd.choices(PALAVRAS, k=8)),
+                "Publica": rnd.random() < 0.95,
+                "ID_Location": rnd.choice(location_ids) if rnd.random() < 0.3 else None,
+                "Likes_Count": likes_por_imagem[pos],
+                "Comments_Count": aprovados_por_imagem[pos],
+            }
+
+    _insert(db, Imagem.__table__, imagens())
+    log(f"imagens: {n_imagens}")
+
+    # ---------------- REAÇÕES ----------------
+    def reacoes():
+        for pos, image_id in enumerate(image_ids):
+            for user_id in rnd.sample(user_ids, likes_por_imagem[pos]):
+                yield {"Tipo": "like", "ID_Imagem": image_id, "ID_Utilizador": user_id}
+
+    log(f"likes: {_insert(db, Reacao.__table__, reacoes())}")
+
+    # ---------------- COMENTÁRIOS ----------------
+    def comentarios():
+        for pos, image_id in enumerate(image_ids):
+            for i in range(comentarios_por_imagem[pos]):
+                yield {
+                    "Texto": " ".join(rnd.choices(PALAVRAS, k=5)),
+                    "Data": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365)),
+                    "ID_Imagem": image_id,
+                    "ID_Utilizador": rnd.choice(user_ids),
+                    "EstadoModeracao": "aprovado" if i < aprovados_por_imagem[pos]
+                    else rnd.choice(["pendente", "bloqueado"]),
+                }
+
+    log(f"comentários: {_insert(db, Comentario.__table__, comentarios())}")
+
+    # ---------------- EXPOSIÇÕES ----------------
+    first_exposicao = _max_id(db, Exposicao.id) + 1
+    hoje = now.date()
+    _insert(db, Exposicao.__table__, (
+        {"ID_Exposicao": first_exposicao + i, "Nome": f"Exposição {first_exposicao + i}",
+         "Ativo": i == 0, "Usar_Categorias": True, "Start_Date": hoje - timedelta(days=30 * i + 10),
+         "End_Date": hoje - timedelta(days=30 * i - 20), "Mes_Inteiro": False}
+        for i in range(n_exposicoes)
+    ))
+    _insert(db, imagem_exposicao, (
+        {"ID_Imagem": image_id, "ID_Exposicao": rnd.randint(first_exposicao, first_exposicao + n_exposicoes - 1)}
+        for image_id in rnd.sample(image_ids, n_imagens // 5)
+    ))
+    log(f"exposições: {n_exposicoes}")
+
+    # ---------------- NOTIFICAÇÕES ----------------
+    # ux_notification_unread só admite uma por ler por (utilizador, tipo, imagem):
+    # repetições desse trio ficam como lidas. O autor é fixo por imagem, por isso
+    # basta um bit por tipo em cada imagem
+    tipo_bits = {"like": 1, "comentario": 2}
+    por_ler = bytearray(n_imagens)
+    unread_por_utilizador = Counter()
+
+    def notificacoes():
+        for _ in range(n_notifs):
+            pos = rnd.randrange(n_imagens)
+            tipo = rnd.choice(["like", "comentario"])
+            is_read = rnd.random() < 0.7 or bool(por_ler[pos] & tipo_bits[tipo])
+            if not is_read:
+                por_ler[pos] |= tipo_bits[tipo]
+                unread_por_utilizador[autores[pos]] += 1
+            yield {
+                "UserID": autores[pos], "Type": tipo, "ID_Imagem": image_ids[pos],
+                "Message": f"Nova interação ({tipo}) na tua obra", "Count": rnd.randint(1, 5),
+                "IsRead": is_read, "CreatedAt": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 90)),
+            }
+
+    _insert(db, Notification.__table__, notificacoes())
+    utilizadores = Utilizador.__table__
+    for chunk in _chunks({"uid": uid, "unread": n} for uid, n in unread_por_utilizador.items()):
+        db.session.execute(
+            utilizadores.update()
+            .where(utilizadores.c.ID_Utilizador == bindparam("uid"))
+            .values(Unread_Notifications=bindparam("unread")),
+            chunk,
+        )
+    db.session.commit()
+    log(f"notificações: {n_notifs} ({sum(unread_por_utilizador.values())} por ler)")
+
+    _sync_sequences(db, (Utilizador.__table__, Localizacao.__table__, Imagem.__table__, Exposicao.__table__))
+
+    log(f"concluído em {time.perf_counter() - started:.1f}s")
+    return {"utilizadores": user_ids, "imagens": image_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escala", default="1k", help="1k, 10k, 100k, 1m ou um número de imagens")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///bench.db"))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    escala = args.escala.lower()
+    n_imagens = ESCALAS[escala] if escala in ESCALAS else int(escala)
+
+    # A configuração da app lê DATABASE_URL no import
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("BACKGROUND_WORKERS", "0")
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+        app.test_client().get("/healthz")  # ensure_tables (colunas, índices e categorias)
+        print(f"A gerar {n_imagens} imagens em {db.engine.url.render_as_string(hide_password=True)}", file=sys.stderr)
+        seed(n_imagens, random.Random(args.seed))
+
+
+if __name__ == "__main__":
+    main()
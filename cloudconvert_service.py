@@ -8,8 +8,9 @@ cloudconvert.configure(
     sandbox=False 
 )
 
-def html_para_pdf(html_path: str, pdf_path: str):
-
+def html_para_pdf(html_path: str, pdf_path: str, progresso=None):
+    """Converte o HTML em PDF; `progresso(percentagem)` é chamado entre as etapas."""
+    progresso = progresso or (lambda _: None)
 
     job = cloudconvert.Job.create({
         "tasks": {
@@ -40,9 +41,10 @@ def html_para_pdf(html_path: str, pdf_path: str):
         task=upload_task,
         file_name=html_path
     )
-
+    progresso(30)
 
     job = cloudconvert.Job.wait(job["id"])
+    progresso(80)
 
    
     export_task = next(
@@ -19,6 +19,8 @@ class Utilizador(db.Model):
     email = db.Column("Email", db.String(150), unique=True, nullable=False)
     foto_url = db.Column("Foto_URL", db.String(300), nullable=True)
     notifications_paused_until = db.Column("notificationspauseduntil", db.DateTime, nullable=True)
+    # Nº de notificações por ler (desnormalizado), mantido por services.counter_service
+    unread_notifications = db.Column("Unread_Notifications", db.Integer, default=0, server_default="0", nullable=False)
 
     imagens = db.relationship("Imagem", backref="autor", lazy=True)
 
@@ -45,7 +47,13 @@ class Localizacao(db.Model):
 
 class Imagem(db.Model):
     __tablename__ = "imagem"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Suporta a paginação por cursor (data_upload, id) do feed principal
+        db.Index("ix_imagem_feed", "Publica", "Data_Upload", "ID_Imagem"),
+        # Ordenação "mais/menos curtidas" sem GROUP BY sobre a tabela reacao
+        db.Index("ix_imagem_likes", "Publica", "Likes_Count", "ID_Imagem"),
+        {'extend_existing': True}
+    )
 
     id = db.Column("ID_Imagem", db.Integer, primary_key=True)
     titulo = db.Column("Titulo", db.String(150), nullable=False)
@@ -59,6 +67,10 @@ class Imagem(db.Model):
     descricao = db.Column("Descricao", db.String(500), nullable=True)
     publica = db.Column("Publica", db.Boolean, default=True, nullable=False)
     id_location = db.Column("ID_Location", db.Integer, db.ForeignKey("localizacao.ID_Location"), nullable=True)
+    # Contadores desnormalizados (likes e comentários aprovados), mantidos nas rotas
+    # de reação/comentário e reconciliados periodicamente por services.counter_service
+    likes_count = db.Column("Likes_Count", db.Integer, default=0, server_default="0", nullable=False)
+    comments_count = db.Column("Comments_Count", db.Integer, default=0, server_default="0", nullable=False)
     localizacao = db.relationship("Localizacao", backref="imagens", lazy=True)
     
     exposicoes = db.relationship(
@@ -127,7 +139,11 @@ class Notificacao(db.Model):
 
 class Notification(db.Model):
     __tablename__ = "notification"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Dropdown com as N notificações mais recentes do utilizador
+        db.Index("ix_notification_user_created", "UserID", "CreatedAt"),
+        {'extend_existing': True}
+    )
 
     id = db.Column("ID_Notification", db.Integer, primary_key=True)
     id_utilizador = db.Column("UserID", db.Integer, db.ForeignKey("utilizador.ID_Utilizador"), nullable=False)
@@ -169,3 +185,93 @@ class ResultadoModeracao(db.Model):
     motivo = db.Column("motivo", db.String(250), nullable=True)
     comentario = db.relationship("Comentario", backref=db.backref("resultado_moderacao", uselist=False), lazy=True)
 
+
+class RecommendationSnapshot(db.Model):
+    __tablename__ = "recommendation_snapshot"
+    __table_args__ = {'extend_existing': True}
+
+    # 0 = lista anónima ("popular"); caso contrário o ID do utilizador
+    id_utilizador = db.Column("UserID", db.Integer, primary_key=True, autoincrement=False)
+    payload = db.Column("Payload", db.Text, nullable=False)
+    computed_at = db.Column("ComputedAt", db.DateTime, default=datetime.utcnow, nullable=False)
+    is_stale = db.Column("IsStale", db.Boolean, default=False, nullable=False)
+
+class EmailOutbox(db.Model):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # Os workers procuram as mensagens pendentes cuja próxima tentativa já chegou
+        db.Index("ix_email_outbox_due", "Status", "NextAttemptAt"),
+        {'extend_existing': True}
+    )
+
+    id = db.Column("ID_Email", db.Integer, primary_key=True)
+    idempotency_key = db.Column("IdempotencyKey", db.String(200), unique=True, nullable=False)
+    to_email = db.Column("ToEmail", db.String(255), nullable=False)
+    subject = db.Column("Subject", db.String(300), nullable=False)
+    html = db.Column("Html", db.Text, nullable=False)
+    status = db.Column("Status", db.String(20), default="pendente", nullable=False)  # pendente, a_enviar, enviado, falhado
+    attempts = db.Column("Attempts", db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column("NextAttemptAt", db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column("LockedAt", db.DateTime, nullable=True)
+    last_error = db.Column("LastError", db.String(500), nullable=True)
+    created_at = db.Column("CreatedAt", db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column("SentAt", db.DateTime, nullable=True)
+
+
+class DigestCampaign(db.Model):
+    __tablename__ = "digest_campaign"
+    __table_args__ = {'extend_existing': True}
+
+    # Checkpoint de uma campanha de emails de recomendações (services.digest_campaign_service)
+    nome = db.Column("Nome", db.String(100), primary_key=True)
+    last_user_id = db.Column("LastUserID", db.Integer, default=0, nullable=False)
+    enviados = db.Column("Enviados", db.Integer, default=0, nullable=False)
+    ignorados = db.Column("Ignorados", db.Integer, default=0, nullable=False)
+    started_at = db.Column("StartedAt", db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column("UpdatedAt", db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column("FinishedAt", db.DateTime, nullable=True)
+
+
+class PdfJob(db.Model):
+    __tablename__ = "pdf_job"
+    __table_args__ = (
+        db.Index("ix_pdf_job_status", "Status", "CreatedAt"),
+        {'extend_existing': True}
+    )
+
+    id = db.Column("ID_Job", db.String(32), primary_key=True)
+    tipo = db.Column("Tipo", db.String(30), nullable=False)  # catalogo, exposicao, certificado, certificados
+    # Recurso exportado (p. ex. "exposicao:5"): pedidos repetidos reutilizam o trabalho em curso
+    chave = db.Column("Chave", db.String(100), nullable=False)
+    status = db.Column("Status", db.String(20), default="pendente", nullable=False)  # pendente, a_processar, concluido, falhado
+    progresso = db.Column("Progresso", db.Integer, default=0, nullable=False)
+    html_path = db.Column("HtmlPath", db.String(500), nullable=False)
+    pdf_path = db.Column("PdfPath", db.String(500), nullable=False)
+    erro = db.Column("Erro", db.String(500), nullable=True)
+    id_utilizador = db.Column("UserID", db.Integer, db.ForeignKey("utilizador.ID_Utilizador"), nullable=True)
+    created_at = db.Column("CreatedAt", db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column("StartedAt", db.DateTime, nullable=True)
+    finished_at = db.Column("FinishedAt", db.DateTime, nullable=True)
+
+
+# Uma só notificação por ler por (utilizador, tipo, imagem): alvo do ON CONFLICT
+# de services.notification_service.upsert_notification
+db.Index(
+    "ux_notification_unread",
+    Notification.id_utilizador,
+    Notification.type,
+    Notification.id_imagem,
+    unique=True,
+    postgresql_where=Notification.is_read == False,
+    sqlite_where=Notification.is_read == False,
+)
+
+# Paginação por cursor de /api/v1/notificacoes?unread_only=1, por (CreatedAt, ID) descendente
+db.Index(
+    "ix_notification_unread_created",
+    Notification.id_utilizador,
+    Notification.created_at,
+    Notification.id,
+    postgresql_where=Notification.is_read == False,
+    sqlite_where=Notification.is_read == False,
+)
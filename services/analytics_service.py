@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from sqlalchemy import desc, func
 
 from models import Categoria, Comentario, Exposicao, Imagem, Reacao, Utilizador, db, imagem_exposicao, Notification
+from services.stats_service import global_stats
 
 
 def _last_days_labels(days=7):
@@ -39,11 +40,9 @@ def build_dashboard_data(user_id):
 
     # User's images ordered by likes count
     top_images = (
-        db.session.query(Imagem, func.count(Reacao.id).label("likes"))
-        .outerjoin(Reacao, (Reacao.id_imagem == Imagem.id) & (Reacao.tipo == "like"))
+        db.session.query(Imagem, Imagem.likes_count.label("likes"))
         .filter(Imagem.id_utilizador == user_id)
-        .group_by(Imagem.id)
-        .order_by(desc("likes"), Imagem.data_upload.desc())
+        .order_by(Imagem.likes_count.desc(), Imagem.data_upload.desc())
         .limit(8)
         .all()
     )
@@ -75,9 +74,8 @@ def build_dashboard_data(user_id):
     total_uploads = Imagem.query.filter_by(id_utilizador=user_id).count()
     
     total_likes_received = (
-        db.session.query(func.count(Reacao.id))
-        .join(Imagem, Reacao.id_imagem == Imagem.id)
-        .filter(Imagem.id_utilizador == user_id, Reacao.tipo == "like")
+        db.session.query(func.coalesce(func.sum(Imagem.likes_count), 0))
+        .filter(Imagem.id_utilizador == user_id)
         .scalar() or 0
     )
     
@@ -99,8 +97,13 @@ def build_dashboard_data(user_id):
         "unread_notifs": unread_notifs,
     }
 
+    # Platform-wide reference values (shared cache, no per-request counts)
+    platform = global_stats.get()
+    platform["media_curtidas"] = round(platform["likes"] / max(1, platform["imagens_publicas"]), 2)
+
     return {
         "totals": totals,
+        "platform": platform,
         "top_images": top_images,
         "top_categories": top_categories,
         "top_expositions": exposure_rows,
@@ -115,6 +118,7 @@ def build_dashboard_data(user_id):
 def serialize_dashboard(data):
     return {
         "totals": data["totals"],
+        "platform": data["platform"],
         "top_images": [
             {
                 "id": image.id,
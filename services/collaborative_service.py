@@ -0,0 +1,200 @@
+"""
+Índice de filtragem colaborativa item-item ("quem gostou disto também gostou").
+
+O índice é construído offline a partir dos likes da tabela reacao e guardado em
+disco como arrays .npy de tamanho fixo (k vizinhos por imagem), que os workers
+abrem com memory-map. Uso: python -m services.collaborative_service
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+from models import Reacao, db
+
+logger = logging.getLogger(__name__)
+
+CF_INDEX_DIR = os.getenv("CF_INDEX_DIR", os.path.join("temp", "cf_index"))
+CF_NEIGHBOURS = int(os.getenv("CF_NEIGHBOURS", "20"))
+CF_MIN_CO_LIKES = int(os.getenv("CF_MIN_CO_LIKES", "2"))
+CF_MAX_SEEDS = 50
+CF_RELOAD_CHECK_SECONDS = 60
+CF_KEEP_VERSIONS = 2
+
+
+def build_item_similarity(top_k=CF_NEIGHBOURS, min_co_likes=CF_MIN_CO_LIKES):
+    """
+    Calcula, para cada imagem com likes, as top_k imagens mais semelhantes pela
+    similaridade de cosseno entre os conjuntos de utilizadores que lhes deram like.
+    Devolve (item_ids, neighbours, scores); neighbours/scores têm forma (n, top_k)
+    e usam -1 / 0.0 como preenchimento.
+    """
+    rows = (
+        db.session.query(Reacao.id_utilizador, Reacao.id_imagem)
+        .filter(Reacao.tipo == "like")
+        .all()
+    )
+    empty = (
+        np.zeros(0, dtype=np.int64),
+        np.zeros((0, top_k), dtype=np.int64),
+        np.zeros((0, top_k), dtype=np.float32),
+    )
+    if not rows:
+        return empty
+
+    user_ids, image_ids = (np.asarray(col, dtype=np.int64) for col in zip(*rows))
+    item_ids, item_idx = np.unique(image_ids, return_inverse=True)
+    _, user_idx = np.unique(user_ids, return_inverse=True)
+
+    likes = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (user_idx, item_idx)),
+        shape=(int(user_idx.max()) + 1, len(item_ids)),
+    )
+    likes.data[:] = 1.0  # reações duplicadas contam uma vez
+
+    co_likes = (likes.T @ likes).tocsr()
+    co_likes.setdiag(0)
+    co_likes.eliminate_zeros()
+    if min_co_likes > 1:
+        co_likes.data[co_likes.data < min_co_likes] = 0
+        co_likes.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(likes.sum(axis=0)).ravel())
+    similarity = co_likes.multiply(1.0 / norms[:, None]).multiply(1.0 / norms[None, :]).tocsr()
+
+    n = len(item_ids)
+    neighbours = np.full((n, top_k), -1, dtype=np.int64)
+    scores = np.zeros((n, top_k), dtype=np.float32)
+    for row in range(n):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if start == end:
+            continue
+        cols = similarity.indices[start:end]
+        values = similarity.data[start:end]
+        if len(values) > top_k:
+            keep = np.argpartition(values, len(values) - top_k)[-top_k:]
+            cols, values = cols[keep], values[keep]
+        order = np.argsort(-values, kind="stable")
+        neighbours[row, :len(order)] = item_ids[cols[order]]
+        scores[row, :len(order)] = values[order]
+
+    return item_ids, neighbours, scores
+
+
+def save_index(item_ids, neighbours, scores, index_dir=CF_INDEX_DIR):
+    """
+    Grava uma nova versão do índice e aponta o ficheiro CURRENT para ela de forma
+    atómica, para que os workers nunca leiam uma versão incompleta.
+    """
+    version = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    version_dir = os.path.join(index_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+    np.save(os.path.join(version_dir, "item_ids.npy"), item_ids)
+    np.save(os.path.join(version_dir, "neighbours.npy"), neighbours)
+    np.save(os.path.join(version_dir, "scores.npy"), scores)
+
+    current_tmp = os.path.join(index_dir, "CURRENT.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(index_dir, "CURRENT"))
+
+    versions = sorted(
+        name for name in os.listdir(index_dir)
+        if os.path.isdir(os.path.join(index_dir, name))
+    )
+    for old in versions[:-CF_KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(index_dir, old), ignore_errors=True)
+    return version
+
+
+def build_and_save_index(index_dir=CF_INDEX_DIR):
+    started = time.perf_counter()
+    item_ids, neighbours, scores = build_item_similarity()
+    version = save_index(item_ids, neighbours, scores, index_dir)
+    logger.info(
+        "Índice colaborativo %s construído: %d imagens em %.1fs.",
+        version, len(item_ids), time.perf_counter() - started,
+    )
+    return version
+
+
+_NO_NEIGHBOURS = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+
+
+class CollaborativeIndex:
+    """
+    Leitor do índice em disco. Os arrays são abertos com mmap_mode="r", por isso
+    são partilhados entre workers através da page cache do sistema operativo.
+    """
+
+    def __init__(self, index_dir=CF_INDEX_DIR):
+        self.index_dir = index_dir
+        self.version = None
+        self._arrays = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.index_dir, "CURRENT"), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _load(self):
+        now = time.monotonic()
+        if now - self._checked_at < CF_RELOAD_CHECK_SECONDS:
+            return self._arrays
+        with self._lock:
+            self._checked_at = now
+            version = self._current_version()
+            if version and version != self.version:
+                version_dir = os.path.join(self.index_dir, version)
+                try:
+                    self._arrays = tuple(
+                        np.load(os.path.join(version_dir, name), mmap_mode="r")
+                        for name in ("item_ids.npy", "neighbours.npy", "scores.npy")
+                    )
+                    self.version = version
+                except (OSError, ValueError) as e:
+                    logger.warning("Falha ao abrir índice colaborativo %s: %s", version, e)
+            return self._arrays
+
+    def neighbours(self, image_id):
+        """Vizinhos (ids, similaridades) de uma imagem: pesquisa binária + leitura de k valores."""
+        arrays = self._load()
+        if not arrays:
+            return _NO_NEIGHBOURS
+        item_ids, neighbours, scores = arrays
+        pos = int(np.searchsorted(item_ids, image_id))
+        if pos >= len(item_ids) or item_ids[pos] != image_id:
+            return _NO_NEIGHBOURS
+        row_ids = neighbours[pos]
+        valid = row_ids >= 0
+        return row_ids[valid], scores[pos][valid]
+
+    def scores_for(self, seed_ids, exclude=()):
+        """Soma das similaridades dos vizinhos das imagens semente (no máximo CF_MAX_SEEDS)."""
+        totals = {}
+        for seed in list(seed_ids)[:CF_MAX_SEEDS]:
+            ids, values = self.neighbours(seed)
+            for neighbour, value in zip(ids.tolist(), values.tolist()):
+                if neighbour not in exclude:
+                    totals[neighbour] = totals.get(neighbour, 0.0) + value
+        return totals
+
+
+collaborative_index = CollaborativeIndex()
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("BACKGROUND_WORKERS", "0")
+    from app import app
+
+    with app.app_context():
+        print(f"Índice colaborativo gravado: {build_and_save_index()}")
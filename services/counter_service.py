@@ -0,0 +1,150 @@
+import logging
+import os
+
+from sqlalchemy import func, select
+
+from models import Comentario, Imagem, Notification, Reacao, Utilizador, db
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = int(os.getenv("COUNTER_RECONCILE_INTERVAL", "3600"))
+RECONCILE_BATCH_SIZE = 1000
+
+
+def adjust_likes(image_id, delta):
+    """
+    Atualiza o contador de likes da imagem na mesma transação da reação.
+    O incremento é feito na base de dados para não perder likes concorrentes.
+    """
+    Imagem.query.filter_by(id=image_id).update(
+        {Imagem.likes_count: Imagem.likes_count + delta},
+        synchronize_session=False,
+    )
+
+
+def adjust_comments(image_id, delta):
+    """
+    Atualiza o contador de comentários aprovados da imagem na mesma transação.
+    """
+    Imagem.query.filter_by(id=image_id).update(
+        {Imagem.comments_count: Imagem.comments_count + delta},
+        synchronize_session=False,
+    )
+
+
+def _likes_subquery():
+    return (
+        select(func.count(Reacao.id))
+        .where(Reacao.id_imagem == Imagem.id, Reacao.tipo == "like")
+        .scalar_subquery()
+    )
+
+
+def _comments_subquery():
+    return (
+        select(func.count(Comentario.id))
+        .where(Comentario.id_imagem == Imagem.id, Comentario.estado_moderacao == "aprovado")
+        .scalar_subquery()
+    )
+
+
+def reconcile_counters(batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Corrige desvios entre os contadores desnormalizados e as tabelas reacao/comentario.
+    Percorre a tabela imagem por lotes de IDs para não bloquear a tabela inteira.
+    Devolve o número de imagens corrigidas.
+    """
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = [
+            row.id
+            for row in Imagem.query.with_entities(Imagem.id)
+            .filter(Imagem.id > last_id)
+            .order_by(Imagem.id)
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        drifted = (
+            Imagem.query.filter(Imagem.id.in_(ids))
+            .filter(
+                (Imagem.likes_count != _likes_subquery())
+                | (Imagem.comments_count != _comments_subquery())
+            )
+            .update(
+                {
+                    Imagem.likes_count: _likes_subquery(),
+                    Imagem.comments_count: _comments_subquery(),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.session.commit()
+        fixed += drifted or 0
+
+    if fixed:
+        logger.warning("Contadores de likes/comentários corrigidos em %d imagens.", fixed)
+    return fixed
+
+
+def adjust_unread_notifications(user_id, delta):
+    """Atualiza o nº de notificações por ler do utilizador na mesma transação."""
+    Utilizador.query.filter_by(id=user_id).update(
+        {Utilizador.unread_notifications: Utilizador.unread_notifications + delta},
+        synchronize_session=False,
+    )
+
+
+def _unread_subquery():
+    return (
+        select(func.count(Notification.id))
+        .where(Notification.id_utilizador == Utilizador.id, Notification.is_read == False)
+        .scalar_subquery()
+    )
+
+
+def recount_unread_notifications(user_ids):
+    """Recalcula o contador dos utilizadores indicados (ex.: após remoções em massa)."""
+    if not user_ids:
+        return
+    Utilizador.query.filter(Utilizador.id.in_(list(user_ids))).update(
+        {Utilizador.unread_notifications: _unread_subquery()},
+        synchronize_session=False,
+    )
+
+
+def reconcile_unread_notifications(batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Corrige desvios do contador de notificações por ler, por lotes de IDs de
+    utilizador. Devolve o número de utilizadores corrigidos.
+    """
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = [
+            row.id
+            for row in Utilizador.query.with_entities(Utilizador.id)
+            .filter(Utilizador.id > last_id)
+            .order_by(Utilizador.id)
+            .limit(batch_size)
+            .all()
+        ]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        drifted = (
+            Utilizador.query.filter(Utilizador.id.in_(ids))
+            .filter(Utilizador.unread_notifications != _unread_subquery())
+            .update({Utilizador.unread_notifications: _unread_subquery()}, synchronize_session=False)
+        )
+        db.session.commit()
+        fixed += drifted or 0
+
+    if fixed:
+        logger.warning("Contador de notificações por ler corrigido em %d utilizadores.", fixed)
+    return fixed
@@ -0,0 +1,199 @@
+"""
+Campanha de emails de recomendações para todos os utilizadores que as pediram
+(PreferenciaNotificacao.email_recomendacoes e email_ativo).
+
+Os utilizadores são lidos por ordem de ID em blocos; as recomendações de cada
+bloco são calculadas em paralelo num pool de processos; o template do email é
+compilado uma vez; os emails seguem em lotes de 100 pela API de lotes do Resend.
+Depois de cada lote enviado, o progresso fica gravado na tabela digest_campaign,
+por isso uma execução interrompida retoma no utilizador seguinte ao último lote.
+
+Uso: python -m services.digest_campaign_service [--campanha recomendacoes-2026-10-18]
+       [--bloco 500] [--processos 4] [--reiniciar]
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from models import DigestCampaign, PreferenciaNotificacao, Utilizador, db
+from services.email_service import deliver_batch
+from services.recommendation_snapshot_service import get_recommendations
+
+logger = logging.getLogger(__name__)
+
+DIGEST_CHUNK_SIZE = 500
+DIGEST_BATCH_SIZE = 100  # máximo aceite pela API de lotes do Resend
+DIGEST_RECOMMENDATIONS = 3
+DIGEST_SEND_ATTEMPTS = 3
+DIGEST_SUBJECT = "ArteNuvem - Recomendações de Arte para Si"
+
+_worker_app = None
+
+
+def _init_worker():
+    # Cada processo abre as suas próprias ligações à base de dados
+    global _worker_app
+    from app import app
+
+    _worker_app = app
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def _serialize(payload):
+    return {
+        "images": [
+            {
+                "id": img.id,
+                "titulo": img.titulo,
+                "caminho_armazenamento": img.caminho_armazenamento,
+                "categoria_texto": img.categoria_texto,
+                "autor": {"nome": img.autor.nome if img.autor else None},
+            }
+            for img in payload["images"]
+        ],
+        "reasons": payload["reasons"],
+    }
+
+
+def recommend_for(user_ids, limit=DIGEST_RECOMMENDATIONS):
+    """{user_id: {"images": [...], "reasons": {...}}} em estruturas simples (passam entre processos)."""
+    users = Utilizador.query.filter(Utilizador.id.in_(user_ids)).all()
+    return {user.id: _serialize(get_recommendations(user, limit=limit)) for user in users}
+
+
+def _recommend_in_worker(user_ids, limit):
+    with _worker_app.app_context():
+        return recommend_for(user_ids, limit)
+
+
+def _opted_in_users(after_id, chunk_size):
+    return (
+        db.session.query(Utilizador.id, Utilizador.email, Utilizador.nome)
+        .join(PreferenciaNotificacao, PreferenciaNotificacao.id_utilizador == Utilizador.id)
+        .filter(
+            PreferenciaNotificacao.email_ativo == True,
+            PreferenciaNotificacao.email_recomendacoes == True,
+            Utilizador.id > after_id,
+        )
+        .order_by(Utilizador.id)
+        .limit(chunk_size)
+        .all()
+    )
+
+
+def _split(items, parts):
+    size = max(1, -(-len(items) // parts))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _send_with_retry(messages, idempotency_key, sender):
+    for attempt in range(1, DIGEST_SEND_ATTEMPTS + 1):
+        try:
+            return sender(messages, idempotency_key)
+        except Exception as e:
+            if attempt == DIGEST_SEND_ATTEMPTS:
+                raise
+            logger.warning("Lote %s falhou (tentativa %d): %s", idempotency_key, attempt, e)
+            time.sleep(2 ** attempt)
+
+
+def run_campaign(nome, site_url, chunk_size=DIGEST_CHUNK_SIZE, processos=0, reiniciar=False,
+                 sender=deliver_batch, log=print):
+    """
+    Executa (ou retoma) a campanha `nome`. Com processos=0 as recomendações são
+    calculadas no próprio processo. Devolve o registo DigestCampaign final.
+    """
+    campaign = db.session.get(DigestCampaign, nome)
+    if campaign is None or reiniciar:
+        if campaign is not None:
+            db.session.delete(campaign)
+            db.session.flush()
+        campaign = DigestCampaign(nome=nome, last_user_id=0, enviados=0, ignorados=0)
+        db.session.add(campaign)
+        db.session.commit()
+    elif campaign.finished_at is not None:
+        log(f"Campanha {nome} já terminou em {campaign.finished_at:%Y-%m-%d %H:%M} ({campaign.enviados} enviados).")
+        return campaign
+    elif campaign.last_user_id:
+        log(f"A retomar {nome} depois do utilizador {campaign.last_user_id} ({campaign.enviados} já enviados).")
+
+    from flask import current_app
+    template = current_app.jinja_env.get_template("emails/recommendations.html")
+    # A chave de idempotência de cada lote inclui a execução: depois de --reiniciar
+    # os lotes são envios novos e não repetições que o fornecedor descartaria
+    run_token = campaign.started_at.strftime("%Y%m%d%H%M%S%f")
+    pool = ProcessPoolExecutor(max_workers=processos, initializer=_init_worker) if processos > 0 else None
+    try:
+        while True:
+            users = _opted_in_users(campaign.last_user_id, chunk_size)
+            if not users:
+                break
+            ids = [user.id for user in users]
+            # Fecha a transação de leitura antes de os workers gravarem snapshots
+            # (em SQLite uma leitura aberta aqui bloqueia essas escritas)
+            db.session.commit()
+            if pool:
+                recommendations = {}
+                for part in pool.map(_recommend_in_worker, _split(ids, processos),
+                                     [DIGEST_RECOMMENDATIONS] * processos):
+                    recommendations.update(part)
+            else:
+                recommendations = recommend_for(ids)
+
+            for start in range(0, len(users), DIGEST_BATCH_SIZE):
+                batch = users[start:start + DIGEST_BATCH_SIZE]
+                messages = []
+                for user in batch:
+                    payload = recommendations.get(user.id)
+                    if not payload or not payload["images"]:
+                        continue
+                    messages.append({
+                        "to": user.email,
+                        "subject": DIGEST_SUBJECT,
+                        "html": template.render(user={"nome": user.nome}, site_url=site_url, **payload),
+                    })
+                if messages:
+                    _send_with_retry(messages, f"{nome}:{run_token}:{batch[0].id}-{batch[-1].id}", sender)
+                campaign.last_user_id = batch[-1].id
+                campaign.enviados += len(messages)
+                campaign.ignorados += len(batch) - len(messages)
+                campaign.updated_at = datetime.utcnow()
+                db.session.commit()
+            log(f"{nome}: {campaign.enviados} enviados, {campaign.ignorados} sem recomendações "
+                f"(até ao utilizador {campaign.last_user_id}).")
+    finally:
+        if pool:
+            pool.shutdown()
+
+    campaign.finished_at = datetime.utcnow()
+    db.session.commit()
+    log(f"Campanha {nome} concluída: {campaign.enviados} enviados, {campaign.ignorados} sem recomendações.")
+    return campaign
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--campanha", default=f"recomendacoes-{date.today().isoformat()}")
+    parser.add_argument("--bloco", type=int, default=DIGEST_CHUNK_SIZE, help="utilizadores lidos de cada vez")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                        help="processos para calcular recomendações (0 = no próprio processo)")
+    parser.add_argument("--reiniciar", action="store_true", help="ignora o checkpoint e começa do início")
+    args = parser.parse_args()
+
+    os.environ.setdefault("BACKGROUND_WORKERS", "0")
+    from app import app
+
+    site_url = os.getenv("RENDER_EXTERNAL_URL") or os.getenv("SITE_URL") or "http://localhost:5000/"
+    if not site_url.endswith("/"):
+        site_url += "/"
+    with app.app_context():
+        DigestCampaign.__table__.create(db.engine, checkfirst=True)
+        run_campaign(args.campanha, site_url, args.bloco, args.processos, args.reiniciar)
+
+
+if __name__ == "__main__":
+    main()
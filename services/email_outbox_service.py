@@ -0,0 +1,219 @@
+"""
+Caixa de saída persistente de e-mails.
+
+Os e-mails são gravados na tabela email_outbox na transação de quem os pede e
+enviados depois por um conjunto fixo de threads (EMAIL_WORKERS). Assim um envio
+em massa não cria uma thread por mensagem e nada se perde se o worker do
+gunicorn for reciclado: o que não foi enviado continua na tabela.
+
+Cada mensagem tem uma chave de idempotência única. Pedir duas vezes o mesmo
+e-mail com a mesma chave grava-o uma só vez, e a chave vai também para o
+fornecedor para que uma repetição depois de um timeout não duplique o envio.
+As falhas são repetidas com backoff exponencial até EMAIL_MAX_ATTEMPTS.
+"""
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import EmailOutbox, db
+
+logger = logging.getLogger(__name__)
+
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_POLL_INTERVAL = 5
+EMAIL_CLAIM_BATCH = 10
+EMAIL_BACKOFF_BASE = 30
+EMAIL_BACKOFF_MAX = 3600
+# Mensagens "a_enviar" há mais tempo do que isto pertencem a um worker que morreu
+EMAIL_LOCK_TIMEOUT = 600
+# Pausa do pool quando o fornecedor responde 429 (não conta como tentativa falhada)
+EMAIL_RATE_LIMIT_PAUSE = 1.0
+
+_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+_WAKE_KEY = "email_outbox_wake"
+
+
+class RateLimitError(RuntimeError):
+    """O fornecedor recusou o pedido por excesso de pedidos (HTTP 429)."""
+
+
+def enqueue_email(to_email, subject, html, idempotency_key=None):
+    """
+    Grava o e-mail na transação atual (sem commit) e devolve a chave de
+    idempotência. Os workers só o veem depois do commit de quem chama.
+    """
+    key = idempotency_key or uuid.uuid4().hex
+    values = {
+        "IdempotencyKey": key,
+        "ToEmail": to_email,
+        "Subject": subject,
+        "Html": html,
+        "Status": "pendente",
+        "Attempts": 0,
+        "NextAttemptAt": datetime.utcnow(),
+        "CreatedAt": datetime.utcnow(),
+    }
+    insert = _INSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        db.session.execute(
+            insert(EmailOutbox.__table__).values(**values).on_conflict_do_nothing(index_elements=["IdempotencyKey"])
+        )
+    elif not EmailOutbox.query.filter_by(idempotency_key=key).first():
+        db.session.add(EmailOutbox(
+            idempotency_key=key, to_email=to_email, subject=subject, html=html,
+            status="pendente", attempts=0, next_attempt_at=values["NextAttemptAt"],
+        ))
+    db.session.info[_WAKE_KEY] = True
+    return key
+
+
+def _backoff(attempts):
+    delay = min(EMAIL_BACKOFF_BASE * 2 ** (attempts - 1), EMAIL_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class EmailWorkerPool:
+    def __init__(self, size=EMAIL_WORKERS, max_attempts=EMAIL_MAX_ATTEMPTS):
+        self.size = size
+        self.max_attempts = max_attempts
+        self._app = None
+        self._sender = None
+        self._threads = []
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._paused_until = 0.0
+
+    def start(self, app, sender):
+        """
+        Arranca as threads (uma vez por processo). `sender(to, subject, html,
+        idempotency_key)` faz o envio e lança uma exceção em caso de falha.
+        """
+        if self.size <= 0 or self._app is not None:
+            return
+        self._app = app
+        self._sender = sender
+        for i in range(self.size):
+            thread = threading.Thread(target=self._loop, daemon=True, name=f"email-worker-{i}")
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=10):
+        """Termina depois da mensagem em curso; as já reservadas voltam a 'pendente'."""
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                self._stopping.wait(pause)
+                continue
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.exception("Erro no worker de e-mail: %s", e)
+                processed = 0
+            if not processed:
+                self._wake.wait(EMAIL_POLL_INTERVAL)
+                self._wake.clear()
+
+    def run_once(self):
+        """Reserva e envia um lote de mensagens; devolve quantas foram reservadas."""
+        with self._app.app_context():
+            claimed = self._claim()
+            for position, email_id in enumerate(claimed):
+                if self._stopping.is_set() or time.monotonic() < self._paused_until:
+                    self._release(claimed[position:])
+                    break
+                self._send(email_id)
+            return len(claimed)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        EmailOutbox.query.filter(
+            EmailOutbox.status == "a_enviar", EmailOutbox.locked_at < now - timedelta(seconds=EMAIL_LOCK_TIMEOUT)
+        ).update({EmailOutbox.status: "pendente"}, synchronize_session=False)
+        candidates = [
+            row.id
+            for row in EmailOutbox.query.with_entities(EmailOutbox.id)
+            .filter(EmailOutbox.status == "pendente", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+            .limit(EMAIL_CLAIM_BATCH)
+        ]
+        claimed = []
+        for email_id in candidates:
+            # UPDATE condicional: só um worker (de qualquer processo) ganha cada mensagem
+            won = EmailOutbox.query.filter(EmailOutbox.id == email_id, EmailOutbox.status == "pendente").update(
+                {EmailOutbox.status: "a_enviar", EmailOutbox.locked_at: now}, synchronize_session=False
+            )
+            if won:
+                claimed.append(email_id)
+        db.session.commit()
+        return claimed
+
+    def _release(self, email_ids):
+        EmailOutbox.query.filter(EmailOutbox.id.in_(email_ids), EmailOutbox.status == "a_enviar").update(
+            {EmailOutbox.status: "pendente", EmailOutbox.locked_at: None}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def _send(self, email_id):
+        email = db.session.get(EmailOutbox, email_id)
+        if email is None:
+            return
+        try:
+            self._sender(email.to_email, email.subject, email.html, email.idempotency_key)
+        except RateLimitError as e:
+            # Contrapressão: a mensagem volta à fila e todo o pool abranda
+            self._paused_until = time.monotonic() + EMAIL_RATE_LIMIT_PAUSE * random.uniform(1, 1.5)
+            email.status = "pendente"
+            email.locked_at = None
+            logger.info("Fornecedor de e-mail limitou o envio: %s", e)
+        except Exception as e:
+            email.attempts += 1
+            email.last_error = str(e)[:500]
+            email.locked_at = None
+            if email.attempts >= self.max_attempts:
+                email.status = "falhado"
+                logger.error("E-mail %d para %s falhou %d vezes: %s", email.id, email.to_email, email.attempts, e)
+            else:
+                email.status = "pendente"
+                email.next_attempt_at = datetime.utcnow() + _backoff(email.attempts)
+                logger.warning("E-mail %d para %s falhou (tentativa %d): %s", email.id, email.to_email,
+                               email.attempts, e)
+        else:
+            email.status = "enviado"
+            email.sent_at = datetime.utcnow()
+            email.locked_at = None
+        db.session.commit()
+
+
+email_outbox = EmailWorkerPool()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_on_commit(session):
+    if session.info.pop(_WAKE_KEY, False):
+        email_outbox.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_WAKE_KEY, None)
@@ -1,40 +1,216 @@
 import os
+import random
+import re
+import smtplib
 import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date
+from email.message import EmailMessage
 from flask import render_template, request
 import resend
 from models import db, Utilizador, PreferenciaNotificacao
-from services.recommendation_service import build_recommendations
+from services.email_outbox_service import RateLimitError, enqueue_email
+from services.recommendation_snapshot_service import get_recommendations
 
-def send_email(to_email, subject, html):
+EMAIL_FROM = "ArteNuvem <onboarding@resend.dev>"
+
+
+class ResendTransport:
+    """Transporte real: API do Resend (RESEND_API_KEY)."""
+
+    def _configure(self):
+        api_key = os.getenv("RESEND_API_KEY")
+        if not api_key:
+            raise RuntimeError("RESEND_API_KEY não configurada no .env")
+        resend.api_key = api_key
+
+    def send(self, message, idempotency_key=None):
+        self._configure()
+        options = {"idempotency_key": idempotency_key} if idempotency_key else None
+        try:
+            return resend.Emails.send({"from": EMAIL_FROM, **message}, options)
+        except resend.exceptions.RateLimitError as e:
+            raise RateLimitError(str(e)) from e
+
+    def send_batch(self, messages, idempotency_key=None):
+        self._configure()
+        options = {"idempotency_key": idempotency_key} if idempotency_key else None
+        try:
+            return resend.Batch.send([{"from": EMAIL_FROM, **message} for message in messages], options)
+        except resend.exceptions.RateLimitError as e:
+            raise RateLimitError(str(e)) from e
+
+
+class FileTransport:
     """
-    Envia um e-mail usando a API do Resend diretamente para o utilizador.
+    Grava cada e-mail como .eml em EMAIL_SINK_DIR (por omissão temp/emails). Com
+    chave de idempotência o nome do ficheiro é fixo, por isso repetir não duplica.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv("EMAIL_SINK_DIR", os.path.join("temp", "emails"))
+
+    def _write(self, message, name):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.eml")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(bytes(_mime_message(message)))
+        os.replace(tmp_path, path)
+        return {"id": os.path.basename(path)}
+
+    def send(self, message, idempotency_key=None):
+        return self._write(message, idempotency_key or uuid.uuid4().hex)
+
+    def send_batch(self, messages, idempotency_key=None):
+        prefix = idempotency_key or uuid.uuid4().hex
+        return {"data": [self._write(message, f"{prefix}-{i}") for i, message in enumerate(messages)]}
+
+
+class SmtpTransport:
+    """Envia por SMTP, p. ex. para um servidor de teste local (EMAIL_SMTP_HOST/EMAIL_SMTP_PORT)."""
+
+    def __init__(self, host=None, port=None):
+        self.host = host or os.getenv("EMAIL_SMTP_HOST", "localhost")
+        self.port = int(port or os.getenv("EMAIL_SMTP_PORT", "1025"))
+
+    def send(self, message, idempotency_key=None):
+        return self.send_batch([message], idempotency_key)
+
+    def send_batch(self, messages, idempotency_key=None):
+        # Um lote usa uma só ligação SMTP
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            for message in messages:
+                smtp.send_message(_mime_message(message, idempotency_key))
+        return {"data": [{"id": None} for _ in messages]}
+
+
+class FakeProviderTransport:
+    """
+    Fornecedor simulado para testes de carga: cada pedido (e-mail ou lote) demora
+    EMAIL_FAKE_LATENCY_MS (±50%), há um limite de EMAIL_FAKE_RATE pedidos por
+    segundo (balde de tokens; acima dele lança RateLimitError, como um 429) e uma
+    fração EMAIL_FAKE_FAILURE_RATE de pedidos falha. Chaves de idempotência
+    repetidas não voltam a "enviar". Os contadores ficam em `stats`.
     """
-    api_key = os.getenv("RESEND_API_KEY")
-    if not api_key:
-        print(f"[EMAIL ERROR] Destino: {to_email} | Assunto: {subject} | Erro: RESEND_API_KEY não configurada no .env")
-        return False
 
-    resend.api_key = api_key
-    
+    def __init__(self, latency_ms=None, rate=None, failure_rate=None):
+        self.latency = float(latency_ms if latency_ms is not None else os.getenv("EMAIL_FAKE_LATENCY_MS", "150")) / 1000
+        self.rate = float(rate if rate is not None else os.getenv("EMAIL_FAKE_RATE", "10"))
+        self.failure_rate = float(failure_rate if failure_rate is not None else os.getenv("EMAIL_FAKE_FAILURE_RATE", "0"))
+        self.stats = Counter()
+        self._tokens = self.rate
+        self._last_refill = time.monotonic()
+        self._seen_keys = set()
+        self._lock = threading.Lock()
+
+    def _request(self, idempotency_key, count):
+        with self._lock:
+            self.stats["pedidos"] += 1
+            if self.rate > 0:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens < 1:
+                    self.stats["limitados"] += 1
+                    raise RateLimitError("429: limite de pedidos do fornecedor simulado")
+                self._tokens -= 1
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.failure_rate:
+            with self._lock:
+                self.stats["falhas"] += 1
+            raise RuntimeError("500: falha simulada do fornecedor")
+        with self._lock:
+            if idempotency_key and idempotency_key in self._seen_keys:
+                self.stats["duplicados"] += count
+            else:
+                if idempotency_key:
+                    self._seen_keys.add(idempotency_key)
+                self.stats["enviados"] += count
+        return {"id": uuid.uuid4().hex}
+
+    def send(self, message, idempotency_key=None):
+        return self._request(idempotency_key, 1)
+
+    def send_batch(self, messages, idempotency_key=None):
+        return self._request(idempotency_key, len(messages))
+
+
+def _mime_message(message, idempotency_key=None):
+    mime = EmailMessage()
+    mime["From"] = EMAIL_FROM
+    mime["To"] = message["to"]
+    mime["Subject"] = message["subject"]
+    if idempotency_key:
+        mime["X-Idempotency-Key"] = idempotency_key
+    mime.set_content(message["html"], subtype="html")
+    return mime
+
+
+EMAIL_TRANSPORTS = {
+    "resend": ResendTransport,
+    "ficheiro": FileTransport,
+    "smtp": SmtpTransport,
+    "simulado": FakeProviderTransport,
+}
+_transport = None
+
+
+def get_transport():
+    """Transporte escolhido por EMAIL_TRANSPORT (resend, ficheiro, smtp ou simulado)."""
+    global _transport
+    if _transport is None:
+        name = os.getenv("EMAIL_TRANSPORT", "resend").lower()
+        if name not in EMAIL_TRANSPORTS:
+            raise RuntimeError(f"EMAIL_TRANSPORT desconhecido: {name}")
+        _transport = EMAIL_TRANSPORTS[name]()
+    return _transport
+
+
+def set_transport(transport):
+    """Troca o transporte em uso (benchmarks); devolve o anterior."""
+    global _transport
+    previous, _transport = _transport, transport
+    return previous
+
+
+def deliver_email(to_email, subject, html, idempotency_key=None):
+    """
+    Envia um e-mail pelo transporte configurado. Lança uma exceção se falhar
+    (usado pelos workers da caixa de saída, que repetem o envio).
+    """
+    response = get_transport().send({"to": to_email, "subject": subject, "html": html}, idempotency_key)
+    print(f"[EMAIL SUCCESS] Destino: {to_email} | Assunto: {subject} | Response ID: {response.get('id') if isinstance(response, dict) else getattr(response, 'id', response)}")
+    return response
+
+def deliver_batch(messages, idempotency_key=None):
+    """
+    Envia até 100 e-mails num só pedido (API de lotes). `messages` é uma lista
+    de dicionários com to/subject/html. Lança uma exceção se falhar.
+    """
+    return get_transport().send_batch(messages, idempotency_key)
+
+def send_email(to_email, subject, html):
+    """
+    Envia um e-mail diretamente para o utilizador pelo transporte configurado.
+    """
     try:
-        response = resend.Emails.send({
-            "from": "ArteNuvem <onboarding@resend.dev>",
-            "to": to_email,
-            "subject": subject,
-            "html": html
-        })
-        print(f"[EMAIL SUCCESS] Destino: {to_email} | Assunto: {subject} | Response ID: {response.get('id') if isinstance(response, dict) else getattr(response, 'id', response)}")
+        deliver_email(to_email, subject, html)
         return True
     except Exception as e:
         print(f"[EMAIL ERROR] Destino: {to_email} | Assunto: {subject} | Erro: {str(e)}")
         return False
 
-def send_email_async(to_email, subject, html):
+def send_email_async(to_email, subject, html, idempotency_key=None):
     """
-    Cria uma thread em segundo plano para enviar o email sem bloquear o servidor.
+    Coloca o email na caixa de saída persistente (com commit); os workers de
+    email_outbox_service enviam-no sem bloquear o servidor.
     """
-    thread = threading.Thread(target=send_email, args=(to_email, subject, html))
-    thread.start()
+    key = enqueue_email(to_email, subject, html, idempotency_key)
+    db.session.commit()
+    return key
 
 def get_or_create_preferences(user):
     """
@@ -79,11 +255,10 @@ def send_welcome_email(user):
         
         subject = "Bem-vindo à ArteNuvem!"
         
-        # Desativa o envio de boas-vindas futuro e atualiza base de dados
+        # Desativa o envio de boas-vindas futuro e grava o email na mesma transação
         prefs.email_boas_vindas = False
+        enqueue_email(user.email, subject, html, idempotency_key=f"boas-vindas:{user.id}")
         db.session.commit()
-        
-        send_email_async(user.email, subject, html)
         return True
     except Exception as e:
         print(f"[EMAIL ERROR] Falha ao processar email de boas-vindas para {user.email}: {str(e)}")
@@ -99,7 +274,7 @@ def send_recommendation_email(user):
 
     try:
         # Obter recomendações personalizadas
-        rec_data = build_recommendations(user, limit=3)
+        rec_data = get_recommendations(user, limit=3)
         recommended_images = rec_data.get("images", [])
         reasons = rec_data.get("reasons", {})
 
@@ -123,7 +298,8 @@ def send_recommendation_email(user):
 
         subject = "ArteNuvem - Recomendações de Arte para Si"
         
-        send_email_async(user.email, subject, html)
+        # No máximo um email de recomendações por utilizador e por dia
+        send_email_async(user.email, subject, html, idempotency_key=f"recomendacoes:{user.id}:{date.today().isoformat()}")
         return True
     except Exception as e:
         print(f"[EMAIL ERROR] Falha ao processar email de recomendações para {user.email}: {str(e)}")
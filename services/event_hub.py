@@ -0,0 +1,143 @@
+"""
+Pub/sub em memória para eventos em tempo real (Server-Sent Events).
+
+Os canais são strings ("user:<id>" para notificações, "imagem:<id>" para a
+contagem de likes). Cada ligação SSE tem uma fila própria; os últimos eventos
+ficam num histórico curto para que um cliente que reconecta com Last-Event-ID
+não perca o que foi publicado entre ligações.
+
+O hub é por processo: com vários workers do gunicorn, um cliente só recebe os
+eventos publicados pelo worker que serve a sua ligação. Os eventos são um
+atalho para a interface; a fonte de verdade continua a ser a base de dados.
+
+Cada stream ocupa uma thread do worker gthread durante SSE_STREAM_TIMEOUT
+segundos, por isso só há SSE_MAX_STREAMS streams abertos por processo (abaixo
+do número de threads do gunicorn); acima disso subscribe devolve None e a rota
+responde 503, e o browser passa a consultar a contagem periodicamente.
+"""
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+SSE_STREAM_TIMEOUT = int(os.getenv("SSE_STREAM_TIMEOUT", "55"))
+SSE_KEEPALIVE = 15
+SSE_RETRY_MS = 3000
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "4"))
+
+_PENDING_KEY = "pending_events"
+
+
+class Subscription:
+    def __init__(self, channels, maxsize):
+        self.channels = tuple(channels)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.active = True
+
+    def put(self, item):
+        # Cliente lento: descarta o evento mais antigo em vez de bloquear quem publica
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+class EventHub:
+    def __init__(self, history=500, queue_size=100, max_streams=SSE_MAX_STREAMS):
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self._streams = 0
+        self._subscribers = {}
+        self._history = deque(maxlen=history)
+        # Ids crescentes mesmo entre reinícios, para o Last-Event-ID continuar válido
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event_name, data):
+        with self._lock:
+            item = (next(self._ids), event_name, data)
+            self._history.append((channel, item))
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(item)
+
+    def subscribe(self, channels, last_event_id=None):
+        """Nova subscrição, ou None se este processo já tem max_streams abertos."""
+        subscription = Subscription(channels, self.queue_size)
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+            if last_event_id is not None:
+                for channel, item in self._history:
+                    if item[0] > last_event_id and channel in subscription.channels:
+                        subscription.put(item)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if not subscription.active:
+                return
+            subscription.active = False
+            self._streams -= 1
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def stream(self, subscription, timeout=SSE_STREAM_TIMEOUT, keepalive=SSE_KEEPALIVE):
+        """
+        Gera o corpo text/event-stream. A ligação fecha ao fim de `timeout`
+        segundos; o EventSource do browser reconecta sozinho (com Last-Event-ID),
+        o que liberta periodicamente a thread do servidor.
+        """
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event_id, event_name, data = subscription.queue.get(timeout=min(keepalive, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: {event_name}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+event_hub = EventHub()
+
+
+def publish_after_commit(session, channel, event_name, data):
+    """Publica o evento só se a transação atual fizer commit."""
+    session.info.setdefault(_PENDING_KEY, []).append((channel, event_name, data))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_on_commit(session):
+    for channel, event_name, data in session.info.pop(_PENDING_KEY, ()):
+        event_hub.publish(channel, event_name, data)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,398 @@
+"""
+Escrita de notificações de interação (likes/comentários).
+
+As notificações por ler do mesmo (utilizador, tipo, imagem) são agregadas num
+único registo. Em Postgres e SQLite a agregação é um só INSERT ... SELECT ...
+ON CONFLICT DO UPDATE sobre o índice único parcial ux_notification_unread, que
+também filtra destinatários inexistentes ou com as notificações em pausa. Nada
+aqui faz commit: a escrita fica na transação de quem chama.
+
+Com NOTIFICATION_BUFFER_WINDOW > 0, os incrementos passam por um buffer de
+escrita diferida: são acumulados por processo durante a janela (depois do
+commit de quem chama) e escritos num único upsert multi-linha.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import String, case, cast, event, func, literal, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import Imagem, Notificacao, Notification, Utilizador, db
+from services.counter_service import (
+    adjust_unread_notifications,
+    recount_unread_notifications,
+    reconcile_unread_notifications,
+)
+from services.event_hub import publish_after_commit
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BUFFER_WINDOW = float(os.getenv("NOTIFICATION_BUFFER_WINDOW", "0"))
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_COMPACTION_INTERVAL = int(os.getenv("NOTIFICATION_COMPACTION_INTERVAL", "3600"))
+COMPACTION_BATCH_SIZE = 1000
+COMPACTION_MAX_BATCHES = 50
+
+_UPSERT_INSERTS = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def new_message(tipo, titulo_imagem):
+    if tipo == "like":
+        return f"A sua imagem '{titulo_imagem}' recebeu um novo like."
+    if tipo == "comentario":
+        return f"A sua imagem '{titulo_imagem}' recebeu um novo comentário."
+    return f"Nova interação na sua imagem '{titulo_imagem}'."
+
+
+def aggregated_message(tipo, titulo_imagem, count):
+    """Mensagem de um registo agregado; `count` pode ser uma expressão SQL."""
+    if tipo == "like":
+        suffix = " novos likes."
+    elif tipo == "comentario":
+        suffix = " novos comentários."
+    else:
+        return None
+    prefix = f"A sua imagem '{titulo_imagem}' recebeu "
+    if isinstance(count, int):
+        return f"{prefix}{count}{suffix}"
+    return literal(prefix) + cast(count, String) + literal(suffix)
+
+
+def _upsert(insert, id_utilizador, tipo, id_imagem, titulo_imagem, now):
+    table = Notification.__table__
+    eligible = select(
+        literal(id_utilizador),
+        literal(tipo),
+        literal(id_imagem),
+        literal(new_message(tipo, titulo_imagem)),
+        literal(1),
+        literal(False),
+        literal(now),
+    ).where(
+        Utilizador.id == id_utilizador,
+        or_(Utilizador.notifications_paused_until.is_(None), Utilizador.notifications_paused_until <= now),
+    )
+    stmt = insert(table).from_select(
+        [table.c.UserID, table.c.Type, table.c.ID_Imagem, table.c.Message,
+         table.c.Count, table.c.IsRead, table.c.CreatedAt],
+        eligible,
+    )
+    updates = {table.c.Count: table.c.Count + 1, table.c.CreatedAt: now}
+    message = aggregated_message(tipo, titulo_imagem, table.c.Count + 1)
+    if message is not None:
+        updates[table.c.Message] = message
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.UserID, table.c.Type, table.c.ID_Imagem],
+        index_where=table.c.IsRead == False,
+        set_=updates,
+    ).returning(table.c.Count)
+    # None = destinatário inexistente ou em pausa; 1 = registo novo
+    return db.session.execute(stmt).scalar()
+
+
+def _select_then_write(id_utilizador, tipo, id_imagem, titulo_imagem, now):
+    """Alternativa para outros motores: consulta e depois UPDATE ou INSERT."""
+    paused_until = (
+        db.session.query(Utilizador.notifications_paused_until).filter(Utilizador.id == id_utilizador).first()
+    )
+    if paused_until is None or (paused_until[0] and now < paused_until[0]):
+        return None
+    existente = Notification.query.filter_by(
+        id_utilizador=id_utilizador, type=tipo, id_imagem=id_imagem, is_read=False
+    ).with_for_update().first()
+    if existente:
+        existente.count += 1
+        existente.message = aggregated_message(tipo, titulo_imagem, existente.count) or existente.message
+        existente.created_at = now
+        return existente.count
+    db.session.add(Notification(
+        id_utilizador=id_utilizador,
+        type=tipo,
+        id_imagem=id_imagem,
+        message=new_message(tipo, titulo_imagem),
+        count=1,
+        is_read=False,
+        created_at=now,
+    ))
+    return 1
+
+
+def upsert_notification(id_utilizador, tipo, id_imagem, titulo_imagem):
+    """
+    Cria ou agrega a notificação na transação atual e mantém o contador de
+    notificações por ler. Devolve a contagem do registo (None se não notificou).
+    """
+    now = datetime.utcnow()
+    insert = _UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        count = _upsert(insert, id_utilizador, tipo, id_imagem, titulo_imagem, now)
+    else:
+        count = _select_then_write(id_utilizador, tipo, id_imagem, titulo_imagem, now)
+    if count == 1:
+        adjust_unread_notifications(id_utilizador, 1)
+    if count is not None:
+        publish_after_commit(db.session, f"user:{id_utilizador}", "notification", {
+            "type": tipo,
+            "id_imagem": id_imagem,
+            "message": new_message(tipo, titulo_imagem) if count == 1
+            else aggregated_message(tipo, titulo_imagem, count) or new_message(tipo, titulo_imagem),
+            "count": count,
+            "unread_delta": 1 if count == 1 else 0,
+        })
+    return count
+
+
+def deduplicate_unread_notifications():
+    """
+    Agrega as notificações por ler duplicadas de cada utilizador/tipo/imagem na
+    mais recente (soma as contagens) e marca as restantes como lidas, para que o
+    índice único parcial possa ser criado. Devolve quantas foram marcadas.
+    """
+    groups = (
+        db.session.query(func.max(Notification.id), func.sum(Notification.count), Notification.type,
+                         Notification.id_imagem)
+        .filter(Notification.is_read == False)
+        .group_by(Notification.id_utilizador, Notification.type, Notification.id_imagem)
+        .having(func.count(Notification.id) > 1)
+        .all()
+    )
+    if not groups:
+        return 0
+    titulos = dict(
+        db.session.query(Imagem.id, Imagem.titulo).filter(Imagem.id.in_({g[3] for g in groups if g[3]}))
+    )
+    for keep_id, total, tipo, id_imagem in groups:
+        values = {Notification.count: total}
+        message = aggregated_message(tipo, titulos.get(id_imagem, ""), int(total))
+        if message is not None:
+            values[Notification.message] = message
+        Notification.query.filter(Notification.id == keep_id).update(values, synchronize_session=False)
+
+    keep = (
+        select(func.max(Notification.id))
+        .where(Notification.is_read == False)
+        .group_by(Notification.id_utilizador, Notification.type, Notification.id_imagem)
+    )
+    return (
+        Notification.query.filter(Notification.is_read == False, ~Notification.id.in_(keep))
+        .update({Notification.is_read: True}, synchronize_session=False)
+    )
+
+
+# ---------------- retenção ----------------
+def _delete_read_before(model, cutoff, batch_size, max_batches):
+    """Apaga as notificações lidas anteriores a `cutoff`, um lote de IDs por transação."""
+    deleted = 0
+    for _ in range(max_batches):
+        ids = [
+            row.id
+            for row in model.query.with_entities(model.id)
+            .filter(model.is_read == True, model.created_at < cutoff)
+            .order_by(model.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+        deleted += model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def compact_notifications(
+    retention_days=NOTIFICATION_RETENTION_DAYS,
+    batch_size=COMPACTION_BATCH_SIZE,
+    max_batches=COMPACTION_MAX_BATCHES,
+):
+    """
+    Tarefa do agendador: apaga as notificações lidas com mais de `retention_days`
+    dias (tabelas notification e notificacao) em lotes limitados, para que cada
+    execução tenha um custo previsível; o que sobrar fica para a execução
+    seguinte. Também agrega duplicados por ler que tenham escapado ao índice
+    único parcial. Devolve um resumo do que foi feito.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    report = {
+        "notification": _delete_read_before(Notification, cutoff, batch_size, max_batches),
+        "notificacao": _delete_read_before(Notificacao, cutoff, batch_size, max_batches),
+        "duplicados": deduplicate_unread_notifications() or 0,
+    }
+    db.session.commit()
+    if report["duplicados"]:
+        reconcile_unread_notifications()
+    if any(report.values()):
+        logger.info(
+            "Compactação de notificações (retenção %d dias): %d notification e %d notificacao apagadas, "
+            "%d duplicados agregados.",
+            retention_days, report["notification"], report["notificacao"], report["duplicados"],
+        )
+    return report
+
+
+# ---------------- escrita diferida ----------------
+def _aggregated_message_sql(table, titulo, total):
+    prefix = literal("A sua imagem '") + titulo + literal("' recebeu ") + cast(total, String)
+    return case(
+        (table.c.Type == "like", prefix + literal(" novos likes.")),
+        (table.c.Type == "comentario", prefix + literal(" novos comentários.")),
+        else_=table.c.Message,
+    )
+
+
+def upsert_notifications_batch(increments):
+    """
+    Escreve um lote de incrementos {(utilizador, tipo, imagem): (n, titulo)} na
+    transação atual: um SELECT filtra destinatários em pausa/inexistentes e imagens
+    apagadas, um INSERT multi-linha ON CONFLICT soma os incrementos e um UPDATE
+    recalcula o contador de não lidas dos destinatários. Devolve as linhas escritas.
+    """
+    now = datetime.utcnow()
+    insert = _UPSERT_INSERTS.get(db.engine.dialect.name)
+    user_ids = {key[0] for key in increments}
+    image_ids = {key[2] for key in increments}
+    allowed_users = {
+        row.id
+        for row in Utilizador.query.with_entities(Utilizador.id)
+        .filter(Utilizador.id.in_(user_ids))
+        .filter(or_(Utilizador.notifications_paused_until.is_(None), Utilizador.notifications_paused_until <= now))
+    }
+    existing_images = {row.id for row in Imagem.query.with_entities(Imagem.id).filter(Imagem.id.in_(image_ids))}
+    rows = []
+    for (id_utilizador, tipo, id_imagem), (count, titulo) in increments.items():
+        if id_utilizador not in allowed_users or id_imagem not in existing_images:
+            continue
+        if insert is None:
+            for _ in range(count):
+                _select_then_write(id_utilizador, tipo, id_imagem, titulo, now)
+        rows.append({
+            "UserID": id_utilizador,
+            "Type": tipo,
+            "ID_Imagem": id_imagem,
+            "Message": new_message(tipo, titulo) if count == 1 else
+            (aggregated_message(tipo, titulo, count) or new_message(tipo, titulo)),
+            "Count": count,
+            "IsRead": False,
+            "CreatedAt": now,
+        })
+    if not rows:
+        return 0
+
+    if insert is not None:
+        table = Notification.__table__
+        stmt = insert(table).values(rows)
+        # Referência textual a excluded: via stmt.excluded o SQLAlchemy acrescentaria
+        # a tabela ao FROM da subconsulta
+        titulo = select(Imagem.titulo).where(Imagem.id == literal_column('excluded."ID_Imagem"')).scalar_subquery()
+        total = table.c.Count + stmt.excluded.Count
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.UserID, table.c.Type, table.c.ID_Imagem],
+            index_where=table.c.IsRead == False,
+            set_={
+                table.c.Count: total,
+                table.c.Message: _aggregated_message_sql(table, titulo, total),
+                table.c.CreatedAt: stmt.excluded.CreatedAt,
+            },
+        ))
+    recipients = {row["UserID"] for row in rows}
+    recount_unread_notifications(recipients)
+    for row in rows:
+        publish_after_commit(db.session, f"user:{row['UserID']}", "notification", {
+            "type": row["Type"], "id_imagem": row["ID_Imagem"], "message": row["Message"],
+        })
+    unread = Utilizador.query.with_entities(Utilizador.id, Utilizador.unread_notifications).filter(
+        Utilizador.id.in_(recipients)
+    )
+    for user_id, total in unread:
+        publish_after_commit(db.session, f"user:{user_id}", "unread", {"count": total or 0})
+    return len(rows)
+
+
+class NotificationBuffer:
+    """
+    Acumula incrementos por (destinatário, tipo, imagem) e escreve-os de `window`
+    em `window` segundos numa thread própria. No fim do processo (atexit) o que
+    estiver pendente é escrito antes de sair.
+    """
+
+    def __init__(self, window=NOTIFICATION_BUFFER_WINDOW):
+        self.window = window
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._app = None
+
+    @property
+    def enabled(self):
+        # Sem a thread de escrita (ex.: BACKGROUND_WORKERS=0) as notificações são escritas já
+        return self.window > 0 and self._app is not None
+
+    def add(self, id_utilizador, tipo, id_imagem, titulo_imagem, count=1):
+        key = (id_utilizador, tipo, id_imagem)
+        with self._lock:
+            previous, _ = self._pending.get(key, (0, None))
+            self._pending[key] = (previous + count, titulo_imagem)
+
+    def start(self, app):
+        """Arranca (uma vez por processo) a thread de escrita e o hook de saída."""
+        if self.window <= 0 or self._app is not None:
+            return
+        self._app = app
+        threading.Thread(target=self._loop, daemon=True, name="notification-buffer").start()
+        atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.window)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self._app is None:
+            return 0
+        with self._app.app_context():
+            try:
+                written = upsert_notifications_batch(pending)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.exception("Erro ao escrever %d notificações agregadas: %s", len(pending), e)
+                return 0
+        logger.debug(
+            "Buffer de notificações: %d incrementos escritos em %d linhas.",
+            sum(count for count, _ in pending.values()), written,
+        )
+        return written
+
+
+notification_buffer = NotificationBuffer()
+
+_PENDING_KEY = "pending_notifications"
+
+
+def enqueue_notification(id_utilizador, tipo, id_imagem, titulo_imagem):
+    """
+    Regista a notificação na transação atual. Com o buffer ativo só entra no
+    buffer depois do commit (um rollback descarta-a); sem buffer é escrita já.
+    """
+    if not notification_buffer.enabled:
+        return upsert_notification(id_utilizador, tipo, id_imagem, titulo_imagem)
+    db.session.info.setdefault(_PENDING_KEY, []).append((id_utilizador, tipo, id_imagem, titulo_imagem))
+    return None
+
+
+@event.listens_for(Session, "after_commit")
+def _buffer_on_commit(session):
+    for item in session.info.pop(_PENDING_KEY, ()):
+        notification_buffer.add(*item)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
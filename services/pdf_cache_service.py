@@ -0,0 +1,41 @@
+"""
+Cache de PDFs endereçada pelo conteúdo.
+
+O nome do PDF inclui o hash do HTML que lhe deu origem, por isso o mesmo HTML
+corresponde sempre ao mesmo ficheiro: se já existe em static/pdf é servido
+diretamente (com ETag = hash), senão é gerado uma vez. As variantes antigas de
+cada prefixo são removidas, mantendo as PDF_CACHE_KEEP mais recentes.
+"""
+import glob
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_KEEP = int(os.getenv("PDF_CACHE_KEEP", "3"))
+
+
+def content_digest(html):
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+
+def cached_pdf_path(folder, prefix, digest):
+    return os.path.join(folder, f"{prefix}-{digest[:16]}.pdf")
+
+
+def evict_stale_variants(folder, prefix, keep=PDF_CACHE_KEEP):
+    """Apaga as variantes `prefix-<hash>.pdf` além das `keep` mais recentes; devolve quantas apagou."""
+    variants = sorted(
+        glob.glob(os.path.join(folder, f"{glob.escape(prefix)}-*.pdf")),
+        key=lambda path: os.path.getmtime(path),
+        reverse=True,
+    )
+    removed = 0
+    for path in variants[keep:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            logger.warning("Não foi possível remover o PDF em cache %s: %s", path, e)
+    return removed
@@ -0,0 +1,330 @@
+"""
+Fila de trabalhos de exportação para PDF (catálogo, catálogo de exposição e
+certificados).
+
+A rota gera o HTML, regista um PdfJob e responde logo com o id do trabalho; a
+conversão (CloudConvert, dezenas de segundos) corre num conjunto fixo de
+threads (PDF_WORKERS) fora do ciclo do pedido. O estado e o progresso ficam na
+tabela pdf_job, por isso qualquer worker do gunicorn responde ao pedido de
+estado e serve o PDF final a partir do disco.
+
+Cada trabalho tem o seu HTML temporário (PDF_TEMP_FOLDER/<tipo>-<id>.html) e
+converte para um ficheiro .part ao lado do destino, que só no fim é renomeado
+(atomicamente) para o nome final: pedidos concorrentes não se pisam e quem
+descarrega vê sempre um PDF completo. O HTML e o .part são apagados no fim da
+conversão; cleanup_pdf_files apaga os que ficaram de processos que morreram e os
+registos antigos.
+
+Os trabalhos em lote (enqueue_pdf_batch_job, p. ex. os certificados de todos os
+autores de uma exposição) guardam os HTML numa pasta; o worker converte-os em
+paralelo (PDF_BATCH_CONCURRENCY de cada vez) com o mesmo conversor e entrega
+um .zip com os PDFs.
+"""
+import atexit
+import glob
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import PdfJob, db
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_POLL_INTERVAL = 5
+# Trabalhos "a_processar" sem progresso (started_at) há mais do que isto pertencem a um processo que morreu
+PDF_JOB_TIMEOUT = 900
+PDF_TEMP_FOLDER = os.path.join("temp", "pdf")
+PDF_CLEANUP_INTERVAL = int(os.getenv("PDF_CLEANUP_INTERVAL", "3600"))
+PDF_JOB_RETENTION_DAYS = int(os.getenv("PDF_JOB_RETENTION_DAYS", "7"))
+PDF_BATCH_CONCURRENCY = int(os.getenv("PDF_BATCH_CONCURRENCY", "4"))
+
+ACTIVE_STATUSES = ("pendente", "a_processar")
+_WAKE_KEY = "pdf_jobs_wake"
+
+
+def enqueue_pdf_job(tipo, chave, html, pdf_path, id_utilizador=None):
+    """
+    Regista a conversão do HTML `html` para `pdf_path` (com commit). Se já houver
+    um trabalho ativo para a mesma chave, devolve esse em vez de criar outro.
+    """
+    existente = _active_job(chave)
+    if existente:
+        return existente
+    job_id = uuid.uuid4().hex
+    os.makedirs(PDF_TEMP_FOLDER, exist_ok=True)
+    html_path = os.path.join(PDF_TEMP_FOLDER, f"{tipo}-{job_id}.html")
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return _add_job(job_id, tipo, chave, html_path, pdf_path, id_utilizador)
+
+
+def enqueue_pdf_batch_job(tipo, chave, documentos, zip_path, id_utilizador=None):
+    """
+    Como enqueue_pdf_job, mas para vários documentos: `documentos` é um iterável
+    de (nome, html) e o resultado é um .zip com um `nome`.pdf por documento.
+    """
+    existente = _active_job(chave)
+    if existente:
+        return existente
+    job_id = uuid.uuid4().hex
+    html_dir = os.path.join(PDF_TEMP_FOLDER, f"{tipo}-{job_id}")
+    os.makedirs(html_dir)
+    for nome, html in documentos:
+        with open(os.path.join(html_dir, f"{nome}.html"), "w", encoding="utf-8") as f:
+            f.write(html)
+    return _add_job(job_id, tipo, chave, html_dir, zip_path, id_utilizador)
+
+
+def _active_job(chave):
+    return (
+        PdfJob.query.filter(PdfJob.chave == chave, PdfJob.status.in_(ACTIVE_STATUSES))
+        .order_by(PdfJob.created_at.desc())
+        .first()
+    )
+
+
+def _add_job(job_id, tipo, chave, html_path, pdf_path, id_utilizador):
+    job = PdfJob(
+        id=job_id,
+        tipo=tipo,
+        chave=chave,
+        status="pendente",
+        progresso=0,
+        html_path=html_path,
+        pdf_path=pdf_path,
+        id_utilizador=id_utilizador,
+    )
+    db.session.add(job)
+    db.session.info[_WAKE_KEY] = True
+    db.session.commit()
+    return job
+
+
+def _remove_quietly(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Não foi possível apagar %s: %s", path, e)
+
+
+def cleanup_pdf_files(pdf_folder):
+    """
+    Apaga HTML temporários (e pastas de lotes) e ficheiros .part com mais de PDF_JOB_TIMEOUT
+    segundos (ficam de processos que morreram a meio) e os registos de
+    trabalhos terminados há mais de PDF_JOB_RETENTION_DAYS dias. Os ficheiros de
+    trabalhos ainda pendentes ou em curso nunca são apagados, seja qual for a idade.
+    """
+    cutoff = time.time() - PDF_JOB_TIMEOUT
+    active = PdfJob.query.with_entities(PdfJob.html_path, PdfJob.pdf_path).filter(
+        PdfJob.status.in_(ACTIVE_STATUSES)
+    ).all()
+    active_html = {os.path.normpath(row.html_path) for row in active}
+    active_parts = tuple(f"{os.path.normpath(row.pdf_path)}." for row in active)
+    removed = 0
+    for path in glob.glob(os.path.join(PDF_TEMP_FOLDER, "*")) + glob.glob(os.path.join(pdf_folder, "*.part")):
+        path = os.path.normpath(path)
+        if path in active_html or (active_parts and path.startswith(active_parts)):
+            continue
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+        except OSError:
+            continue
+        _remove_quietly(path)
+        removed += 1
+    jobs = PdfJob.query.filter(
+        PdfJob.status.notin_(ACTIVE_STATUSES),
+        PdfJob.finished_at < datetime.utcnow() - timedelta(days=PDF_JOB_RETENTION_DAYS),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    if removed or jobs:
+        logger.info("Limpeza de PDFs: %d ficheiros temporários e %d trabalhos antigos apagados", removed, jobs)
+    return {"ficheiros": removed, "trabalhos": jobs}
+
+
+def serialize_job(job):
+    return {
+        "id": job.id,
+        "tipo": job.tipo,
+        "status": job.status,
+        "progresso": job.progresso,
+        "erro": job.erro,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class PdfJobRunner:
+    def __init__(self, size=PDF_WORKERS):
+        self.size = size
+        self._app = None
+        self._converter = None
+        self._threads = []
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self, app, converter):
+        """
+        Arranca as threads (uma vez por processo). `converter(html_path, pdf_path,
+        progresso)` faz a conversão e lança uma exceção se falhar.
+        """
+        if self.size <= 0 or self._app is not None:
+            return
+        self._app = app
+        self._converter = converter
+        for i in range(self.size):
+            thread = threading.Thread(target=self._loop, daemon=True, name=f"pdf-worker-{i}")
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        # Um trabalho interrompido fica "a_processar" e volta à fila após PDF_JOB_TIMEOUT
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.exception("Erro no worker de PDF: %s", e)
+                processed = False
+            if not processed:
+                self._wake.wait(PDF_POLL_INTERVAL)
+                self._wake.clear()
+
+    def run_once(self):
+        """Reserva e converte um trabalho; devolve False se a fila estiver vazia."""
+        with self._app.app_context():
+            job_id = self._claim()
+            if job_id is None:
+                return False
+            self._process(job_id)
+            return True
+
+    def _claim(self):
+        now = datetime.utcnow()
+        PdfJob.query.filter(
+            PdfJob.status == "a_processar", PdfJob.started_at < now - timedelta(seconds=PDF_JOB_TIMEOUT)
+        ).update({PdfJob.status: "pendente"}, synchronize_session=False)
+        candidates = [
+            row.id
+            for row in PdfJob.query.with_entities(PdfJob.id)
+            .filter(PdfJob.status == "pendente")
+            .order_by(PdfJob.created_at)
+            .limit(5)
+        ]
+        for job_id in candidates:
+            # UPDATE condicional: só um worker (de qualquer processo) ganha cada trabalho
+            won = PdfJob.query.filter(PdfJob.id == job_id, PdfJob.status == "pendente").update(
+                {PdfJob.status: "a_processar", PdfJob.started_at: now, PdfJob.progresso: 5},
+                synchronize_session=False,
+            )
+            if won:
+                db.session.commit()
+                return job_id
+        db.session.commit()
+        return None
+
+    def _progress(self, job_id, value):
+        # started_at serve também de sinal de vida: um trabalho que avança não volta à fila
+        PdfJob.query.filter(PdfJob.id == job_id).update(
+            {PdfJob.progresso: value, PdfJob.started_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def _process(self, job_id):
+        job = db.session.get(PdfJob, job_id)
+        html_path, pdf_path = job.html_path, job.pdf_path
+        db.session.commit()
+        part_path = f"{pdf_path}.{uuid.uuid4().hex}.part"
+        erro = None
+        try:
+            if os.path.isdir(html_path):
+                erro = self._convert_batch(job_id, html_path, part_path)
+            else:
+                self._converter(html_path, part_path, lambda value: self._progress(job_id, value))
+            os.replace(part_path, pdf_path)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Trabalho de PDF %s falhou: %s", job_id, e)
+            values = {PdfJob.status: "falhado", PdfJob.erro: str(e)[:500]}
+        else:
+            values = {PdfJob.status: "concluido", PdfJob.progresso: 100, PdfJob.erro: erro}
+        finally:
+            _remove_quietly(part_path)
+            _remove_quietly(html_path)
+        values[PdfJob.finished_at] = datetime.utcnow()
+        PdfJob.query.filter(PdfJob.id == job_id).update(values, synchronize_session=False)
+        db.session.commit()
+
+    def _convert_batch(self, job_id, html_dir, zip_path):
+        """
+        Converte todos os HTML de `html_dir` e junta os PDFs em `zip_path`. Se só
+        alguns falharem, o zip leva os restantes e devolve-se a mensagem de erro;
+        se falharem todos, lança uma exceção.
+        """
+        nomes = sorted(f[:-len(".html")] for f in os.listdir(html_dir) if f.endswith(".html"))
+        if not nomes:
+            raise RuntimeError("Não há documentos para converter")
+        falhados = set()
+        # Threads só para esperar pelo conversor (o trabalho pesado é do pool de processos ou da API)
+        with ThreadPoolExecutor(max_workers=PDF_BATCH_CONCURRENCY, thread_name_prefix=f"pdf-lote-{job_id[:8]}") as pool:
+            futures = {
+                pool.submit(self._converter, os.path.join(html_dir, f"{nome}.html"),
+                            os.path.join(html_dir, f"{nome}.pdf"), lambda _: None): nome
+                for nome in nomes
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    future.result()
+                except Exception as e:
+                    falhados.add(futures[future])
+                    logger.warning("Documento %s do lote %s falhou: %s", futures[future], job_id, e)
+                # Um registo por documento: progresso e sinal de vida para lotes que passam de PDF_JOB_TIMEOUT
+                self._progress(job_id, 5 + 85 * done // len(nomes))
+        if len(falhados) == len(nomes):
+            raise RuntimeError(f"Falharam todos os {len(nomes)} documentos")
+        # Os PDFs já vêm comprimidos: guardar sem recomprimir
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zf:
+            for nome in nomes:
+                if nome not in falhados:
+                    zf.write(os.path.join(html_dir, f"{nome}.pdf"), f"{nome}.pdf")
+        if falhados:
+            return f"{len(falhados)} de {len(nomes)} documentos falharam: {', '.join(sorted(falhados))}"[:500]
+        return None
+
+
+pdf_jobs = PdfJobRunner()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_on_commit(session):
+    if session.info.pop(_WAKE_KEY, False):
+        pdf_jobs.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_WAKE_KEY, None)
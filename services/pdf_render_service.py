@@ -0,0 +1,118 @@
+"""
+Motores de conversão HTML → PDF usados por html_para_pdf.
+
+PDF_RENDERER escolhe o motor:
+  - "weasyprint": conversão local com o WeasyPrint, sem ida e volta pela rede.
+    Corre num pool de PDF_RENDER_PROCESSES processos (0 = no próprio processo),
+    porque o render é CPU e seguraria o GIL dos workers do gunicorn.
+  - "cloudconvert": a API do CloudConvert (upload, espera, download).
+  - "auto" (omissão): WeasyPrint se estiver instalado com as bibliotecas do
+    sistema de que precisa (Pango), CloudConvert caso contrário.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+PDF_RENDER_PROCESSES = int(os.getenv("PDF_RENDER_PROCESSES", "2"))
+PDF_RENDER_TIMEOUT = 300
+
+
+def _weasyprint_convert(html_path, pdf_path):
+    from weasyprint import HTML
+
+    HTML(filename=html_path).write_pdf(pdf_path)
+
+
+class CloudConvertRenderer:
+    """Conversão remota pela API do CloudConvert (CLOUDCONVERT_API_KEY)."""
+
+    def render(self, html_path, pdf_path, progresso):
+        from cloudconvert_service import html_para_pdf as cloudconvert_para_pdf
+
+        cloudconvert_para_pdf(html_path, pdf_path, progresso)
+
+
+class WeasyPrintRenderer:
+    """Conversão local com o WeasyPrint; o pool de processos é criado no primeiro uso."""
+
+    def __init__(self, processes=None):
+        self.processes = PDF_RENDER_PROCESSES if processes is None else processes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        try:
+            import weasyprint  # noqa: F401
+        except (ImportError, OSError):
+            return False
+        return True
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: este processo já tem threads (workers de PDF e de e-mail) e fork não é seguro
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+                atexit.register(self.shutdown)
+            return self._pool
+
+    def render(self, html_path, pdf_path, progresso):
+        progresso(10)
+        if self.processes <= 0:
+            _weasyprint_convert(html_path, pdf_path)
+            return
+        try:
+            self._executor().submit(_weasyprint_convert, html_path, pdf_path).result(timeout=PDF_RENDER_TIMEOUT)
+        except BrokenProcessPool:
+            # Um processo morreu (p. ex. sem memória): o próximo pedido cria um pool novo
+            with self._lock:
+                self._pool = None
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+PDF_RENDERERS = {
+    "weasyprint": WeasyPrintRenderer,
+    "cloudconvert": CloudConvertRenderer,
+}
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """Motor escolhido por PDF_RENDERER (auto, weasyprint ou cloudconvert)."""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            name = os.getenv("PDF_RENDERER", "auto").lower()
+            if name == "auto":
+                name = "weasyprint" if WeasyPrintRenderer.available() else "cloudconvert"
+            if name not in PDF_RENDERERS:
+                raise RuntimeError(f"PDF_RENDERER desconhecido: {name}")
+            logger.info("Conversão de PDF com o motor %s", name)
+            _renderer = PDF_RENDERERS[name]()
+        return _renderer
+
+
+def set_renderer(renderer):
+    """Troca o motor em uso; devolve o anterior."""
+    global _renderer
+    with _renderer_lock:
+        previous, _renderer = _renderer, renderer
+    return previous
+
+
+def html_para_pdf(html_path, pdf_path, progresso=None):
+    """Converte o HTML em PDF com o motor configurado; `progresso(percentagem)` é chamado entre as etapas."""
+    get_renderer().render(html_path, pdf_path, progresso or (lambda _: None))
@@ -0,0 +1,41 @@
+"""
+Contagem de consultas SQL por pedido.
+
+Cada instrução executada dentro de um pedido incrementa g.sql_queries; no fim do
+pedido, as rotas acima do limite (SQL_QUERY_WARN_THRESHOLD) ficam registadas no
+log, o que torna visíveis regressões N+1 em produção.
+"""
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQL_QUERY_WARN_THRESHOLD = 30
+
+
+def _count_query(*_args):
+    # Threads em background (agendador, envios) não têm pedido associado
+    if has_request_context():
+        g.sql_queries = g.get("sql_queries", 0) + 1
+
+
+def init_query_counter(app, threshold=SQL_QUERY_WARN_THRESHOLD):
+    """Instala a contagem na app; threshold <= 0 desativa os avisos (a contagem mantém-se)."""
+    if not event.contains(Engine, "before_cursor_execute", _count_query):
+        event.listen(Engine, "before_cursor_execute", _count_query)
+
+    @app.before_request
+    def _start_query_count():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _report_query_count(response):
+        total = g.get("sql_queries", 0)
+        if threshold > 0 and total > threshold:
+            elapsed = (time.perf_counter() - g.get("request_started", time.perf_counter())) * 1000
+            app.logger.warning(
+                "Rota %s (%s %s) executou %d consultas SQL em %.0f ms (limite %d).",
+                request.endpoint, request.method, request.path, total, elapsed, threshold,
+            )
+        return response
@@ -1,31 +1,89 @@
-from collections import Counter
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
 from datetime import datetime, timedelta
 
+import numpy as np
+from scipy import sparse
 from sqlalchemy import desc, func
 
 from models import Comentario, Exposicao, Imagem, Reacao, Utilizador, db
+from services.collaborative_service import collaborative_index
+from services.stats_service import global_stats
 
 
 def split_tags(value):
     return [tag.strip().lower() for tag in (value or "").split(",") if tag.strip()]
 
 
-def _counts_by_image(model, image_ids):
-    if not image_ids:
-        return {}
-    rows = (
-        db.session.query(model.id_imagem, func.count(model.id).label("total"))
-        .filter(model.id_imagem.in_(image_ids))
-        .group_by(model.id_imagem)
-        .all()
-    )
-    return {image_id: int(total) for image_id, total in rows}
+class InteractionProfileCache:
+    """
+    Cache LRU com TTL dos perfis de interação, indexado pelo id do utilizador.
+    É local a cada processo: as invalidações feitas num worker não chegam aos
+    outros, pelo que o TTL limita o tempo máximo de um perfil desatualizado.
+    """
+
+    def __init__(self, max_size=1024, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, profile = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return profile
+
+    def set(self, user_id, profile):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+profile_cache = InteractionProfileCache(
+    max_size=int(os.getenv("PROFILE_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("PROFILE_CACHE_TTL", "600")),
+)
+
+
+def invalidate_interaction_profile(user_id):
+    """Deve ser chamado depois de o utilizador criar ou remover uma Reacao/Comentario."""
+    if user_id:
+        profile_cache.invalidate(user_id)
 
 
 def _interaction_profile(user):
     if not user:
         return Counter(), Counter(), Counter(), set()
 
+    profile = profile_cache.get(user.id)
+    if profile is None:
+        profile = _load_interaction_profile(user)
+        profile_cache.set(user.id, profile)
+    return profile
+
+
+def _load_interaction_profile(user):
+
     liked_ids = [
         row.id_imagem
         for row in Reacao.query.filter_by(id_utilizador=user.id, tipo="like")
@@ -65,6 +123,229 @@ def _interaction_profile(user):
     return category_weights, tag_weights, author_weights, interacted_ids
 
 
+# Colunas lidas para pontuar candidatos sem hidratar objetos Imagem
+_CANDIDATE_COLUMNS = (
+    Imagem.id,
+    Imagem.id_categoria,
+    Imagem.id_utilizador,
+    Imagem.tags,
+    Imagem.likes_count,
+    # Só comentários aprovados (como em /api/imagens/<id>): pendentes e bloqueados
+    # pela moderação não contam para a popularidade
+    Imagem.comments_count,
+    Imagem.data_upload,
+)
+
+# Data usada no desempate quando data_upload é nula (negável sem overflow)
+_MIN_TIMESTAMP = np.iinfo(np.int64).min + 1
+_shuffle_day = None
+_shuffle_factors = {}
+_shuffle_lock = threading.Lock()
+
+
+def _daily_shuffle_factors(image_ids, today_str):
+    """
+    Multiplicador de reset diário (fator entre 0.8 e 1.2) derivado de um SHA-256
+    do id e do dia. O valor só muda uma vez por dia, por isso é memorizado.
+    """
+    global _shuffle_day, _shuffle_factors
+    with _shuffle_lock:
+        if _shuffle_day != today_str:
+            _shuffle_day = today_str
+            _shuffle_factors = {}
+        factors = _shuffle_factors
+        for image_id in image_ids:
+            if image_id not in factors:
+                hash_val = hashlib.sha256(f"{image_id}-{today_str}".encode()).hexdigest()
+                factors[image_id] = 0.8 + (int(hash_val[:6], 16) % 401) / 1000.0
+        return np.fromiter((factors[image_id] for image_id in image_ids), dtype=np.float64, count=len(image_ids))
+
+
+class _CandidateFeatureCache:
+    """
+    Guarda, por id de imagem, as features que não dependem do utilizador: as
+    tags já codificadas num vocabulário global e a data de upload em
+    microssegundos. Assim cada pedido só faz aritmética sobre arrays.
+    """
+
+    def __init__(self, max_size=50000):
+        self.max_size = max_size
+        self.vocab = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _encode_tags(self, value):
+        return tuple(self.vocab.setdefault(tag, len(self.vocab)) for tag in split_tags(value))
+
+    def encode(self, ids, tags, uploads):
+        with self._lock:
+            if len(self._entries) + len(ids) > self.max_size:
+                # Novos objetos (e não clear) para não afetar pedidos em curso
+                self._entries = {}
+                self.vocab = {}
+            entries = self._entries
+            vocab = self.vocab
+            encoded = []
+            for image_id, value, upload in zip(ids, tags, uploads):
+                entry = entries.get(image_id)
+                if entry is None or entry[0] != value or entry[1] != upload:
+                    upload_us = (
+                        int(np.datetime64(upload, "us").astype(np.int64)) if upload is not None else None
+                    )
+                    entry = (value, upload, self._encode_tags(value), upload_us)
+                    entries[image_id] = entry
+                encoded.append(entry)
+
+        n = len(encoded)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(
+            np.fromiter((len(entry[2]) for entry in encoded), dtype=np.int64, count=n),
+            out=indptr[1:],
+        )
+        indices = np.fromiter(
+            (tag_id for entry in encoded for tag_id in entry[2]), dtype=np.int64, count=int(indptr[-1])
+        )
+        has_upload = np.fromiter((entry[3] is not None for entry in encoded), dtype=bool, count=n)
+        upload_us = np.fromiter(
+            (entry[3] if entry[3] is not None else 0 for entry in encoded), dtype=np.int64, count=n
+        )
+        return indptr, indices, vocab, has_upload, upload_us
+
+
+_feature_cache = _CandidateFeatureCache()
+
+
+# Peso da similaridade item-item ("quem gostou disto também gostou")
+COLLABORATIVE_WEIGHT = 30.0
+
+
+def _score_candidates(rows, category_weights, tag_weights, author_weights, media_curtidas, now,
+                      collaborative_scores=None):
+    """
+    Pontua todos os candidatos numa só passagem vetorizada.
+    `rows` são tuplos com as colunas de _CANDIDATE_COLUMNS e `collaborative_scores`
+    um dict opcional id -> similaridade acumulada do índice item-item. Devolve o
+    vetor de pontuações e as componentes necessárias para construir os motivos.
+    """
+    n = len(rows)
+    ids, cat_ids, author_ids, tags, likes, comments, uploads = zip(*rows)
+    indptr, indices, vocab, has_upload, upload_us = _feature_cache.encode(ids, tags, uploads)
+    vocab_size = int(indices.max()) + 1 if len(indices) else 0
+
+    # 1. Correspondência de Categoria (Afinidade)
+    category_score = np.fromiter((category_weights.get(c, 0) for c in cat_ids), dtype=np.float64, count=n)
+
+    # 2. Correspondência de Tags (Afinidade): matriz esparsa imagem x tag (vocabulário global)
+    tag_vector = np.zeros(vocab_size, dtype=np.float64)
+    fav_vector = np.zeros(vocab_size, dtype=np.float64)
+    in_profile = np.zeros(vocab_size, dtype=np.float64)
+    for tag, weight in tag_weights.items():
+        idx = vocab.get(tag)
+        if idx is not None and idx < vocab_size:
+            tag_vector[idx] = weight
+            in_profile[idx] = 1.0
+    for tag, _ in tag_weights.most_common(3):
+        idx = vocab.get(tag)
+        if idx is not None and idx < vocab_size:
+            fav_vector[idx] = 1.0
+    tag_matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float64), indices, indptr),
+        shape=(n, vocab_size),
+    )
+    tag_score = tag_matrix @ tag_vector
+    has_tags = (tag_matrix @ in_profile) > 0
+    has_fav_tag = (tag_matrix @ fav_vector) > 0
+
+    # 3. Correspondência de Autor (Afinidade)
+    author_score = np.fromiter((author_weights.get(a, 0) for a in author_ids), dtype=np.float64, count=n)
+
+    # 4. Métricas de Popularidade Global vs Média de Curtidas
+    likes = np.fromiter((l or 0 for l in likes), dtype=np.float64, count=n)
+    comments = np.fromiter((c or 0 for c in comments), dtype=np.float64, count=n)
+    like_bonus = np.where(
+        likes > media_curtidas,
+        (likes - media_curtidas) * 5.0,
+        np.where(likes > 0, (likes / max(0.1, media_curtidas)) * 2.0, 0.0),
+    )
+
+    score = category_score * 5.0
+    score = score + tag_score * 4.0
+    score = score + np.where(has_fav_tag, 8.0, 0.0)
+    score = score + author_score * 3.0
+    score = score + like_bonus
+    score = score + (likes * 2.5 + comments * 1.5)
+
+    # Vizinhos colaborativos das obras com que o utilizador interagiu
+    collaborative_scores = collaborative_scores or {}
+    collaborative = np.fromiter(
+        (collaborative_scores.get(i, 0.0) for i in ids), dtype=np.float64, count=n
+    )
+    score = score + collaborative * COLLABORATIVE_WEIGHT
+
+    # 5. Decaimento Temporal (Boost de Frescura vs Obras Lendárias)
+    now_us = np.datetime64(now, "us").astype(np.int64)
+    age_days = np.where(has_upload, (now_us - upload_us) // 86_400_000_000, 30)
+    score = score * (1.0 / (1.0 + 0.03 * np.maximum(0, age_days)))
+
+    # 6. Multiplicador de Reset Diário
+    score = score * _daily_shuffle_factors(ids, now.strftime("%Y-%m-%d"))
+
+    components = {
+        "ids": ids,
+        "upload_us": np.where(has_upload, upload_us, _MIN_TIMESTAMP),
+        "category_score": category_score,
+        "has_tags": has_tags,
+        "author_score": author_score,
+        "collaborative": collaborative,
+        "likes": likes,
+        "age_days": age_days,
+    }
+    return score, components
+
+
+def _top_k(score, upload_us, k):
+    """
+    Índices dos k melhores candidatos, por pontuação e depois data decrescentes
+    (empates finais mantêm a ordem original, como um sort estável).
+    """
+    n = len(score)
+    if n > k:
+        threshold = np.partition(score, n - k)[n - k]
+        selected = np.nonzero(score >= threshold)[0]
+    else:
+        selected = np.arange(n)
+    order = np.lexsort((selected, -upload_us[selected], -score[selected]))
+    return selected[order][:k]
+
+
+def _reason_for(idx, components, media_curtidas):
+    reasons = []
+    if components["category_score"][idx]:
+        reasons.append("categoria favorita")
+    if components["has_tags"][idx]:
+        reasons.append("temas relacionados")
+    if components["author_score"][idx]:
+        reasons.append("artista que gostas")
+    if components["collaborative"][idx]:
+        reasons.append("gostos em comum")
+    likes = components["likes"][idx]
+    if likes > media_curtidas:
+        reasons.append("acima da média de curtidas")
+    elif likes > 0:
+        reasons.append("obra recomendada")
+    if likes >= 3:
+        reasons.append("popular na comunidade")
+    if components["age_days"][idx] <= 5:
+        reasons.append("novidade recente")
+
+    # Adicionar fallback de motivo
+    if not reasons:
+        reasons.append("sugestão ArteNuvem")
+
+    # Limitar a 2 motivos para não encher a UI
+    return " · ".join(reasons[:2])
+
+
 def build_recommendations(user=None, limit=12):
     category_weights, tag_weights, author_weights, interacted_ids = _interaction_profile(user)
 
@@ -77,123 +358,52 @@ def build_recommendations(user=None, limit=12):
     # Se o utilizador não tem histórico de interação (ex: novo registo),
     # carregamos os candidatos ordenados por número de gostos para destacar o melhor conteúdo.
     if not interacted_ids:
-        candidates_query = (
-            db.session.query(Imagem)
-            .outerjoin(Reacao, (Reacao.id_imagem == Imagem.id) & (Reacao.tipo == "like"))
-            .filter(Imagem.publica == True)
-        )
-        if user:
-            candidates_query = candidates_query.filter(Imagem.id_utilizador != user.id)
-            
-        candidates = (
-            candidates_query.group_by(Imagem.id)
-            .order_by(func.count(Reacao.id).desc(), Imagem.data_upload.desc())
-            .limit(200)
-            .all()
+        query = query.order_by(Imagem.likes_count.desc(), Imagem.data_upload.desc()).limit(200)
+    else:
+        query = query.order_by(Imagem.data_upload.desc()).limit(1000)
+    rows = query.with_entities(*_CANDIDATE_COLUMNS).all()
+
+    # Vizinhos item-item: O(k) por obra semente, mesmo fora dos candidatos recentes
+    collaborative_scores = collaborative_index.scores_for(
+        sorted(interacted_ids, reverse=True), exclude=interacted_ids
+    )
+    if collaborative_scores:
+        known_ids = {row[0] for row in rows}
+        extra_ids = [image_id for image_id in collaborative_scores if image_id not in known_ids]
+        if extra_ids:
+            extra_query = Imagem.query.filter(Imagem.publica == True, Imagem.id.in_(extra_ids))
+            if user:
+                extra_query = extra_query.filter(Imagem.id_utilizador != user.id)
+            rows += extra_query.with_entities(*_CANDIDATE_COLUMNS).all()
+
+    # Média global de curtidas dos posts públicos (cache partilhada, sem contagens por pedido)
+    media_curtidas = global_stats.media_curtidas()
+
+    if rows:
+        score, components = _score_candidates(
+            rows, category_weights, tag_weights, author_weights, media_curtidas, datetime.utcnow(),
+            collaborative_scores=collaborative_scores,
         )
+        top = _top_k(score, components["upload_us"], limit)
+        top_ids = [components["ids"][idx] for idx in top]
+        # Só as imagens finais são carregadas como objetos e só elas recebem motivos
+        by_id = {image.id: image for image in Imagem.query.filter(Imagem.id.in_(top_ids)).all()}
+        images = [by_id[image_id] for image_id in top_ids if image_id in by_id]
+        reasons = {
+            components["ids"][idx]: _reason_for(idx, components, media_curtidas)
+            for idx in top
+        }
     else:
-        candidates = query.order_by(Imagem.data_upload.desc()).limit(1000).all()
-
-    image_ids = [image.id for image in candidates]
-    likes = _counts_by_image(Reacao, image_ids)
-    comments = _counts_by_image(Comentario, image_ids)
-
-    # Calcular a média global de curtidas dos posts públicos
-    total_public_posts = Imagem.query.filter_by(publica=True).count()
-    total_public_likes = Reacao.query.filter_by(tipo="like").count()
-    media_curtidas = total_public_likes / max(1, total_public_posts)
-
-    import hashlib
-    today_str = datetime.utcnow().strftime("%Y-%m-%d")
-
-    scored = []
-    now = datetime.utcnow()
-    # Top 3 tags mais interagidas para bónus de afinidade
-    fav_tags = [t[0] for t in tag_weights.most_common(3)]
-
-    for image in candidates:
-        score = 0.0
-        reasons = []
-
-        # 1. Correspondência de Categoria (Afinidade)
-        category_score = category_weights.get(image.id_categoria, 0)
-        if category_score:
-            score += category_score * 5.0
-            reasons.append("categoria favorita")
-
-        # 2. Correspondência de Tags (Afinidade)
-        image_tags = split_tags(image.tags)
-        matched_tags = [tag for tag in image_tags if tag in tag_weights]
-        if matched_tags:
-            score += sum(tag_weights[tag] for tag in matched_tags) * 4.0
-            reasons.append("temas relacionados")
-            # Bónus extra se a tag for uma das top 3 favoritas
-            if any(t in fav_tags for t in matched_tags):
-                score += 8.0
-
-        # 3. Correspondência de Autor (Afinidade)
-        author_score = author_weights.get(image.id_utilizador, 0)
-        if author_score:
-            score += author_score * 3.0
-            reasons.append("artista que gostas")
-
-        # 4. Métricas de Popularidade Global vs Média de Curtidas
-        likes_score = likes.get(image.id, 0)
-        comments_score = comments.get(image.id, 0)
-        
-        if likes_score > media_curtidas:
-            score += (likes_score - media_curtidas) * 5.0
-            reasons.append("acima da média de curtidas")
-        elif likes_score > 0:
-            score += (likes_score / max(0.1, media_curtidas)) * 2.0
-            reasons.append("obra recomendada")
-            
-        popularity_score = likes_score * 2.5 + comments_score * 1.5
-        score += popularity_score
-        if likes_score >= 3:
-            reasons.append("popular na comunidade")
-
-        # 5. Decaimento Temporal (Boost de Frescura vs Obras Lendárias)
-        age_days = (now - image.data_upload).days if image.data_upload else 30
-        decay = 1.0 / (1.0 + 0.03 * max(0, age_days))
-        score = score * decay
-
-        if age_days <= 5:
-            reasons.append("novidade recente")
-
-        # 6. Multiplicador de Reset Diário (Sufle determinístico diário via hash)
-        hash_val = hashlib.sha256(f"{image.id}-{today_str}".encode()).hexdigest()
-        daily_shuffle = 0.8 + (int(hash_val[:6], 16) % 401) / 1000.0  # Fator entre 0.8 e 1.2
-        score = score * daily_shuffle
-
-        # Adicionar fallback de motivo
-        if not reasons:
-            reasons.append("sugestão ArteNuvem")
-
-        # Manter apenas motivos únicos e limitar a 2 para não encher a UI
-        unique_reasons = []
-        for r in reasons:
-            if r not in unique_reasons:
-                unique_reasons.append(r)
-        reasons_str = " · ".join(unique_reasons[:2])
-
-        scored.append((score, image, reasons_str))
-
-    # Ordenar por pontuação (score) decrescente, usando a data como critério de desempate
-    scored.sort(key=lambda item: (item[0], item[1].data_upload or datetime.min), reverse=True)
-
-    if not scored:
-        fallback = (
+        images = (
             Imagem.query.filter(Imagem.publica == True).order_by(Imagem.data_upload.desc())
             .limit(limit)
             .all()
         )
-        scored = [(0, image, "destaque recente") for image in fallback]
+        reasons = {image.id: "destaque recente" for image in images}
 
-    images = [item[1] for item in scored[:limit]]
     return {
         "images": images,
-        "reasons": {item[1].id: item[2] for item in scored[:limit]},
+        "reasons": reasons,
         "favorite_tags": tag_weights.most_common(8),
         "favorite_categories": category_weights.most_common(8),
         "authors": recommend_authors(user, category_weights, tag_weights, limit=6),
@@ -201,23 +411,148 @@ def build_recommendations(user=None, limit=12):
     }
 
 
+# O algoritmo original só considerava até 100 imagens por autor
+AUTHOR_MAX_IMAGES = 100
+
+
+class _AuthorFeatureTable:
+    """
+    Tabela de features por autor (nº de imagens e histogramas de categorias e
+    tags), calculada com um único GROUP BY e guardada como matriz esparsa
+    autor x feature. É invalidada quando uma imagem é publicada ou apagada e
+    expira ao fim de `ttl` segundos (as invalidações são locais a cada worker).
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._table = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._table = None
+
+    def get(self):
+        with self._lock:
+            if self._table is not None and self._expires_at > time.monotonic():
+                return self._table
+        table = self._build()
+        with self._lock:
+            self._table = table
+            self._expires_at = time.monotonic() + self.ttl
+        return table
+
+    @staticmethod
+    def _build():
+        rows = (
+            db.session.query(
+                Imagem.id_utilizador, Imagem.id_categoria, Imagem.tags, func.count(Imagem.id)
+            )
+            .group_by(Imagem.id_utilizador, Imagem.id_categoria, Imagem.tags)
+            .all()
+        )
+        author_pos = {}
+        category_features = {}
+        tag_features = {}
+        category_histogram = Counter()
+        tag_histogram = Counter()
+        image_counts = Counter()
+        for author_id, category_id, tags, total in rows:
+            pos = author_pos.setdefault(author_id, len(author_pos))
+            image_counts[pos] += total
+            if category_id is not None:
+                category_histogram[pos, category_features.setdefault(category_id, len(category_features))] += total
+            for tag in split_tags(tags):
+                tag_histogram[pos, tag_features.setdefault(tag, len(tag_features))] += total
+
+        n_authors = len(author_pos)
+        n_categories = len(category_features)
+        counts = np.zeros(n_authors, dtype=np.float64)
+        for pos, total in image_counts.items():
+            counts[pos] = total
+        # Com mais de AUTHOR_MAX_IMAGES imagens, os histogramas são escalados para o
+        # valor esperado de uma amostra de AUTHOR_MAX_IMAGES imagens
+        scale = np.minimum(1.0, AUTHOR_MAX_IMAGES / np.maximum(counts, 1.0))
+
+        # Colunas: primeiro as categorias, depois as tags
+        cells = [(pos, col, total) for (pos, col), total in category_histogram.items()]
+        cells += [(pos, n_categories + col, total) for (pos, col), total in tag_histogram.items()]
+        row_idx = np.fromiter((cell[0] for cell in cells), dtype=np.int64, count=len(cells))
+        col_idx = np.fromiter((cell[1] for cell in cells), dtype=np.int64, count=len(cells))
+        values = np.fromiter((cell[2] for cell in cells), dtype=np.float64, count=len(cells))
+        features = sparse.csr_matrix(
+            (values * scale[row_idx], (row_idx, col_idx)),
+            shape=(n_authors, n_categories + len(tag_features)),
+        )
+        return {
+            "author_ids": np.fromiter(author_pos, dtype=np.int64, count=n_authors),
+            "image_counts": np.minimum(counts, AUTHOR_MAX_IMAGES).astype(np.int64),
+            "features": features,
+            "categories": category_features,
+            "tags": tag_features,
+        }
+
+
+author_features = _AuthorFeatureTable(ttl=int(os.getenv("AUTHOR_FEATURES_TTL", "600")))
+
+
+def invalidate_author_features():
+    """Deve ser chamado depois de publicar, apagar ou recategorizar imagens."""
+    author_features.invalidate()
+
+
 def recommend_authors(user, category_weights=None, tag_weights=None, limit=6):
     category_weights = category_weights or Counter()
     tag_weights = tag_weights or Counter()
 
-    users = Utilizador.query.order_by(Utilizador.nome).all()
+    table = author_features.get()
+    author_ids = table["author_ids"]
+    if not len(author_ids):
+        return []
+
+    # Pontuação = nº de imagens + produto esparso histograma x pesos do utilizador
+    n_categories = len(table["categories"])
+    weights = np.zeros(table["features"].shape[1], dtype=np.float64)
+    for category_id, weight in category_weights.items():
+        pos = table["categories"].get(category_id)
+        if pos is not None:
+            weights[pos] = weight
+    for tag, weight in tag_weights.items():
+        pos = table["tags"].get(tag)
+        if pos is not None:
+            weights[n_categories + pos] = weight
+    image_counts = table["image_counts"]
+    scores = image_counts + table["features"] @ weights
+
+    eligible = np.ones(len(author_ids), dtype=bool)
+    if user:
+        eligible &= author_ids != user.id
+    candidates = np.flatnonzero(eligible)
+    if not len(candidates):
+        return []
+
+    # Só os empates na fronteira do top-k precisam do nome para desempatar
+    order = candidates[np.lexsort((image_counts[candidates], scores[candidates]))[::-1]]
+    cutoff = order[min(limit, len(order)) - 1]
+    boundary = (scores[order] > scores[cutoff]) | (
+        (scores[order] == scores[cutoff]) & (image_counts[order] >= image_counts[cutoff])
+    )
+    shortlist = order[boundary]
+
+    users = {
+        candidate.id: candidate
+        for candidate in Utilizador.query.filter(
+            Utilizador.id.in_(author_ids[shortlist].tolist())
+        ).all()
+    }
     results = []
-    for candidate in users:
-        if user and candidate.id == user.id:
-            continue
-        images = Imagem.query.filter_by(id_utilizador=candidate.id).limit(100).all()
-        if not images:
+    for pos in shortlist.tolist():
+        candidate = users.get(int(author_ids[pos]))
+        if candidate is None:
             continue
-        score = len(images)
-        for image in images:
-            score += category_weights.get(image.id_categoria, 0)
-            score += sum(tag_weights.get(tag, 0) for tag in split_tags(image.tags))
-        results.append((score, candidate, len(images)))
+        score = float(scores[pos])
+        results.append((int(score) if score.is_integer() else score, candidate, int(image_counts[pos])))
 
     results.sort(key=lambda item: (item[0], item[2], item[1].nome or ""), reverse=True)
     return results[:limit]
@@ -0,0 +1,236 @@
+"""
+Snapshots materializados das recomendações.
+
+O agendador pré-calcula o top-N de cada utilizador (e a lista anónima) na tabela
+recommendation_snapshot. Os pedidos leem o snapshot com uma única consulta por
+chave primária e só calculam as recomendações em direto quando o snapshot falta,
+expirou ou foi marcado como desatualizado por uma nova interação do utilizador.
+
+Cada worker do gunicorn corre a mesma tarefa do agendador; antes de recalcular um
+snapshot o worker reserva-o (_claim_snapshot), por isso cada utilizador é
+recalculado por um só processo em cada ronda.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import Exposicao, Imagem, RecommendationSnapshot, Utilizador, db
+from services.recommendation_service import build_recommendations, invalidate_interaction_profile
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SIZE = 24
+SNAPSHOT_TTL = int(os.getenv("RECOMMENDATION_SNAPSHOT_TTL", "3600"))
+SNAPSHOT_REFRESH_INTERVAL = int(os.getenv("RECOMMENDATION_SNAPSHOT_INTERVAL", "300"))
+SNAPSHOT_REFRESH_BATCH = int(os.getenv("RECOMMENDATION_SNAPSHOT_BATCH", "200"))
+# Um snapshot reservado há menos do que isto está a ser recalculado por outro worker
+SNAPSHOT_CLAIM_WINDOW = 60
+ANONYMOUS_KEY = 0
+
+
+def _snapshot_key(user):
+    return user.id if user else ANONYMOUS_KEY
+
+
+def _dump_payload(payload):
+    return json.dumps({
+        "images": [image.id for image in payload["images"]],
+        "reasons": [[image_id, reason] for image_id, reason in payload["reasons"].items()],
+        "favorite_tags": payload["favorite_tags"],
+        "favorite_categories": payload["favorite_categories"],
+        "authors": [[score, author.id, total] for score, author, total in payload["authors"]],
+        "expositions": [[score, exposition.id] for score, exposition in payload["expositions"]],
+    })
+
+
+def _by_id(model, ids):
+    if not ids:
+        return {}
+    return {obj.id: obj for obj in model.query.filter(model.id.in_(ids)).all()}
+
+
+def _load_payload(raw, limit):
+    """Reconstrói o payload de build_recommendations a partir do JSON guardado."""
+    data = json.loads(raw)
+    image_ids = data["images"][:limit]
+    images = _by_id(Imagem, image_ids)
+    authors = _by_id(Utilizador, [author_id for _, author_id, _ in data["authors"]])
+    expositions = _by_id(Exposicao, [exposition_id for _, exposition_id in data["expositions"]])
+    return {
+        # Obras apagadas ou tornadas privadas desde o cálculo são ignoradas
+        "images": [images[i] for i in image_ids if i in images and images[i].publica],
+        "reasons": {image_id: reason for image_id, reason in data["reasons"] if image_id in image_ids},
+        "favorite_tags": [tuple(item) for item in data["favorite_tags"]],
+        "favorite_categories": [tuple(item) for item in data["favorite_categories"]],
+        "authors": [
+            (score, authors[author_id], total)
+            for score, author_id, total in data["authors"]
+            if author_id in authors
+        ],
+        "expositions": [
+            (score, expositions[exposition_id])
+            for score, exposition_id in data["expositions"]
+            if exposition_id in expositions
+        ],
+    }
+
+
+def _truncate(payload, limit):
+    images = payload["images"][:limit]
+    kept = {image.id for image in images}
+    return dict(
+        payload,
+        images=images,
+        reasons={image_id: reason for image_id, reason in payload["reasons"].items() if image_id in kept},
+    )
+
+
+def _save_snapshot(key, raw):
+    """
+    Grava o snapshot numa ligação própria: um commit na sessão expiraria os objetos
+    do pedido em curso (incluindo as imagens que vão ser mostradas).
+    """
+    table = RecommendationSnapshot.__table__
+    values = {"Payload": raw, "ComputedAt": datetime.utcnow(), "IsStale": False}
+    with db.engine.begin() as conn:
+        updated = conn.execute(table.update().where(table.c.UserID == key).values(**values))
+        if not updated.rowcount:
+            conn.execute(table.insert().values(UserID=key, **values))
+
+
+def _claim_snapshot(key, seen_computed_at):
+    """
+    Reserva o snapshot `key` para este processo: só quem altera ComputedAt a partir
+    do valor que leu (ou insere a linha, se ainda não existia) o recalcula. Fica
+    marcado como desatualizado até o novo payload ser gravado, por isso se o
+    recálculo falhar volta a ser escolhido depois de SNAPSHOT_CLAIM_WINDOW.
+    """
+    table = RecommendationSnapshot.__table__
+    values = {"ComputedAt": datetime.utcnow(), "IsStale": True}
+    try:
+        with db.engine.begin() as conn:
+            if seen_computed_at is None:
+                conn.execute(table.insert().values(UserID=key, Payload="{}", **values))
+                return True
+            claimed = conn.execute(
+                table.update()
+                .where(table.c.UserID == key, table.c.ComputedAt == seen_computed_at)
+                .values(**values)
+            )
+            return claimed.rowcount == 1
+    except IntegrityError:
+        return False
+
+
+def refresh_snapshot(user=None, reload_profile=False):
+    """
+    Calcula o top-N do utilizador (ou anónimo), grava o snapshot e devolve o payload.
+    reload_profile=True relê o perfil da base de dados em vez da cache deste
+    processo: usa-se quando o snapshot foi marcado desatualizado, porque a
+    interação pode ter sido tratada noutro worker (que só invalidou a cache dele).
+    Um snapshot que apenas expirou reutiliza o perfil em cache.
+    """
+    if user and reload_profile:
+        invalidate_interaction_profile(user.id)
+    payload = build_recommendations(user, limit=SNAPSHOT_SIZE)
+    key = _snapshot_key(user)
+    try:
+        _save_snapshot(key, _dump_payload(payload))
+    except Exception as e:
+        logger.warning("Falha ao gravar snapshot de recomendações (%s): %s", key, e)
+    return payload
+
+
+def get_recommendations(user=None, limit=12):
+    """
+    Substituto de build_recommendations para os pedidos: lê o snapshot quando está
+    fresco e, caso contrário, calcula em direto e atualiza o snapshot.
+    """
+    if limit > SNAPSHOT_SIZE:
+        return build_recommendations(user, limit=limit)
+
+    snapshot = db.session.get(RecommendationSnapshot, _snapshot_key(user))
+    if (
+        snapshot is not None
+        and not snapshot.is_stale
+        and snapshot.computed_at >= datetime.utcnow() - timedelta(seconds=SNAPSHOT_TTL)
+    ):
+        try:
+            return _load_payload(snapshot.payload, limit)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Snapshot de recomendações inválido (%s): %s", snapshot.id_utilizador, e)
+
+    return _truncate(refresh_snapshot(user, reload_profile=snapshot is not None and snapshot.is_stale), limit)
+
+
+def mark_snapshot_stale(user_id):
+    """Deve ser chamado depois de o utilizador criar ou remover uma Reacao/Comentario."""
+    if not user_id:
+        return
+    table = RecommendationSnapshot.__table__
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.UserID == user_id).values(IsStale=True))
+    except Exception as e:
+        logger.warning("Falha ao marcar snapshot de recomendações %s: %s", user_id, e)
+
+
+def refresh_stale_snapshots(batch_size=SNAPSHOT_REFRESH_BATCH):
+    """
+    Tarefa do agendador: atualiza a lista anónima e até batch_size utilizadores,
+    começando pelos snapshots desatualizados/expirados (utilizadores ativos) e só
+    depois pelos utilizadores que ainda não têm snapshot.
+    """
+    now = datetime.utcnow()
+    expired_before = now - timedelta(seconds=SNAPSHOT_TTL)
+    claimed_before = now - timedelta(seconds=SNAPSHOT_CLAIM_WINDOW)
+    needs_refresh = or_(
+        and_(RecommendationSnapshot.is_stale == True, RecommendationSnapshot.computed_at < claimed_before),
+        RecommendationSnapshot.computed_at < expired_before,
+    )
+
+    anonymous = db.session.get(RecommendationSnapshot, ANONYMOUS_KEY)
+    if anonymous is None:
+        if _claim_snapshot(ANONYMOUS_KEY, None):
+            refresh_snapshot(None)
+    elif (anonymous.is_stale and anonymous.computed_at < claimed_before) or anonymous.computed_at < expired_before:
+        if _claim_snapshot(ANONYMOUS_KEY, anonymous.computed_at):
+            refresh_snapshot(None)
+
+    candidates = [
+        (row.id_utilizador, row.computed_at, row.is_stale)
+        for row in RecommendationSnapshot.query.with_entities(
+            RecommendationSnapshot.id_utilizador, RecommendationSnapshot.computed_at, RecommendationSnapshot.is_stale
+        )
+        .filter(RecommendationSnapshot.id_utilizador != ANONYMOUS_KEY)
+        .filter(needs_refresh)
+        .order_by(RecommendationSnapshot.computed_at)
+        .limit(batch_size)
+        .all()
+    ]
+    if len(candidates) < batch_size:
+        candidates += [
+            (row.id, None, False)
+            for row in Utilizador.query.with_entities(Utilizador.id)
+            .outerjoin(RecommendationSnapshot, RecommendationSnapshot.id_utilizador == Utilizador.id)
+            .filter(RecommendationSnapshot.id_utilizador.is_(None))
+            .order_by(Utilizador.id)
+            .limit(batch_size - len(candidates))
+            .all()
+        ]
+
+    users = _by_id(Utilizador, [user_id for user_id, _, _ in candidates])
+    refreshed = 0
+    for user_id, seen_computed_at, is_stale in candidates:
+        user = users.get(user_id)
+        if user is None or not _claim_snapshot(user_id, seen_computed_at):
+            continue
+        refresh_snapshot(user, reload_profile=is_stale)
+        refreshed += 1
+    if refreshed:
+        logger.info("Snapshots de recomendações atualizados: %d utilizadores.", refreshed)
+    return refreshed
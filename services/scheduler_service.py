@@ -0,0 +1,69 @@
+"""
+Agendador de tarefas periódicas em background (uma thread por processo).
+
+As tarefas são registadas com add_job() e correm dentro de um app_context;
+um intervalo <= 0 desativa a tarefa. SCHEDULER_ENABLED=0 desativa o agendador
+(ex.: para correr as tarefas apenas num worker dedicado).
+"""
+import logging
+import os
+import threading
+import time
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") != "0"
+SCHEDULER_TICK = 5
+
+
+class Scheduler:
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def add_job(self, name, func, interval):
+        """Regista func() para correr a cada `interval` segundos (a primeira vez após um intervalo)."""
+        if interval <= 0:
+            return
+        with self._lock:
+            self._jobs[name] = {"func": func, "interval": interval, "next_run": time.monotonic() + interval}
+
+    def start(self, app):
+        """Arranca a thread do agendador uma única vez por processo."""
+        if not SCHEDULER_ENABLED:
+            return
+        with self._lock:
+            if self._started or not self._jobs:
+                return
+            thread = threading.Thread(target=self._loop, args=(app,), daemon=True, name="scheduler")
+            thread.start()
+            self._started = True
+
+    def _due_jobs(self):
+        now = time.monotonic()
+        with self._lock:
+            due = []
+            for name, job in self._jobs.items():
+                if job["next_run"] <= now:
+                    job["next_run"] = now + job["interval"]
+                    due.append((name, job["func"]))
+            return due
+
+    def _loop(self, app):
+        while True:
+            for name, func in self._due_jobs():
+                started = time.perf_counter()
+                with app.app_context():
+                    try:
+                        func()
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.exception("Erro na tarefa agendada %s: %s", name, e)
+                logger.debug("Tarefa agendada %s terminou em %.2fs.", name, time.perf_counter() - started)
+            time.sleep(SCHEDULER_TICK)
+
+
+scheduler = Scheduler()
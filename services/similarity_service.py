@@ -0,0 +1,274 @@
+"""
+Índice de semelhança de conteúdo ("obras semelhantes").
+
+Cada imagem pública é vetorizada a partir do título, descrição e tags com um
+HashingVectorizer (sem vocabulário, por isso uma imagem nova não obriga a
+revetorizar as restantes) e ponderada por TF-IDF. A pesquisa usa um
+NearestNeighbors de cosseno mantido em memória, atualizado incrementalmente
+quando uma imagem é publicada ou apagada. Reconstruir e recalcular o índice é
+trabalho da thread de manutenção, nunca dos pedidos: uma pesquisa só lê a última
+versão pronta (as obras entretanto apagadas são filtradas em similar_images).
+"""
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import normalize
+
+from models import Imagem, db
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_FEATURES = 2 ** 18
+SIMILARITY_REBUILD_INTERVAL = int(os.getenv("SIMILARITY_REBUILD_INTERVAL", "900"))
+SIMILAR_WORKS_LIMIT = 6
+
+_WORD_RE = re.compile(r"\w{2,}", re.UNICODE)
+
+
+def _document_tokens(doc):
+    """Palavras do título/descrição e tags (com prefixo, para pesarem à parte)."""
+    titulo, descricao, tags = doc
+    text = f"{titulo or ''} {descricao or ''}".lower()
+    tokens = _WORD_RE.findall(text)
+    for tag in (tags or "").split(","):
+        tag = tag.strip().lower()
+        if tag:
+            tokens.append(f"#{tag}")
+    return tokens
+
+
+_vectorizer = HashingVectorizer(
+    analyzer=_document_tokens,
+    n_features=SIMILARITY_FEATURES,
+    alternate_sign=False,
+    norm=None,
+)
+
+
+def _image_document(img):
+    return (img.titulo, img.descricao, img.tags)
+
+
+class _FittedIndex:
+    """Matriz TF-IDF e NearestNeighbors prontos a pesquisar; nunca é alterado depois de criado."""
+
+    def __init__(self, ids, counts, doc_freq):
+        self.ids = ids
+        self.positions = {int(image_id): pos for pos, image_id in enumerate(ids)}
+        n_docs = len(ids)
+        self.idf = np.log((1.0 + n_docs) / (1.0 + doc_freq)) + 1.0
+        self.nn = None
+        if n_docs == 0:
+            self.matrix = counts
+            return
+        tf = counts.copy()
+        tf.data = 1.0 + np.log(tf.data)
+        self.matrix = normalize(tf.multiply(self.idf).tocsr())
+        self.nn = NearestNeighbors(metric="cosine", algorithm="brute").fit(self.matrix)
+
+
+class SimilarityIndex:
+    """
+    Guarda as contagens de termos por imagem (CSR) e as frequências de documento,
+    para que publicar/apagar uma imagem só vetorize essa imagem. A reconstrução
+    completa e o recálculo da matriz TF-IDF correm numa thread própria (start);
+    as pesquisas usam o último índice calculado, sem esperar nem bloquear.
+    """
+
+    def __init__(self, rebuild_interval=SIMILARITY_REBUILD_INTERVAL):
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._positions = {}
+        self._counts = sparse.csr_matrix((0, SIMILARITY_FEATURES), dtype=np.float64)
+        self._doc_freq = np.zeros(SIMILARITY_FEATURES, dtype=np.int64)
+        self._loaded = False
+        self._dirty = False
+        # Alterações feitas durante uma reconstrução, reaplicadas sobre o resultado
+        self._pending = None
+        self._fitted = None
+        self._app = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    # ---------------- thread de manutenção ----------------
+    def start(self, app):
+        """Arranca a thread que constrói o índice e o mantém atualizado (uma vez por processo)."""
+        if self._app is not None:
+            return
+        self._app = app
+        threading.Thread(target=self._loop, daemon=True, name="similarity-index").start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def _loop(self):
+        next_rebuild = time.monotonic()
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() >= next_rebuild:
+                    # A reconstrução periódica apanha alterações feitas por outros workers
+                    with self._app.app_context():
+                        self.rebuild()
+                    next_rebuild = time.monotonic() + self.rebuild_interval if self.rebuild_interval > 0 else float("inf")
+                elif self._dirty:
+                    self.refit()
+            except Exception as e:
+                logger.exception("Erro ao atualizar o índice de semelhança: %s", e)
+                next_rebuild = time.monotonic() + 60
+            self._wake.wait(max(0.0, min(next_rebuild - time.monotonic(), 60)))
+            self._wake.clear()
+
+    # ---------------- construção ----------------
+    def rebuild(self):
+        """Reconstrói o índice a partir de todas as imagens públicas (uma só query)."""
+        started = time.perf_counter()
+        with self._lock:
+            self._pending = []
+        try:
+            rows = (
+                db.session.query(Imagem.id, Imagem.titulo, Imagem.descricao, Imagem.tags)
+                .filter(Imagem.publica == True)
+                .order_by(Imagem.id)
+                .all()
+            )
+            ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+            if rows:
+                counts = _vectorizer.transform([(row.titulo, row.descricao, row.tags) for row in rows]).tocsr()
+            else:
+                counts = sparse.csr_matrix((0, SIMILARITY_FEATURES), dtype=np.float64)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._ids = ids
+            self._positions = {int(image_id): pos for pos, image_id in enumerate(ids)}
+            self._counts = counts
+            self._doc_freq = np.bincount(counts.indices, minlength=SIMILARITY_FEATURES)
+            for image_id, row in self._pending:
+                self._remove_locked(image_id)
+                if row is not None:
+                    self._append_locked(image_id, row)
+            self._pending = None
+            self._loaded = True
+            self._dirty = True
+        self.refit()
+        logger.info(
+            "Índice de semelhança reconstruído: %d imagens em %.2fs.",
+            len(ids), time.perf_counter() - started,
+        )
+
+    def refit(self):
+        """Recalcula a matriz TF-IDF fora do lock e troca-a pela que as pesquisas usam."""
+        with self._lock:
+            ids, counts, doc_freq = self._ids, self._counts, self._doc_freq.copy()
+            self._dirty = False
+        self._fitted = _FittedIndex(ids, counts, doc_freq)
+
+    # ---------------- atualizações incrementais ----------------
+    def add_image(self, img):
+        """Acrescenta (ou substitui) uma imagem publicada sem reler a tabela imagem."""
+        if not img.publica:
+            self.remove_image(img.id)
+            return
+        row = _vectorizer.transform([_image_document(img)]).tocsr()
+        self._apply(int(img.id), row)
+
+    def remove_image(self, image_id):
+        self._apply(int(image_id), None)
+
+    def _apply(self, image_id, row):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((image_id, row))
+            if not self._loaded:
+                return
+            self._remove_locked(image_id)
+            if row is not None:
+                self._append_locked(image_id, row)
+            self._dirty = True
+        self._wake.set()
+
+    def _append_locked(self, image_id, row):
+        self._positions[image_id] = len(self._ids)
+        self._ids = np.append(self._ids, np.int64(image_id))
+        self._counts = sparse.vstack([self._counts, row], format="csr")
+        np.add.at(self._doc_freq, row.indices, 1)
+
+    def _remove_locked(self, image_id):
+        pos = self._positions.pop(int(image_id), None)
+        if pos is None:
+            return
+        row = self._counts[pos]
+        np.subtract.at(self._doc_freq, row.indices, 1)
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[pos] = False
+        self._ids = self._ids[keep]
+        self._counts = self._counts[keep]
+        self._positions = {int(image_id): p for p, image_id in enumerate(self._ids)}
+
+    # ---------------- pesquisa ----------------
+    def similar_to(self, img, limit=SIMILAR_WORKS_LIMIT):
+        """
+        Devolve [(id_imagem, semelhanca), ...] das obras mais parecidas com img.
+        Imagens fora do índice (ex.: privadas) são vetorizadas no momento. Enquanto
+        o primeiro índice não estiver pronto devolve uma lista vazia.
+        """
+        fitted = self._fitted
+        if fitted is None or fitted.nn is None:
+            return []
+        pos = fitted.positions.get(int(img.id))
+        if pos is not None:
+            query = fitted.matrix[pos]
+        else:
+            tf = _vectorizer.transform([_image_document(img)]).tocsr()
+            if not tf.nnz:
+                return []
+            tf.data = 1.0 + np.log(tf.data)
+            query = normalize(tf.multiply(fitted.idf).tocsr())
+        n_neighbors = min(limit + 1, len(fitted.ids))
+        distances, positions = fitted.nn.kneighbors(query, n_neighbors=n_neighbors)
+        ids = fitted.ids[positions[0]]
+
+        results = []
+        for image_id, distance in zip(ids.tolist(), distances[0].tolist()):
+            similarity = 1.0 - distance
+            if image_id == img.id or similarity <= 0.0:
+                continue
+            results.append((image_id, round(similarity, 4)))
+            if len(results) >= limit:
+                break
+        return results
+
+
+similarity_index = SimilarityIndex()
+
+
+def similar_images(img, limit=SIMILAR_WORKS_LIMIT):
+    """Carrega as obras semelhantes (objetos Imagem) pela ordem de semelhança."""
+    try:
+        matches = similarity_index.similar_to(img, limit)
+    except Exception as e:
+        logger.exception("Erro ao pesquisar obras semelhantes: %s", e)
+        return []
+    if not matches:
+        return []
+    by_id = {
+        image.id: image
+        for image in Imagem.query.filter(
+            Imagem.id.in_([image_id for image_id, _ in matches]),
+            Imagem.publica == True,
+        ).all()
+    }
+    return [(by_id[image_id], score) for image_id, score in matches if image_id in by_id]
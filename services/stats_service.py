@@ -0,0 +1,125 @@
+"""
+Cache partilhada das estatísticas globais da plataforma (totais de utilizadores,
+imagens públicas, likes, comentários, categorias e exposições ativas).
+
+Os totais são lidos com uma única consulta e atualizados periodicamente pelo
+agendador. Entre atualizações, as inserções/remoções feitas através do ORM são
+aplicadas de forma incremental, mas só depois do commit da transação. As
+remoções em massa (Query.delete) não passam pelos eventos do ORM e ficam
+corrigidas na atualização periódica seguinte.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from models import Categoria, Comentario, Exposicao, Imagem, Reacao, Utilizador, db
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_STATS_REFRESH_INTERVAL = int(os.getenv("GLOBAL_STATS_REFRESH_INTERVAL", "600"))
+
+_PENDING_KEY = "global_stats_deltas"
+
+
+def _count(model, *criteria):
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+
+class GlobalStats:
+    def __init__(self, max_age=GLOBAL_STATS_REFRESH_INTERVAL):
+        self.max_age = max_age
+        self._values = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        row = db.session.execute(
+            select(
+                _count(Utilizador).label("utilizadores"),
+                _count(Imagem, Imagem.publica == True).label("imagens_publicas"),
+                _count(Reacao, Reacao.tipo == "like").label("likes"),
+                _count(Comentario).label("comentarios"),
+                _count(Categoria).label("categorias"),
+                _count(Exposicao, Exposicao.ativo == True).label("exposicoes_ativas"),
+            )
+        ).one()
+        with self._lock:
+            self._values = dict(row._mapping)
+            self._loaded_at = time.monotonic()
+        return dict(self._values)
+
+    def get(self):
+        """Devolve uma cópia dos totais, recarregando-os se nunca foram lidos ou estão velhos."""
+        with self._lock:
+            fresh = self._values is not None and (
+                self.max_age <= 0 or time.monotonic() - self._loaded_at < self.max_age
+            )
+            if fresh:
+                return dict(self._values)
+        return self.refresh()
+
+    def apply(self, deltas):
+        with self._lock:
+            if self._values is None:
+                return
+            for key, delta in deltas.items():
+                self._values[key] = max(0, self._values.get(key, 0) + delta)
+
+    def media_curtidas(self):
+        """Média global de likes por imagem pública (referência de popularidade do recomendador)."""
+        values = self.get()
+        return values["likes"] / max(1, values["imagens_publicas"])
+
+
+global_stats = GlobalStats()
+
+
+def _stat_key(target):
+    if isinstance(target, Utilizador):
+        return "utilizadores"
+    if isinstance(target, Imagem):
+        return "imagens_publicas" if target.publica else None
+    if isinstance(target, Reacao):
+        return "likes" if target.tipo == "like" else None
+    if isinstance(target, Comentario):
+        return "comentarios"
+    if isinstance(target, Categoria):
+        return "categorias"
+    if isinstance(target, Exposicao):
+        return "exposicoes_ativas" if target.ativo else None
+    return None
+
+
+def _record(session, instances, delta):
+    for target in instances:
+        key = _stat_key(target)
+        if key:
+            session.info.setdefault(_PENDING_KEY, Counter())[key] += delta
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    _record(session, session.new, 1)
+    _record(session, session.deleted, -1)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session):
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        global_stats.apply(deltas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def refresh_global_stats():
+    """Tarefa do agendador."""
+    global_stats.refresh()
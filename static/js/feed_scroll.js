@@ -0,0 +1,82 @@
+document.addEventListener("DOMContentLoaded", function () {
+  const sentinel = document.getElementById("feedSentinel");
+  if (!sentinel || !("IntersectionObserver" in window)) return;
+
+  const feedUrl = sentinel.getAttribute("data-feed-url");
+  const defaultAvatar = sentinel.getAttribute("data-default-avatar");
+  let nextCursor = sentinel.getAttribute("data-next-cursor");
+  let loading = false;
+
+  function escapeHtml(value) {
+    const div = document.createElement("div");
+    div.textContent = value == null ? "" : String(value);
+    return div.innerHTML;
+  }
+
+  function renderCard(img) {
+    const autorNome = (img.autor && img.autor.nome ? img.autor.nome : "").split(" ")[0];
+    const autorFoto = (img.autor && img.autor.foto_url) || defaultAvatar;
+    const categoria = img.categoria
+      ? `<span class="text-[9px] font-extrabold uppercase px-2 py-0.5 rounded-full bg-brand-accent/20 border border-brand-accent/30 text-brand-secondary">${escapeHtml(img.categoria)}</span>`
+      : "";
+    const cidade = img.cidade
+      ? `<span class="flex items-center gap-0.5 text-[10px] text-gray-300 font-medium">
+           <i data-lucide="map-pin" class="w-3 h-3 text-brand-secondary"></i>
+           <span class="truncate max-w-[80px]">${escapeHtml(img.cidade)}</span>
+         </span>`
+      : "";
+
+    const item = document.createElement("div");
+    item.className = "masonry-item";
+    item.innerHTML = `
+      <div class="cinematic-card group relative">
+        <a href="/imagem/${img.id}" class="block">
+          <div class="cinematic-img-container">
+            <img src="${escapeHtml(img.url)}" alt="${escapeHtml(img.titulo)}" class="cinematic-img w-full rounded-2xl object-cover" loading="lazy">
+            <div class="cinematic-overlay rounded-2xl">
+              <div class="flex flex-wrap gap-1 mb-2">${categoria}</div>
+              <h3 class="text-sm font-bold text-white tracking-wide truncate mb-3 leading-tight">${escapeHtml(img.titulo)}</h3>
+              <div class="flex items-center justify-between border-t border-white/10 pt-2.5">
+                <div class="flex items-center gap-1.5 min-w-0">
+                  <img src="${escapeHtml(autorFoto)}" class="w-5.5 h-5.5 rounded-full object-cover border border-white/20">
+                  <span class="text-xs font-semibold text-gray-200 truncate max-w-[110px]">${escapeHtml(autorNome)}</span>
+                </div>
+                ${cidade}
+              </div>
+            </div>
+          </div>
+        </a>
+      </div>`;
+    return item;
+  }
+
+  function loadMore() {
+    if (loading || !nextCursor) return;
+    const grid = document.querySelector("[data-feed-grid] .contents");
+    if (!grid) return;
+    loading = true;
+
+    const separator = feedUrl.includes("?") ? "&" : "?";
+    fetch(`${feedUrl}${separator}cursor=${encodeURIComponent(nextCursor)}`, {
+      headers: { "Accept": "application/json" },
+      credentials: "same-origin"
+    })
+      .then(r => r.json())
+      .then(data => {
+        (data.imagens || []).forEach(img => grid.appendChild(renderCard(img)));
+        nextCursor = data.next_cursor;
+        if (!nextCursor) {
+          observer.disconnect();
+          sentinel.remove();
+        }
+        if (window.lucide) lucide.createIcons();
+      })
+      .catch(err => console.error("Erro ao carregar mais obras:", err))
+      .finally(() => { loading = false; });
+  }
+
+  const observer = new IntersectionObserver(entries => {
+    if (entries.some(entry => entry.isIntersecting)) loadMore();
+  }, { rootMargin: "600px" });
+  observer.observe(sentinel);
+});